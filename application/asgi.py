@@ -12,5 +12,26 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'application.settings')
+os.environ.setdefault('MUSICSHOP_ASYNC_VIEWS', '1')
+os.environ.setdefault('MUSICSHOP_LIVE_NOTIFICATIONS', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from musicshop import catalog  # noqa: E402
+from musicshop.notifications import NotificationStream  # noqa: E402
+
+notification_stream = NotificationStream()
+notification_stream_path = reverse('notification_stream')
+
+if settings.CATALOG_SNAPSHOT:
+    # Снимок каталога собираем до первого запроса
+    catalog.load()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == notification_stream_path:
+        return await notification_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'musicshop.middleware.PerformanceMiddleware',
+    'musicshop.middleware.ProfilingMiddleware',
+    'musicshop.middleware.ReplicaPinningMiddleware',
+    'musicshop.middleware.SharedCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,24 +61,92 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'application.urls'
 
-TEMPLATES = [
-    {
+SHOP_CONTEXT_PROCESSORS = [
+    'django.template.context_processors.request',
+    'django.contrib.auth.context_processors.auth',
+    'django.contrib.messages.context_processors.messages',
+    'musicshop.context_processors.shop',
+]
+
+TEMPLATE_PROFILES = {
+    'debug': {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
-            'context_processors': [
-                'django.template.context_processors.debug',
-                'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
+            'context_processors': ['django.template.context_processors.debug'] + SHOP_CONTEXT_PROCESSORS,
+            # Без кэширующего загрузчика: правки шаблонов видны сразу
+            'debug': True,
+        },
+    },
+    # Шаблоны компилируются один раз на процесс, правки подхватываются только после перезапуска
+    'production': {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'OPTIONS': {
+            'context_processors': SHOP_CONTEXT_PROCESSORS,
+            'debug': False,
+            'loaders': [
+                ('django.template.loaders.cached.Loader', ['django.template.loaders.app_directories.Loader']),
             ],
         },
     },
-]
+}
+
+TEMPLATES = [TEMPLATE_PROFILES[os.environ.get('MUSICSHOP_TEMPLATE_PROFILE', 'debug' if DEBUG else 'production')]]
 
 WSGI_APPLICATION = 'application.wsgi.application'
 
+# Async-варианты представлений каталога и корзины, включает application/asgi.py
+ASYNC_CATALOG_VIEWS = os.environ.get('MUSICSHOP_ASYNC_VIEWS') == '1'
+
+# Уведомления в реальном времени через server-sent events, их отдаёт только ASGI-приложение
+LIVE_NOTIFICATIONS = os.environ.get('MUSICSHOP_LIVE_NOTIFICATIONS') == '1'
+
+# Уведомления из run_jobs, админки и импорта доходят до ASGI-процесса через базу;
+# LocalBroker доставляет только события своего процесса
+NOTIFICATION_BROKER = 'musicshop.notifications.DatabaseBroker'
+
+# Как часто DatabaseBroker проверяет новые уведомления, секунды
+NOTIFICATION_POLL_SECONDS = 1
+
+# Пауза между keepalive-комментариями потока уведомлений, секунды
+NOTIFICATION_STREAM_KEEPALIVE = 15
+
+# Страницы каталога без данных покупателя, которые может кэшировать обратный прокси;
+# шапку, число товаров в корзине и кнопки альбомов страница загружает с personal/
+SHARED_CACHE_PAGES = os.environ.get('MUSICSHOP_SHARED_CACHE') == '1'
+
+# Сколько секунд прокси хранит общую страницу (s-maxage)
+SHARED_CACHE_MAX_AGE = 60
+
+# Снимок каталога в памяти каждого процесса (musicshop.catalog): списки, фасеты и слаги без запросов
+CATALOG_SNAPSHOT = os.environ.get('MUSICSHOP_CATALOG_SNAPSHOT') == '1'
+# Как часто процесс проверяет журнал изменений каталога
+CATALOG_SNAPSHOT_REFRESH_SECONDS = 1
+# Альбомов на странице JSON-списка каталога
+CATALOG_PAGE_SIZE = 24
+
+# Фоновые задачи (musicshop.jobs, manage.py run_jobs): попыток до пометки «не выполнена»
+JOB_MAX_ATTEMPTS = 5
+# Пауза перед повтором, секунды: удваивается после каждой неудачи, но не больше JOB_RETRY_MAX_DELAY
+JOB_RETRY_DELAY = 30
+JOB_RETRY_MAX_DELAY = 60 * 60
+# Задачу, которую обработчик держит дольше, считаем брошенной и возвращаем в очередь
+JOB_LOCK_SECONDS = 10 * 60
+
+# Лимиты запросов к маршрутам, которые пишут в базу (musicshop.ratelimit): токенов в секунду и размер корзины
+# токенов на сессию; группы нет в словаре — лимита нет
+RATE_LIMITS = {
+    'cart': {'rate': 2, 'burst': 20},
+    'wishlist': {'rate': 1, 'burst': 10},
+}
+# Общий лимит IP во столько раз шире лимита сессии (за одним IP бывает много покупателей)
+RATE_LIMIT_IP_FACTOR = 10
+# Кэш со счётчиками; locmem по умолчанию считает в каждом процессе отдельно, для нескольких процессов нужен
+# общий кэш (Redis, Memcached)
+RATE_LIMIT_CACHE = 'default'
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
@@ -85,6 +158,21 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения каталога: MUSICSHOP_DB_REPLICAS=путь1,путь2 (локально — копии основной базы,
+# см. manage.py sync_replica); в тестах реплики смотрят в основную базу
+for number, path in enumerate(filter(None, os.environ.get('MUSICSHOP_DB_REPLICAS', '').split(','))):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['musicshop.db_router.PrimaryReplicaRouter']
+
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -104,6 +192,20 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Первым хэшером шифруются новые пароли, остальные только проверяют уже сохранённые хэши
+PASSWORD_HASHERS = [
+    'musicshop.hashers.PBKDF2PasswordHasher',
+    'musicshop.hashers.ScryptPasswordHasher',
+    'musicshop.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+# Параметры стоимости хэшеров по алгоритму, без них — значения Django (замерить: manage.py bench_login), например
+# {'pbkdf2_sha256': {'iterations': 320000}, 'scrypt': {'work_factor': 2 ** 14},
+#  'argon2': {'time_cost': 2, 'memory_cost': 102400, 'parallelism': 8}}
+PASSWORD_HASHER_PARAMS = {}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
@@ -132,12 +234,66 @@ STATICFILES_DIRS = (
     (BASE_DIR / 'static_dev'),
 )
 
+# collectstatic пишет имена с хэшем содержимого и сжатые копии .gz/.br (brotli — если установлен пакет brotli)
+STATICFILES_STORAGE = 'musicshop.files.CompressedManifestStaticFilesStorage'
+
+# Статику и медиа отдаёт само приложение (musicshop.files), если перед ним нет nginx: MUSICSHOP_SERVE_FILES=1
+SERVE_FILES = DEBUG or os.environ.get('MUSICSHOP_SERVE_FILES') == '1'
+
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+STATIC_MAX_AGE = 60 * 60
+
+MEDIA_MAX_AGE = 60 * 60
+
+# Ширины уменьшенных копий изображений галерей для srcset (manage.py make_thumbnails)
+THUMBNAIL_WIDTHS = (320, 640, 1280)
+
+SLIDER_SIZE = 5
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Выполненные заказы старше стольких дней переносятся в архивные таблицы (manage.py archive_orders)
+ORDER_ARCHIVE_AFTER_DAYS = 365
+
 # crispy-bootstrap5
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 
 CRISPY_TEMPLATE_PACK = "bootstrap5"
+
+# Метрики производительности: SQL-запросы дольше PERFORMANCE_SLOW_QUERY_MS пишутся в slow_queries.log
+PERFORMANCE_SLOW_QUERY_MS = 100
+
+# С каких адресов доступен /metrics
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Профилирование доли запросов или запросов с подписанным заголовком сотрудника (manage.py profile_token)
+PROFILING_SAMPLE_RATE = 0
+
+PROFILING_MODE = 'cprofile'  # или 'sampling' — свёрнутые стеки для flame graph
+
+PROFILING_HEADER = 'X-Profile'
+
+PROFILING_DIR = BASE_DIR / 'profiles'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.FileHandler',
+            'filename': BASE_DIR / 'slow_queries.log',
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'musicshop.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
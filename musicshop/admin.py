@@ -1,8 +1,16 @@
-from django.contrib import admin
+import io
+
+from django.contrib import admin, messages
 from django.contrib.contenttypes.admin import GenericTabularInline
 from django.contrib.sessions.models import Session
+from django.http import HttpResponseRedirect
+from django.shortcuts import render
+from django.urls import path
+from django.utils import timezone
 
+from .forms import CatalogImportForm
 from .models import *
+from utils import import_catalog, detect_format
 
 
 class MembersInline(admin.TabularInline):
@@ -17,21 +25,86 @@ class ImageGalleryInline(GenericTabularInline):
 @admin.register(Album)
 class AlbumAdmin(admin.ModelAdmin):
     inlines = [ImageGalleryInline]
+    change_list_template = 'admin/musicshop/album/change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='musicshop_album_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        form = CatalogImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            fmt = form.cleaned_data['format'] or detect_format(upload.name)
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+            try:
+                stats = import_catalog(stream, fmt=fmt, images_dir=form.cleaned_data['images_dir'] or None)
+            except (OSError, ValueError) as exc:
+                messages.error(request, f'Ошибка импорта: {exc}')
+            else:
+                messages.success(
+                    request,
+                    f"Создано альбомов: {stats['created']}, обновлено: {stats['updated']}, "
+                    f"уведомлений: {stats['notifications']}"
+                )
+                return HttpResponseRedirect('../')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Импорт каталога',
+            'form': form,
+        }
+        return render(request, 'admin/musicshop/album/import.html', context)
 
 
 @admin.register(Artist)
 class ArtistAdmin(admin.ModelAdmin):
     inlines = [MembersInline, ImageGalleryInline]
     exclude = ('members',)
+    list_display = ('name', 'genre', 'album_count', 'in_stock_count')
+    list_select_related = ('genre',)
+
+
+@admin.register(Genre)
+class GenreAdmin(admin.ModelAdmin):
+    list_display = ('name', 'artist_count')
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    """Журнал только дополняется: движения нельзя менять и удалять"""
+    list_display = ('id', 'album', 'kind', 'delta', 'order', 'created_at')
+    list_filter = ('kind',)
+    raw_id_fields = ('album', 'order')
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'created_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('attempts', 'locked_at', 'last_error', 'created_at')
+    actions = ('retry',)
+
+    @admin.action(description='Повторить выбранные задачи сейчас')
+    def retry(self, request, queryset):
+        queryset.exclude(status=Job.STATUS_RUNNING).update(status=Job.STATUS_QUEUED, run_at=timezone.now(), attempts=0)
 
 
-admin.site.register(Genre)
 admin.site.register(Member)
 admin.site.register(MediaType)
 admin.site.register(ImageGallery)
 admin.site.register(Cart)
 admin.site.register(CartProduct)
 admin.site.register(Order)
+admin.site.register(ArchivedOrder)
 admin.site.register(Customer)
 admin.site.register(Notification)
 admin.site.register(Session)
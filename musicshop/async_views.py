@@ -0,0 +1,159 @@
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django import views
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import close_old_connections
+from django.shortcuts import get_object_or_404, render
+
+from .catalog import latest_albums
+from .membership import ProductMembership
+from .mixins import (
+    AlbumValidatorMixin, ArtistValidatorMixin, CartMixin, ConditionalGetMixin, NotificationMixin, SharedPageMixin,
+)
+from .models import Album, Artist, ImageGallery
+
+
+async def db_read(func, *args, **kwargs):
+    """Чтение из БД в отдельном потоке, чтобы независимые запросы шли параллельно"""
+
+    def run():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return await sync_to_async(run, thread_sensitive=False)()
+
+
+def artist_with_gallery(slug):
+    artist = get_object_or_404(Artist.objects.detail_page(), slug=slug)
+    ImageGallery.objects.attach([artist])
+    return artist
+
+
+class AsyncView(views.View):
+    """Представление с async-обработчиками (в Django 4.0 View их не поддерживает)"""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+            return response
+
+        functools.update_wrapper(async_view, view)
+        return async_view
+
+
+class AsyncCatalogMixin(SharedPageMixin):
+    """Корзина и уведомления для async-представлений"""
+
+    async def prepare(self, request):
+        if self.share_page(request):
+            self.user = AnonymousUser()
+            return
+        # Сессия и request.user ленивые и не потокобезопасные, поэтому корзину получаем в основном sync-потоке;
+        # заодно вычисляется пользователь, дальше он читается без обращений к БД
+        self.cart = await sync_to_async(CartMixin.get_cart)(request)
+        self.user = request.user
+        self.membership = ProductMembership(self.cart, self.user)
+
+    async def notifications(self):
+        if self.request.shared_page or NotificationMixin.notifications(self.user) is None:
+            return None
+        return await db_read(NotificationMixin.unread, self.request)
+
+    async def membership_ids(self):
+        return await db_read(self.membership.load)
+
+    @staticmethod
+    async def render(request, template_name, context):
+        return await sync_to_async(render)(request, template_name, context)
+
+
+class AsyncBaseView(AsyncCatalogMixin, AsyncView):
+    """Базовое представление (async)"""
+
+    shared = True
+
+    async def get(self, request, *args, **kwargs):
+        await self.prepare(request)
+        albums, (month_bestseller, month_bestseller_qty), slider, notifications, _ = await asyncio.gather(
+            db_read(latest_albums, 5),
+            db_read(Album.objects.get_month_bestseller),
+            db_read(ImageGallery.objects.slider, settings.SLIDER_SIZE),
+            self.notifications(),
+            self.membership_ids(),
+        )
+        context = {
+            'albums': albums,
+            'cart': self.cart,
+            'membership': self.membership,
+            'slider': slider,
+            'notifications': notifications,
+        }
+        if month_bestseller:
+            context.update({'month_bestseller': month_bestseller, 'month_bestseller_qty': month_bestseller_qty})
+        return await self.render(request, 'base.html', context)
+
+
+class AsyncArtistDetailView(AsyncCatalogMixin, ArtistValidatorMixin, ConditionalGetMixin, AsyncView):
+    """Детализированное представление исполнителя (async)"""
+
+    shared = True
+
+    async def get(self, request, *args, **kwargs):
+        await self.prepare(request)
+        not_modified = await db_read(self.not_modified)
+        if not_modified:
+            return self.add_validators(not_modified)
+        artist, notifications = await asyncio.gather(
+            db_read(artist_with_gallery, kwargs['artist_slug']),
+            self.notifications(),
+        )
+        context = {'object': artist, 'artist': artist, 'cart': self.cart, 'notifications': notifications}
+        return self.add_validators(await self.render(request, 'artist/artist_detail.html', context))
+
+
+class AsyncAlbumDetailView(AsyncCatalogMixin, AlbumValidatorMixin, ConditionalGetMixin, AsyncView):
+    """Детализированное представление альбома (async)"""
+
+    shared = True
+
+    async def get(self, request, *args, **kwargs):
+        await self.prepare(request)
+        not_modified = await db_read(self.not_modified)
+        if not_modified:
+            return self.add_validators(not_modified)
+        album, notifications, _ = await asyncio.gather(
+            db_read(
+                get_object_or_404,
+                Album.objects.select_related('artist__genre', 'media_type'),
+                slug=kwargs['album_slug'],
+            ),
+            self.notifications(),
+            self.membership_ids(),
+        )
+        context = {
+            'object': album, 'album': album, 'cart': self.cart, 'membership': self.membership,
+            'notifications': notifications,
+        }
+        return self.add_validators(await self.render(request, 'album/album_detail.html', context))
+
+
+class AsyncCartView(AsyncCatalogMixin, AsyncView):
+    """Представление корзины (async)"""
+
+    async def get(self, request, *args, **kwargs):
+        await self.prepare(request)
+        cart, notifications = await asyncio.gather(
+            db_read(self.cart.prefetch_products),
+            self.notifications(),
+        )
+        return await self.render(request, 'cart.html', {'cart': cart, 'notifications': notifications})
@@ -0,0 +1,374 @@
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.fields.files import FieldFile
+from django.urls import reverse
+
+from utils import chunked
+from .models import Album, Artist, CatalogChange, Genre, MediaType
+
+
+class Record:
+    """Запись снимка: поля строки values_list без словаря атрибутов (__slots__)"""
+
+    __slots__ = ()
+    model = None
+    fields = ()
+    columns = ()
+
+    def __init__(self, row):
+        self.update(row)
+
+    def update(self, row):
+        for name, value in zip(self.fields, row):
+            setattr(self, name, value)
+
+
+class GenreRecord(Record):
+    model = Genre
+    fields = columns = ('id', 'name', 'slug', 'artist_count')
+    __slots__ = fields
+
+    def __str__(self):
+        return self.name
+
+
+class MediaTypeRecord(Record):
+    model = MediaType
+    fields = columns = ('id', 'name')
+    __slots__ = fields
+
+    def __str__(self):
+        return self.name
+
+
+class ArtistRecord(Record):
+    model = Artist
+    fields = columns = ('id', 'name', 'slug', 'genre_id', 'updated_at', 'album_count', 'in_stock_count')
+    __slots__ = fields + ('genre', 'album_ids')
+
+    def __str__(self):
+        return f"{self.name} | {self.id}"
+
+    def get_absolute_url(self):
+        return reverse('artist_detail', kwargs={'artist_slug': self.slug})
+
+
+class AlbumRecord(Record):
+    """Альбом для списков и кнопок корзины: шаблоны обращаются к нему так же, как к модели"""
+
+    model = Album
+    ct_model = 'album'
+    fields = (
+        'id', 'artist_id', 'media_type_id', 'name', 'slug', 'price', 'stock', 'release_date', 'image_name',
+        'updated_at',
+    )
+    columns = fields[:8] + ('image', 'updated_at')
+    __slots__ = fields + ('artist', 'media_type')
+
+    def __str__(self):
+        return f"{self.id} | {self.artist.name} | {self.name}"
+
+    @property
+    def image(self):
+        return FieldFile(None, Album._meta.get_field('image'), self.image_name)
+
+    def get_absolute_url(self):
+        return reverse('album_detail', kwargs={'artist_slug': self.artist.slug, 'album_slug': self.slug})
+
+
+# Порядок загрузки: жанры и носители раньше исполнителей, исполнители раньше альбомов
+RECORD_TYPES = (GenreRecord, MediaTypeRecord, ArtistRecord, AlbumRecord)
+
+
+def deep_size(objects):
+    """Память записей снимка вместе со строками, датами и числами полей (общие объекты считаем один раз)"""
+    seen = set()
+    size = 0
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, Record):
+            # Ссылки на другие записи снимка посчитаются как их собственные записи
+            stack.extend(getattr(obj, name) for name in obj.fields)
+        elif isinstance(obj, dict):
+            stack.extend(obj)
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    return size
+
+
+class CatalogSnapshot:
+    """Каталог в памяти процесса: списки, фасеты и слаги без запросов, изменения догружаются по журналу
+
+    Журнал и записи читаем только из основной базы: реплика может отставать от журнала, и изменение, версия
+    которого уже учтена, не догрузилось бы никогда.
+    """
+
+    def __init__(self):
+        started = time.perf_counter()
+        self.records = {record_type: {} for record_type in RECORD_TYPES}
+        self.genres, self.media_types, self.artists, self.albums = self.records.values()
+        self.artist_slugs = {}
+        self.album_slugs = {}
+        # Версию читаем до записей: изменения, сделанные во время загрузки, следующее обновление применит повторно
+        self.version = CatalogChange.objects.db_manager(DEFAULT_DB_ALIAS).version()
+        for record_type in RECORD_TYPES:
+            self.apply(record_type)
+        self.reindex()
+        self.build_seconds = time.perf_counter() - started
+        self.refresh_seconds = 0
+        self.checked_at = time.monotonic()
+        self._size = None
+
+    def apply(self, record_type, ids=None):
+        """Перечитываем записи ids (None — всю таблицу) на месте; True, если записи добавились или пропали"""
+        records = self.records[record_type]
+        queryset = record_type.model.objects.using(DEFAULT_DB_ALIAS).order_by()
+        if ids is None:
+            batches = [queryset.values_list(*record_type.columns).iterator()]
+        else:
+            batches = (queryset.filter(id__in=chunk).values_list(*record_type.columns) for chunk in chunked(ids, 500))
+        found = set()
+        added = False
+        for batch in batches:
+            for row in batch:
+                record = records.get(row[0])
+                if record is None:
+                    record = records[row[0]] = record_type(row)
+                    added = True
+                else:
+                    self.unlink(record)
+                    record.update(row)
+                self.link(record)
+                found.add(row[0])
+        removed = [records.pop(object_id) for object_id in (set(records) if ids is None else set(ids)) - found
+                   if object_id in records]
+        for record in removed:
+            self.unlink(record)
+        return added or bool(removed)
+
+    def link(self, record):
+        """Связи записи с другими записями и индексы слагов"""
+        if isinstance(record, ArtistRecord):
+            record.genre = self.genres.get(record.genre_id)
+            if not hasattr(record, 'album_ids'):
+                record.album_ids = set()
+            self.artist_slugs[record.slug] = record
+        elif isinstance(record, AlbumRecord):
+            record.artist = self.artists.get(record.artist_id)
+            record.media_type = self.media_types.get(record.media_type_id)
+            if record.artist is not None:
+                record.artist.album_ids.add(record.id)
+            self.album_slugs[record.slug] = record
+
+    def unlink(self, record):
+        if isinstance(record, ArtistRecord):
+            if self.artist_slugs.get(record.slug) is record:
+                del self.artist_slugs[record.slug]
+        elif isinstance(record, AlbumRecord):
+            if record.artist is not None:
+                record.artist.album_ids.discard(record.id)
+            if self.album_slugs.get(record.slug) is record:
+                del self.album_slugs[record.slug]
+
+    def reindex(self):
+        """Порядок «сначала новые» — массив id; списки и фасеты обходят его, а не словари, которые меняет обновление"""
+        self.latest = array('q', sorted(self.albums, reverse=True))
+        self._facets = None
+
+    def refresh(self):
+        """Догружаем записи из журнала изменений; после обрезки журнала возвращаем новый снимок
+
+        id записи журнала назначается при INSERT, а не при коммите. Читать «всё, что выше self.version» надёжно,
+        пока пишет один процесс за раз, как в SQLite; на базе с параллельными транзакциями изменение из долгой
+        транзакции могло бы закоммититься ниже уже учтённой версии и пропасть для снимка навсегда.
+        """
+        self.checked_at = time.monotonic()
+        changes = list(
+            CatalogChange.objects.using(DEFAULT_DB_ALIAS).filter(id__gt=self.version).order_by('id')
+            .values_list('id', 'model', 'object_id')
+        )
+        if not changes:
+            return self
+        started = time.perf_counter()
+        changed = {record_type.model._meta.model_name: set() for record_type in RECORD_TYPES}
+        for _, model, object_id in changes:
+            if model == CatalogChange.EVERYTHING:
+                return CatalogSnapshot()
+            if model in changed and changed[model] is not None:
+                if object_id is None:
+                    changed[model] = None
+                else:
+                    changed[model].add(object_id)
+        for record_type in RECORD_TYPES:
+            ids = changed[record_type.model._meta.model_name]
+            if (ids is None or ids) and self.apply(record_type, ids) and record_type is AlbumRecord:
+                self.reindex()
+        # Остатки, носители и жанры меняют фасеты и без новых альбомов
+        self._facets = None
+        self.version = changes[-1][0]
+        self.refresh_seconds = time.perf_counter() - started
+        self._size = None
+        return self
+
+    def listing(self, genre=None, media_type=None, in_stock=False):
+        """Альбомы от новых к старым с фильтрами по слагу жанра, названию носителя и наличию"""
+        albums = self.albums
+        for album_id in self.latest:
+            album = albums.get(album_id)
+            if album is None or album.artist is None:
+                continue
+            if genre and (album.artist.genre is None or album.artist.genre.slug != genre):
+                continue
+            if media_type and (album.media_type is None or album.media_type.name != media_type):
+                continue
+            if in_stock and album.stock <= 0:
+                continue
+            yield album
+
+    def latest_albums(self, limit):
+        return list(islice(self.listing(), limit))
+
+    def facets(self):
+        """Число альбомов по жанрам и носителям и число альбомов в наличии"""
+        if self._facets is None:
+            genres, media_types, in_stock = Counter(), Counter(), 0
+            for album in self.listing():
+                if album.artist.genre is not None:
+                    genres[album.artist.genre.slug] += 1
+                if album.media_type is not None:
+                    media_types[album.media_type.name] += 1
+                in_stock += album.stock > 0
+            self._facets = {'genres': dict(genres), 'media_types': dict(media_types), 'in_stock': in_stock}
+        return self._facets
+
+    def artist_updated_at(self, slug):
+        """Время изменения страницы исполнителя: он сам и его альбомы; None — исполнителя нет в снимке"""
+        artist = self.artist_slugs.get(slug)
+        if artist is None:
+            return None
+        albums = [self.albums.get(album_id) for album_id in list(artist.album_ids)]
+        return max([artist.updated_at, *(album.updated_at for album in albums if album is not None)])
+
+    def album_by_slug(self, slug):
+        return self.album_slugs.get(slug)
+
+    def size(self):
+        """Память снимка в байтах (считаем один раз на версию)"""
+        if self._size is None:
+            self._size = deep_size([
+                *self.records.values(), self.artist_slugs, self.album_slugs, self.latest,
+                *(list(artist.album_ids) for artist in list(self.artists.values())),
+            ])
+        return self._size
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'records': {
+                record_type.model._meta.model_name: len(records) for record_type, records in self.records.items()
+            },
+            'bytes': self.size(),
+            'build_seconds': self.build_seconds,
+            'refresh_seconds': self.refresh_seconds,
+        }
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def load():
+    """Собираем снимок заново; wsgi.py и asgi.py вызывают при старте процесса"""
+    global _snapshot
+    with _lock:
+        _snapshot = CatalogSnapshot()
+    return _snapshot
+
+
+def get_snapshot():
+    """Снимок каталога, не старше CATALOG_SNAPSHOT_REFRESH_SECONDS; None, если CATALOG_SNAPSHOT выключен"""
+    global _snapshot
+    if not settings.CATALOG_SNAPSHOT:
+        return None
+    snapshot = _snapshot
+    if snapshot is None:
+        return load()
+    if time.monotonic() - snapshot.checked_at >= settings.CATALOG_SNAPSHOT_REFRESH_SECONDS:
+        # Журнал проверяет один поток, остальные тем временем отвечают по текущему снимку
+        if _lock.acquire(blocking=False):
+            try:
+                _snapshot = snapshot.refresh()
+            finally:
+                _lock.release()
+    return _snapshot
+
+
+def latest_albums(limit):
+    """Новые альбомы для главной: из снимка или одним запросом"""
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.latest_albums(limit)
+    return list(Album.objects.select_related('artist__genre', 'media_type').order_by('-id')[:limit])
+
+
+def albums_by_id(album_ids):
+    """Альбомы для кнопок корзины: из снимка или одним запросом"""
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return [snapshot.albums[album_id] for album_id in album_ids if album_id in snapshot.albums]
+    return Album.objects.filter(id__in=album_ids).only('id', 'slug', 'stock')
+
+
+def album_data(album):
+    """Альбом для JSON-списка каталога (запись снимка или модель)"""
+    return {
+        'id': album.id,
+        'name': album.name,
+        'artist': album.artist.name,
+        'url': album.get_absolute_url(),
+        'media_type': album.media_type.name,
+        'release_date': album.release_date,
+        'price': album.price,
+        'stock': album.stock,
+        'image': album.image.url if album.image else None,
+    }
+
+
+def render_metrics():
+    """Размер и время сборки снимка процесса в формате Prometheus"""
+    snapshot = _snapshot
+    if snapshot is None:
+        return ''
+    stats = snapshot.stats()
+    lines = [
+        '# HELP musicshop_catalog_snapshot_bytes Память снимка каталога в процессе',
+        '# TYPE musicshop_catalog_snapshot_bytes gauge',
+        f"musicshop_catalog_snapshot_bytes {stats['bytes']}",
+        '# HELP musicshop_catalog_snapshot_records Записей в снимке каталога',
+        '# TYPE musicshop_catalog_snapshot_records gauge',
+        *(f'musicshop_catalog_snapshot_records{{model="{model}"}} {count}'
+          for model, count in stats['records'].items()),
+        '# HELP musicshop_catalog_snapshot_version Версия каталога в снимке',
+        '# TYPE musicshop_catalog_snapshot_version gauge',
+        f"musicshop_catalog_snapshot_version {stats['version']}",
+        '# HELP musicshop_catalog_snapshot_build_seconds Время полной сборки снимка',
+        '# TYPE musicshop_catalog_snapshot_build_seconds gauge',
+        f"musicshop_catalog_snapshot_build_seconds {stats['build_seconds']:g}",
+        '# HELP musicshop_catalog_snapshot_refresh_seconds Время последнего обновления снимка по журналу',
+        '# TYPE musicshop_catalog_snapshot_refresh_seconds gauge',
+        f"musicshop_catalog_snapshot_refresh_seconds {stats['refresh_seconds']:g}",
+    ]
+    return '\n'.join(lines) + '\n'
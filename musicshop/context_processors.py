@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.utils.functional import SimpleLazyObject
+
+from .mixins import CartMixin, NotificationMixin
+
+
+def header_cart(request):
+    if not hasattr(request, 'cart') and not request.user.is_authenticated and not request.session.get('cart_id'):
+        # Шапка не заводит корзину гостю (страница входа обходится без запросов)
+        return None
+    return CartMixin.get_cart(request)
+
+
+def shop(request):
+    """Корзина и уведомления для шапки каждой страницы; запросы выполняются, только если шаблон к ним обратился"""
+    if getattr(request, 'shared_page', False):
+        # Общая страница одинакова для всех: шаблон видит гостя, сессия и пользователь запроса не читаются
+        return {'shared_page': True, 'user': AnonymousUser(), 'cart': None, 'notifications': None}
+    user = request.user
+    if user.is_authenticated and not settings.LIVE_NOTIFICATIONS:
+        notifications = SimpleLazyObject(lambda: NotificationMixin.unread(request))
+    else:
+        # None (уведомления придут через SSE) или пустой queryset — без запросов
+        notifications = NotificationMixin.notifications(user)
+    return {
+        'cart': SimpleLazyObject(lambda: header_cart(request)),
+        'notifications': notifications,
+    }
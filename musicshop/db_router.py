@@ -0,0 +1,66 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Модели каталога, которые можно читать с реплик
+CATALOG_MODELS = {'album', 'artist', 'genre', 'member', 'mediatype', 'imagegallery'}
+
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def is_catalog(model):
+    opts = model._meta
+    if opts.auto_created:
+        # Промежуточные таблицы M2M (избранное, состав групп) читаются в запросах каталога
+        return any(is_catalog(field.related_model) for field in opts.fields if field.is_relation)
+    return opts.app_label == 'musicshop' and opts.model_name in CATALOG_MODELS
+
+
+@contextmanager
+def replica_reads(pinned=False):
+    """Разрешаем чтение каталога с реплик на время запроса; в состоянии отмечается, менялся ли каталог"""
+    # Изменяемый словарь, а не флаг: async-представления читают БД в других потоках с копией контекста
+    state = {'pinned': pinned, 'catalog_changed': False}
+    token = _request_state.set(state)
+    try:
+        yield state
+    finally:
+        _request_state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Чтение каталога внутри запроса — с реплик, всё остальное и чтение после записи — с основной базы"""
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        pool = replicas()
+        if not pool or state is None or state['pinned'] or not is_catalog(model):
+            return DEFAULT_DB_ALIAS
+        return random.choice(pool)
+
+    def db_for_write(self, model, **hints):
+        # Сюда же приходят select_for_update и get_or_create: после них запрос читает только основную базу
+        state = _request_state.get()
+        if state is not None:
+            state['pinned'] = True
+            state['catalog_changed'] = state['catalog_changed'] or is_catalog(model)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает на реплики вместе с данными
+        if db in replicas():
+            return False
+        return None
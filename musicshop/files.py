@@ -0,0 +1,186 @@
+import gzip
+import mimetypes
+import os
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Текстовые форматы, которые стоит сжимать заранее; картинки и шрифты woff2 уже сжаты
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico', '.ttf', '.eot'}
+
+# Сжатые варианты в порядке предпочтения: (Content-Encoding, расширение файла)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+FILE_BLOCK_SIZE = 64 * 1024
+
+_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Имена с хэшем содержимого плюс gzip- и brotli-копии, которые collectstatic готовит один раз"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            self.compress(name)
+
+    def compress(self, name):
+        """Пишем name.gz и name.br рядом с файлом, если сжатие заметно уменьшает его"""
+        if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            data = file.read()
+        variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(data)
+        for suffix, compressed in variants.items():
+            # Мелкие файлы сжатие почти не уменьшает, а распаковка стоит клиенту времени
+            if len(compressed) < len(data) * 0.95:
+                with open(path + suffix, 'wb') as file:
+                    file.write(compressed)
+
+
+class FileRange:
+    """Часть файла для ответа 206: read() не выходит за диапазон, fileno() даёт WSGI-серверу отдать её через sendfile"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """(начало, длина) по заголовку Range; None — отдаём файл целиком; ValueError — диапазон вне файла"""
+    # Несколько диапазонов (multipart/byteranges) не поддерживаем: по RFC 7233 можно ответить целым файлом
+    match = _range_re.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-500: последние 500 байт
+        length = min(int(last), size)
+        if not length:
+            raise ValueError(header)
+        return size - length, length
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end - start + 1
+
+
+def accepted_encodings(request):
+    """Кодировки из Accept-Encoding без q=0"""
+    encodings = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+def serve_file(request, path, document_root, cache_control, precompressed=False):
+    """Отдаём файл из document_root: 304 по валидаторам, 206 по Range, заранее сжатая копия по Accept-Encoding"""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponse(status=405, headers={'Allow': 'GET, HEAD'})
+    # Выход за document_root (../) safe_join превращает в SuspiciousFileOperation, то есть ответ 400
+    fullpath = safe_join(document_root, path)
+    if not os.path.isfile(fullpath):
+        raise Http404(path)
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+    range_header = request.META.get('HTTP_RANGE')
+    content_encoding = None
+    if precompressed and encoding is None and not range_header:
+        accepted = accepted_encodings(request)
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.isfile(fullpath + suffix):
+                content_encoding, fullpath = coding, fullpath + suffix
+                break
+    stat = os.stat(fullpath)
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}{"-" + content_encoding if content_encoding else ""}"'
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    file_range = None
+    if response is None and range_header and not if_range_changed(request, etag, last_modified):
+        try:
+            file_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416, headers={'Content-Range': f'bytes */{stat.st_size}'})
+    if response is None:
+        file = open(fullpath, 'rb')
+        if file_range:
+            start, length = file_range
+            response = FileResponse(FileRange(file, start, length), status=206, content_type=content_type)
+            response.headers['Content-Range'] = f'bytes {start}-{start + length - 1}/{stat.st_size}'
+            response.headers['Content-Length'] = length
+        else:
+            response = FileResponse(file, content_type=content_type)
+        response.block_size = FILE_BLOCK_SIZE
+        if content_encoding:
+            response.headers['Content-Encoding'] = content_encoding
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    response.headers['Accept-Ranges'] = 'bytes'
+    if precompressed:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    patch_cache_control(response, **cache_control)
+    return response
+
+
+def if_range_changed(request, etag, last_modified):
+    """If-Range не совпал с текущей версией: вместо части отдаём файл целиком"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return False
+    if if_range.startswith('"'):
+        return if_range != etag
+    return parse_http_date_safe(if_range) != last_modified
+
+
+@lru_cache(maxsize=None)
+def hashed_static_names():
+    """Имена с хэшем из манифеста collectstatic: содержимое по такому имени не меняется никогда"""
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+
+def static_file(request, path):
+    """Статика из STATIC_ROOT, когда перед приложением нет nginx"""
+    if path in hashed_static_names():
+        cache_control = {'public': True, 'max_age': settings.STATIC_IMMUTABLE_MAX_AGE, 'immutable': True}
+    else:
+        cache_control = {'public': True, 'max_age': settings.STATIC_MAX_AGE}
+    return serve_file(request, path, settings.STATIC_ROOT, cache_control, precompressed=True)
+
+
+def media_file(request, path):
+    """Загруженные файлы из MEDIA_ROOT с поддержкой Range (обложки, превью, аудио)"""
+    return serve_file(request, path, settings.MEDIA_ROOT, {'public': True, 'max_age': settings.MEDIA_MAX_AGE})
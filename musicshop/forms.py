@@ -1,7 +1,8 @@
 from django import forms
-from django.contrib.auth import get_user_model
+from django.contrib.auth import authenticate, get_user_model
 
 from .models import Order
+from utils import IMPORT_FORMATS
 
 
 User = get_user_model()  # Так получать модель пользователя безопастнее
@@ -39,10 +40,15 @@ class LoginForm(forms.ModelForm):
     def clean(self):
         username = self.cleaned_data['username']
         password = self.cleaned_data['password']
-        user = User.objects.filter(username=username).first()
-        if not user:
-            raise forms.ValidationError(f'Пользователь с логином {username} не найден в системе')
-        if not user.check_password(password):
+        # Пароль хешируем один раз: найденного пользователя представление передаёт прямо в login()
+        self.user = authenticate(username=username, password=password)
+        if self.user is None:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise forms.ValidationError(f'Пользователь с логином {username} не найден в системе')
+            # authenticate() не пускает отключённых пользователей и с верным паролем
+            if not user.is_active and user.check_password(password):
+                raise forms.ValidationError('Учётная запись отключена', code='inactive')
             raise forms.ValidationError('Неверный пароль')
         return self.cleaned_data
 
@@ -92,3 +98,14 @@ class RegistrationForm(forms.ModelForm):
     class Meta:
         model = User
         fields = ['username', 'password', 'confirm_password', 'first_name', 'last_name', 'address', 'phone', 'email']
+
+
+class CatalogImportForm(forms.Form):
+    """Форма загрузки файла для импорта каталога"""
+
+    file = forms.FileField(label='Файл импорта (CSV или JSON-lines)')
+    format = forms.ChoiceField(
+        label='Формат', required=False,
+        choices=[('', 'Определить по расширению')] + [(fmt, fmt) for fmt in IMPORT_FORMATS]
+    )
+    images_dir = forms.CharField(label='Каталог с обложками на сервере', required=False)
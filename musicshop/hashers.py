@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class ProfileMixin:
+    """Параметры хешера берём из профиля PASSWORD_HASHER_PARAMS (по имени алгоритма)"""
+
+    def __init__(self):
+        for name, value in getattr(settings, 'PASSWORD_HASHER_PARAMS', {}).get(self.algorithm, {}).items():
+            if not hasattr(self, name):
+                raise AttributeError(f'У хешера {self.algorithm} нет параметра {name}')
+            setattr(self, name, value)
+
+
+class PBKDF2PasswordHasher(ProfileMixin, hashers.PBKDF2PasswordHasher):
+    pass
+
+
+class ScryptPasswordHasher(ProfileMixin, hashers.ScryptPasswordHasher):
+    pass
+
+
+class Argon2PasswordHasher(ProfileMixin, hashers.Argon2PasswordHasher):
+    pass
@@ -0,0 +1,94 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import mail_managers
+from django.db import transaction
+from django.utils import timezone
+
+from utils import reprice_open_carts
+from .models import Album, Job, Order, StockMovement, notify_restocked as notify_waiting
+
+logger = logging.getLogger('musicshop.jobs')
+
+# Задачи по имени: Job.objects.enqueue('имя', **параметры)
+tasks = {}
+
+
+def task(func):
+    """Регистрируем функцию как фоновую задачу; она должна выдерживать повторный запуск"""
+    tasks[func.__name__] = func
+    return func
+
+
+@task
+def notify_restocked(album_ids):
+    with transaction.atomic():
+        # К моменту выполнения альбом могли снова распродать
+        notify_waiting(Album.objects.filter(id__in=album_ids, stock__gt=0).select_related('artist'))
+
+
+@task
+def reprice_carts(album_ids):
+    reprice_open_carts(album_ids)
+
+
+@task
+def compact_stock():
+    StockMovement.objects.compact()
+
+
+@task
+def alert_managers(order_id):
+    if not settings.MANAGERS:
+        return
+    order = Order.objects.select_related('cart').get(id=order_id)
+    mail_managers(
+        f'Новый заказ №{order.id}',
+        f'{order.first_name} {order.last_name}, {order.phone}\n'
+        f'{order.get_buying_type_display()}: {order.address or "—"}, дата получения {order.order_date}\n'
+        f'Товаров: {order.cart.total_products}, сумма: {order.cart.final_price} руб.\n'
+        f'Комментарий: {order.comment or "—"}',
+    )
+
+
+def retry_delay(attempts):
+    """Пауза перед повтором: JOB_RETRY_DELAY и вдвое больше после каждой следующей неудачи"""
+    return min(settings.JOB_RETRY_DELAY * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_DELAY)
+
+
+def run(job):
+    """Выполняем задачу: удачную удаляем, неудачную откладываем с нарастающей паузой или помечаем упавшей"""
+    func = tasks.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f'Неизвестная задача {job.name}')
+        func(**job.payload)
+    except Exception:
+        logger.exception('Задача %s #%s, попытка %s', job.name, job.id, job.attempts)
+        job.last_error = traceback.format_exc()
+        job.locked_at = None
+        if func is None or job.attempts >= settings.JOB_MAX_ATTEMPTS:
+            job.status = Job.STATUS_FAILED
+        else:
+            job.status = Job.STATUS_QUEUED
+            job.run_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+        job.save(update_fields=['status', 'run_at', 'locked_at', 'last_error'])
+        return False
+    job.delete()
+    return True
+
+
+def run_pending(limit=100):
+    """Выполняем готовые задачи, пока они есть; возвращаем (выполнено, не выполнено)"""
+    done = failed = 0
+    while True:
+        jobs = Job.objects.claim(limit)
+        if not jobs:
+            return done, failed
+        for job in jobs:
+            if run(job):
+                done += 1
+            else:
+                failed += 1
@@ -0,0 +1,215 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from django.urls import reverse
+
+CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class NoRedirectHandler(HTTPRedirectHandler):
+    """Редиректы не проходим: замеряем каждый URL отдельно"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class LoadStats:
+    """Задержки и ошибки по именам URL, общие для всех виртуальных пользователей"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock_errors = 0
+        # При запуске сервера в этом же процессе блокировки считаем по исключениям, а не по тексту ответа
+        self.lock_errors_from_body = True
+        self.started = time.monotonic()
+        self.finished = None
+
+    def record(self, url_name, duration, ok):
+        with self.lock:
+            self.latencies[url_name].append(duration)
+            if not ok:
+                self.errors[url_name] += 1
+
+    def record_lock_error(self):
+        with self.lock:
+            self.lock_errors += 1
+
+    @staticmethod
+    def percentile(values, percent):
+        """Процентиль по ближайшему рангу: наименьшее значение, не меньше которого percent% замеров"""
+        ordered = sorted(values)
+        return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+    def summary(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        total = sum(len(values) for values in self.latencies.values())
+        return {
+            'elapsed': elapsed,
+            'requests': total,
+            'throughput': total / elapsed if elapsed else 0,
+            'errors': sum(self.errors.values()),
+            'lock_errors': self.lock_errors,
+            'urls': {
+                url_name: {
+                    'count': len(values),
+                    'errors': self.errors[url_name],
+                    'p50': self.percentile(values, 50),
+                    'p95': self.percentile(values, 95),
+                    'p99': self.percentile(values, 99),
+                }
+                for url_name, values in sorted(self.latencies.items())
+            },
+        }
+
+
+class VirtualUser:
+    """Виртуальный пользователь со своей сессией (cookies) и сценарием"""
+
+    def __init__(self, base_url, stats, catalog, rng, credentials=None, think_time=0, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.catalog = catalog
+        self.rng = rng
+        self.credentials = credentials
+        self.think_time = think_time
+        self.timeout = timeout
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), NoRedirectHandler())
+        self.logged_in = False
+
+    def request(self, url_name, path, data=None, referer=None):
+        url = self.base_url + path
+        headers = {'Referer': referer or url}
+        body = None
+        if data is not None:
+            body = urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        started = time.monotonic()
+        try:
+            with self.opener.open(Request(url, data=body, headers=headers), timeout=self.timeout) as response:
+                content = response.read().decode('utf-8', 'replace')
+                status = response.status
+        except HTTPError as exc:
+            content = exc.read().decode('utf-8', 'replace')
+            status = exc.code
+        except URLError:
+            content, status = '', 599
+        self.stats.record(url_name, time.monotonic() - started, status < 400)
+        if status >= 500 and self.stats.lock_errors_from_body and 'database is locked' in content:
+            self.stats.record_lock_error()
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, self.think_time * 2))
+        return content
+
+    def csrf_token(self, content):
+        match = CSRF_RE.search(content)
+        return match.group(1) if match else ''
+
+    def browse(self):
+        """Анонимный просмотр каталога"""
+        album = self.rng.choice(self.catalog)
+        self.request('base', reverse('base'))
+        self.request('artist_detail', reverse('artist_detail', kwargs={'artist_slug': album['artist_slug']}))
+        self.request('album_detail', album['url'])
+        self.request('cart', reverse('cart'))
+
+    def login(self):
+        username, password = self.credentials
+        content = self.request('login', reverse('login'))
+        self.request('login', reverse('login'), {
+            'username': username, 'password': password, 'csrfmiddlewaretoken': self.csrf_token(content)
+        })
+        self.logged_in = True
+
+    def shop(self):
+        """Покупатель: каталог → исполнитель → альбом → корзина → количество → оформление → заказ"""
+        if not self.logged_in:
+            self.login()
+        album = self.rng.choice(self.catalog)
+        self.request('base', reverse('base'))
+        self.request('artist_detail', reverse('artist_detail', kwargs={'artist_slug': album['artist_slug']}))
+        self.request('album_detail', album['url'])
+        self.request(
+            'add_to_cart', reverse('add_to_cart', kwargs={'ct_model': 'album', 'slug': album['slug']}),
+            referer=self.base_url + album['url'],
+        )
+        content = self.request('cart', reverse('cart'))
+        self.request(
+            'change_qty', reverse('change_qty', kwargs={'ct_model': 'album', 'slug': album['slug']}),
+            {'qty': self.rng.randint(1, 2), 'csrfmiddlewaretoken': self.csrf_token(content)},
+        )
+        content = self.request('checkout', reverse('checkout'))
+        self.request('make-order', reverse('make-order'), {
+            'first_name': 'Нагрузка', 'last_name': 'Тест', 'phone': '+70000000000', 'address': 'ул. Тестовая',
+            'buying_type': 'self', 'order_date': time.strftime('%Y-%m-%d'), 'comment': '',
+            'csrfmiddlewaretoken': self.csrf_token(content),
+        })
+
+
+def run_load(stats, base_url, catalog, credentials, users, duration, anonymous_ratio, think_time, seed):
+    """Запускаем виртуальных пользователей на duration секунд и собираем статистику"""
+    stats.started = time.monotonic()
+    deadline = time.monotonic() + duration
+    rng = random.Random(seed)
+    workers = []
+    for number in range(users):
+        user_rng = random.Random(rng.random())
+        anonymous = not credentials or user_rng.random() < anonymous_ratio
+        user = VirtualUser(
+            base_url, stats, catalog, user_rng,
+            credentials=None if anonymous else credentials[number % len(credentials)], think_time=think_time,
+        )
+        journey = user.browse if anonymous else user.shop
+
+        def loop(journey=journey):
+            while time.monotonic() < deadline:
+                journey()
+
+        workers.append(threading.Thread(target=loop, daemon=True))
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    stats.finished = time.monotonic()
+    return stats
+
+
+def compare_with_baseline(summary, baseline, max_regression):
+    """Сравниваем прогон с сохранённым: пропускную способность и p95 по каждому URL"""
+    regressions = []
+    lines = []
+    ratio = summary['throughput'] / baseline['throughput'] if baseline['throughput'] else 1
+    lines.append(f"Пропускная способность: {baseline['throughput']:.1f} → {summary['throughput']:.1f} rps "
+                 f'({ratio - 1:+.0%})')
+    if ratio < 1 - max_regression:
+        regressions.append('throughput')
+    for url_name, current in summary['urls'].items():
+        previous = baseline['urls'].get(url_name)
+        if not previous:
+            continue
+        change = current['p95'] / previous['p95'] - 1 if previous['p95'] else 0
+        lines.append(f"{url_name:>16}: p95 {previous['p95'] * 1000:.1f} → {current['p95'] * 1000:.1f} мс "
+                     f'({change:+.0%})')
+        if change > max_regression:
+            regressions.append(url_name)
+    return lines, regressions
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as baseline:
+        return json.load(baseline)
+
+
+def save_baseline(path, summary):
+    with open(path, 'w', encoding='utf-8') as baseline:
+        json.dump(summary, baseline, ensure_ascii=False, indent=2)
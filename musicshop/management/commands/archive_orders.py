@@ -0,0 +1,20 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from utils import archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Переносит выполненные заказы вместе с корзинами в архивные таблицы (можно прерывать и запускать снова)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS,
+                            help='Архивировать заказы с датой получения старше стольких дней')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Заказов в одной транзакции')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        archived = archive_orders(options['days'], options['batch_size'])
+        self.stdout.write(f'Перенесено в архив заказов: {archived} за {time.monotonic() - started:.1f} с.')
@@ -0,0 +1,72 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+from django.utils.module_loading import import_string
+
+from musicshop.views import LoginView
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Сколько входов в секунду выдерживает одно ядро с текущим профилем хешеров паролей'
+
+    username = 'bench-login'
+    password = 'bench-login-password'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20, help='Число входов на каждый хешер')
+        parser.add_argument('--hasher', action='append', dest='hashers',
+                            help='Алгоритм (pbkdf2_sha256, scrypt, argon2); по умолчанию основной из PASSWORD_HASHERS')
+
+    def handle(self, *args, **options):
+        paths = {import_string(path).algorithm: path for path in settings.PASSWORD_HASHERS}
+        algorithms = options['hashers'] or [get_hasher().algorithm]
+        unknown = set(algorithms) - set(paths)
+        if unknown:
+            raise CommandError(f'Хешеров {", ".join(sorted(unknown))} нет в PASSWORD_HASHERS')
+        if User.objects.filter(username=self.username).exists():
+            raise CommandError(f'Пользователь {self.username} уже существует, удалите его перед замером')
+        user = User.objects.create(username=self.username)
+        try:
+            self.stdout.write(f"{'Хешер':>16} {'хеш, мс':>9} {'вход, мс':>9} {'входов/с на ядро':>18}")
+            for algorithm in algorithms:
+                # Замеряемый хешер делаем основным, иначе при входе пароль ещё и перехешируется
+                with override_settings(PASSWORD_HASHERS=[paths[algorithm]] + list(settings.PASSWORD_HASHERS)):
+                    try:
+                        hash_time, login_time = self.bench(user, get_hasher(algorithm), options['logins'])
+                    except ValueError as exc:
+                        self.stdout.write(f'{algorithm:>16} недоступен: {exc}')
+                        continue
+                self.stdout.write(
+                    f'{algorithm:>16} {hash_time * 1000:9.1f} {login_time * 1000:9.1f} {1 / login_time:18.1f}'
+                )
+        finally:
+            user.delete()
+        self.stdout.write(f'Параметры профиля: {getattr(settings, "PASSWORD_HASHER_PARAMS", {}) or "по умолчанию"}')
+
+    def bench(self, user, hasher, logins):
+        """Время одного хеширования и полного входа через LoginView (форма, хеш, сессия)"""
+        user.password = hasher.encode(self.password, hasher.salt())
+        user.save(update_fields=['password'])
+        started = time.perf_counter()
+        hasher.verify(self.password, user.password)
+        hash_time = time.perf_counter() - started
+
+        factory = RequestFactory()
+        view = LoginView.as_view()
+        started = time.perf_counter()
+        for _ in range(logins):
+            request = factory.post('/login/', {'username': self.username, 'password': self.password})
+            request.session = SessionStore()
+            request.user = AnonymousUser()
+            if view(request).status_code != 302:
+                raise CommandError(f'Вход с хешером {hasher.algorithm} не удался')
+            request.session.delete()
+        return hash_time, (time.perf_counter() - started) / logins
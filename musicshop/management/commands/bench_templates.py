@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from musicshop.metrics import registry
+from musicshop.models import Album, Cart, CartProduct, Customer, Notification, Order
+from utils import recalc_cart
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Время рендеринга base.html, cart.html и account.html по профилям шаблонов и объёмам данных'
+
+    pages = ('base', 'cart', 'account')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,10,100',
+                            help='Позиций в корзине, заказов, уведомлений и альбомов в избранном, через запятую')
+        parser.add_argument('--requests', type=int, default=20, help='Запросов на каждую страницу')
+        parser.add_argument('--profile', action='append', dest='profiles', choices=list(settings.TEMPLATE_PROFILES),
+                            help='Профиль шаблонов из TEMPLATE_PROFILES; по умолчанию все')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        if Album.objects.count() < max(sizes):
+            raise CommandError(f'В каталоге меньше {max(sizes)} альбомов')
+        profiles = options['profiles'] or list(settings.TEMPLATE_PROFILES)
+        self.stdout.write(f"{'Профиль':>12} {'объём':>6} {'страница':>9} {'рендеринг, мс':>14} {'запросов':>9}")
+        for size in sizes:
+            # Данные для замера откатываем, в базе ничего не остаётся
+            with transaction.atomic():
+                client = self.fixture(size)
+                for profile in profiles:
+                    with override_settings(TEMPLATES=[settings.TEMPLATE_PROFILES[profile]]):
+                        for page in self.pages:
+                            render_time, queries = self.bench(client, page, options['requests'])
+                            self.stdout.write(
+                                f'{profile:>12} {size:>6} {page:>9} {render_time * 1000:14.2f} {queries:9.1f}'
+                            )
+                transaction.set_rollback(True)
+
+    @staticmethod
+    def fixture(size):
+        """Покупатель с корзиной, заказами, уведомлениями и избранным по size штук"""
+        customer = Customer.objects.create(user=User.objects.create_user(username=f'bench-templates-{size}'))
+        albums = list(Album.objects.order_by('id')[:size])
+        album_ct = ContentType.objects.get_for_model(Album)
+
+        def fill(cart, lines):
+            products = CartProduct.objects.bulk_create([
+                CartProduct(user=customer, cart=cart, content_type=album_ct, object_id=album.id, qty=1,
+                            final_price=album.price)
+                for album in lines
+            ])
+            cart.products.add(*products)
+            recalc_cart(cart)
+            return cart
+
+        fill(Cart.objects.create(owner=customer), albums)
+        for _ in range(size):
+            Order.objects.create(
+                customer=customer, cart=fill(Cart.objects.create(owner=customer, in_order=True), albums[:3]),
+                first_name='Замер', last_name='Шаблонов', phone='+70000000000', buying_type=Order.BUYING_TYPE_SELF,
+            )
+        Notification.objects.bulk_create([Notification(recipient=customer, text='Уведомление') for _ in range(size)])
+        customer.wishlist.add(*albums)
+        client = Client()
+        client.force_login(customer.user)
+        return client
+
+    @staticmethod
+    def bench(client, page, requests):
+        """Среднее время рендеринга и число запросов по метрикам PerformanceMiddleware"""
+        url = reverse(page)
+        # Первый запрос прогревает загрузчик шаблонов
+        client.get(url)
+        registry.reset()
+        for _ in range(requests):
+            client.get(url)
+        render = registry.histograms[('template_render_seconds', page)]
+        queries = registry.histograms[('sql_queries', page)]
+        return render.sum / render.count, queries.sum / queries.count
@@ -0,0 +1,42 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from musicshop.catalog import CatalogSnapshot
+from musicshop.models import CatalogChange
+
+
+class Command(BaseCommand):
+    help = 'Собирает снимок каталога, как процесс сайта, и показывает его память и время сборки и обновления'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', type=int, metavar='DAYS',
+                            help='Удалить из журнала изменений каталога записи старше DAYS дней')
+
+    def handle(self, *args, **options):
+        if options['prune'] is not None:
+            deleted = CatalogChange.objects.prune(options['prune'])
+            self.stdout.write(f'Удалено записей журнала: {deleted}')
+        tracemalloc.start()
+        snapshot = CatalogSnapshot()
+        allocated, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats = snapshot.stats()
+        records = ', '.join(f'{model} {count}' for model, count in stats['records'].items())
+        self.stdout.write(f"Версия каталога: {stats['version']}; записей: {records}")
+        self.stdout.write(f"Сборка: {stats['build_seconds'] * 1000:.1f} мс")
+        self.stdout.write(
+            f"Память снимка: {stats['bytes'] / 2 ** 20:.1f} МБ "
+            f"(выделено при сборке {allocated / 2 ** 20:.1f} МБ, пик {peak / 2 ** 20:.1f} МБ)"
+        )
+        # Обновление без изменений в журнале — то, что процесс делает раз в CATALOG_SNAPSHOT_REFRESH_SECONDS
+        started = time.perf_counter()
+        snapshot.refresh()
+        self.stdout.write(f'Проверка журнала: {(time.perf_counter() - started) * 1000:.2f} мс')
+        started = time.perf_counter()
+        facets = snapshot.facets()
+        self.stdout.write(
+            f"Фасеты: жанров {len(facets['genres'])}, носителей {len(facets['media_types'])}, "
+            f"в наличии {facets['in_stock']} ({(time.perf_counter() - started) * 1000:.1f} мс)"
+        )
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from musicshop.models import StockMovement
+
+
+class Command(BaseCommand):
+    help = 'Сворачивает новые движения складского журнала в снимки остатков (запускать периодически)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Сколько альбомов сворачивать за транзакцию')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        albums = StockMovement.objects.compact(chunk_size=options['chunk_size'])
+        self.stdout.write(f'Обновлено остатков: {albums} за {time.monotonic() - started:.1f} с.')
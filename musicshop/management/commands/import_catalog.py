@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from utils import import_catalog, detect_format, IMPORT_FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Пакетный импорт альбомов из CSV или JSON-lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу импорта')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Формат файла (по умолчанию по расширению)')
+        parser.add_argument('--images', help='Каталог с обложками альбомов (имя файла = slug альбома)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Размер пачки записей')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['path'])
+        started = time.monotonic()
+        try:
+            with open(options['path'], encoding='utf-8', newline='') as stream:
+                stats = import_catalog(
+                    stream, fmt=fmt, images_dir=options['images'], batch_size=options['batch_size']
+                )
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано альбомов: {stats['created']}, обновлено: {stats['updated']}, "
+            f"новых исполнителей: {stats['artists']}, жанров: {stats['genres']}, "
+            f"медианосителей: {stats['media_types']}, обложек: {stats['images']}, "
+            f"уведомлений: {stats['notifications']}, пересчитано позиций корзин: {stats['repriced_lines']} за {time.monotonic() - started:.1f} с."
+        ))
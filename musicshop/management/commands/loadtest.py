@@ -0,0 +1,138 @@
+import sys
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.signals import got_request_exception
+from django.db import OperationalError
+
+from musicshop.loadtest import LoadStats, compare_with_baseline, load_baseline, run_load, save_baseline
+from musicshop.models import Album
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест сценариев покупателя на локальном WSGI/ASGI сервере'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi',
+                            help='Какое приложение поднять локально (asgi требует uvicorn)')
+        parser.add_argument('--url', help='Адрес уже запущенного сервера вместо локального')
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=0)
+        parser.add_argument('--users', type=int, default=10, help='Число виртуальных пользователей')
+        parser.add_argument('--duration', type=float, default=30, help='Длительность, с')
+        parser.add_argument('--anonymous-ratio', type=float, default=0.5, help='Доля анонимных пользователей')
+        parser.add_argument('--think-time', type=float, default=0, help='Средняя пауза между запросами, с')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--user-prefix', default='seed-user-', help='Префикс логинов покупателей (seed_shop)')
+        parser.add_argument('--password', default='password', help='Пароль покупателей')
+        parser.add_argument('--catalog-size', type=int, default=500, help='Сколько альбомов в наличии использовать')
+        parser.add_argument('--save-baseline', help='Сохранить результат как эталон (JSON)')
+        parser.add_argument('--baseline', help='Сравнить с эталоном (JSON)')
+        parser.add_argument('--max-regression', type=float, default=0.2, help='Допустимое ухудшение, доля')
+
+    def handle(self, *args, **options):
+        catalog = [
+            {'slug': album.slug, 'artist_slug': album.artist.slug, 'url': album.get_absolute_url()}
+            for album in Album.objects.select_related('artist').filter(stock__gt=0).order_by('-stock')[:options['catalog_size']]
+        ]
+        if not catalog:
+            raise CommandError('Нет альбомов в наличии: заполните базу командой seed_shop')
+        credentials = [
+            (username, options['password'])
+            for username in get_user_model().objects.filter(
+                username__startswith=options['user_prefix']
+            ).values_list('username', flat=True)[:options['users']]
+        ]
+
+        stats = LoadStats()
+        server = None
+        if options['url']:
+            base_url = options['url']
+        else:
+            stats.lock_errors_from_body = False
+            got_request_exception.connect(self.make_lock_error_counter(stats), weak=False)
+            server, base_url = self.start_server(options)
+        self.stdout.write(f"{options['users']} пользователей, {options['duration']:g} с, {base_url}")
+        try:
+            run_load(
+                stats, base_url, catalog, credentials, options['users'], options['duration'],
+                options['anonymous_ratio'], options['think_time'], options['seed'],
+            )
+        finally:
+            if server:
+                server()
+        summary = stats.summary()
+        self.write_summary(summary)
+
+        if options['save_baseline']:
+            save_baseline(options['save_baseline'], summary)
+        if options['baseline']:
+            lines, regressions = compare_with_baseline(
+                summary, load_baseline(options['baseline']), options['max_regression']
+            )
+            self.stdout.write('\n'.join(lines))
+            if regressions:
+                raise CommandError(f"Ухудшение относительно эталона: {', '.join(regressions)}")
+
+    @staticmethod
+    def make_lock_error_counter(stats):
+        def count_lock_error(sender, **kwargs):
+            exc = sys.exc_info()[1]
+            if isinstance(exc, OperationalError) and 'locked' in str(exc):
+                stats.record_lock_error()
+        return count_lock_error
+
+    def start_server(self, options):
+        """Поднимаем сервер в фоновом потоке, возвращаем функцию остановки и адрес"""
+        if options['server'] == 'asgi':
+            try:
+                import uvicorn
+            except ImportError:
+                raise CommandError('Для --server asgi установите uvicorn')
+            from application.asgi import application
+            server = uvicorn.Server(uvicorn.Config(
+                application, host=options['host'], port=options['port'] or 8765, log_level='warning', lifespan='off'
+            ))
+            thread = threading.Thread(target=server.run, daemon=True)
+            thread.start()
+            while not server.started:
+                time.sleep(0.05)
+
+            def stop():
+                server.should_exit = True
+                thread.join()
+            return stop, f"http://{options['host']}:{options['port'] or 8765}"
+
+        from application.wsgi import application
+        httpd = ThreadedWSGIServer((options['host'], options['port']), QuietRequestHandler)
+        httpd.daemon_threads = True
+        httpd.set_app(application)
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            httpd.shutdown()
+            httpd.server_close()
+        return stop, f"http://{options['host']}:{httpd.server_port}"
+
+    def write_summary(self, summary):
+        self.stdout.write(
+            f"Запросов: {summary['requests']} за {summary['elapsed']:.1f} с, "
+            f"{summary['throughput']:.1f} rps, ошибок: {summary['errors']}, "
+            f"блокировок БД: {summary['lock_errors']}"
+        )
+        self.stdout.write(f"{'URL':>16} {'кол-во':>8} {'ошибки':>7} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+        for url_name, row in summary['urls'].items():
+            self.stdout.write(
+                f"{url_name:>16} {row['count']:>8} {row['errors']:>7} "
+                f"{row['p50'] * 1000:>9.1f} {row['p95'] * 1000:>9.1f} {row['p99'] * 1000:>9.1f}"
+            )
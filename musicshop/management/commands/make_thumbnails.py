@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from musicshop.models import ImageGallery
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии изображений галерей по THUMBNAIL_WIDTHS (для загруженных до их появления)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Перестроить копии и у уже обработанных изображений')
+
+    def handle(self, *args, **options):
+        images = ImageGallery.objects.all() if options['force'] else ImageGallery.objects.filter(width__isnull=True)
+        done = failed = 0
+        for image in images.order_by('id').iterator():
+            if image.make_thumbnails(force=options['force']):
+                done += 1
+            else:
+                failed += 1
+                self.stderr.write(f'{image.image.name}: файла нет или это не изображение')
+        self.stdout.write(f'Обработано изображений: {done}, с ошибками: {failed}')
@@ -0,0 +1,59 @@
+import io
+import pstats
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from musicshop.profiling import profile_dir, pstats_to_collapsed
+
+
+class Command(BaseCommand):
+    help = 'Сводка по сохранённым профилям запросов и вывод стеков для flamegraph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', help='Имя URL (например, account или make-order)')
+        parser.add_argument('--limit', type=int, default=25, help='Сколько функций показать')
+        parser.add_argument('--sort', default='cumulative', choices=('cumulative', 'tottime', 'ncalls'))
+        parser.add_argument('--flamegraph', help='Файл для свёрнутых стеков (формат flamegraph.pl/speedscope)')
+
+    def handle(self, *args, **options):
+        directory = profile_dir(options['view'])
+        prof_files = sorted(str(path) for path in directory.rglob('*.prof'))
+        collapsed_files = sorted(directory.rglob('*.collapsed'))
+        if not prof_files and not collapsed_files:
+            raise CommandError(f'В {directory} нет сохранённых профилей')
+
+        stacks = Counter()
+        if prof_files:
+            output = io.StringIO()
+            stats = pstats.Stats(*prof_files, stream=output)
+            stats.sort_stats(options['sort']).print_stats(options['limit'])
+            self.stdout.write(f'Профилей cProfile: {len(prof_files)}')
+            self.stdout.write(output.getvalue())
+            if options['flamegraph']:
+                stacks.update(pstats_to_collapsed(stats))
+        if collapsed_files:
+            sampled = Counter()
+            for path in collapsed_files:
+                with open(path, encoding='utf-8') as collapsed:
+                    for line in collapsed:
+                        stack, _, count = line.rstrip('\n').rpartition(' ')
+                        sampled[stack] += int(count)
+            self.stdout.write(f'Профилей сэмплирования: {len(collapsed_files)}')
+            self.write_top_frames(sampled, options['limit'])
+            stacks.update(sampled)
+
+        if options['flamegraph']:
+            with open(options['flamegraph'], 'w', encoding='utf-8') as output:
+                for stack, count in stacks.most_common():
+                    output.write(f'{stack} {count}\n')
+            self.stdout.write(self.style.SUCCESS(f"Стеки для flamegraph записаны в {options['flamegraph']}"))
+
+    def write_top_frames(self, stacks, limit):
+        """Самые «горячие» функции по собственному времени (верхний кадр стека)"""
+        own = Counter()
+        for stack, count in stacks.items():
+            own[stack.rsplit(';', 1)[-1]] += count
+        total = sum(own.values()) or 1
+        for frame, count in own.most_common(limit):
+            self.stdout.write(f'{count / total:7.1%} {count:8d}  {frame}')
@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from musicshop.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = 'Выдаёт подписанный токен для заголовка профилирования запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Логин сотрудника')
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(username=options['username']).first()
+        if not user:
+            raise CommandError(f"Пользователь {options['username']} не найден")
+        try:
+            self.stdout.write(make_token(user))
+        except ValueError as exc:
+            raise CommandError(exc)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from musicshop.models import Artist, Genre
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики альбомов исполнителей и исполнителей жанров с каталогом и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+        parser.add_argument('--limit', type=int, default=50, help='Сколько расхождений показать')
+
+    def handle(self, *args, **options):
+        artists = list(Artist.objects.stale().values_list(
+            'id', 'name', 'album_count', 'actual_albums', 'in_stock_count', 'actual_in_stock'
+        ))
+        genres = list(Genre.objects.stale().values_list('id', 'name', 'artist_count', 'actual_artists'))
+        for artist_id, name, albums, actual_albums, in_stock, actual_in_stock in artists[:options['limit']]:
+            self.stdout.write(
+                f'Исполнитель {artist_id} ({name}): альбомов {albums} вместо {actual_albums}, '
+                f'в наличии {in_stock} вместо {actual_in_stock}'
+            )
+        for genre_id, name, count, actual in genres[:options['limit']]:
+            self.stdout.write(f'Жанр {genre_id} ({name}): исполнителей {count} вместо {actual}')
+        if not options['dry_run']:
+            Artist.objects.recount([artist[0] for artist in artists])
+            Genre.objects.recount([genre[0] for genre in genres])
+        if artists or genres:
+            verb = 'Найдено' if options['dry_run'] else 'Исправлено'
+            self.stdout.write(self.style.WARNING(f'{verb}: исполнителей {len(artists)}, жанров {len(genres)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Счётчики сходятся с каталогом'))
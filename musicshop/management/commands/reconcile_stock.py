@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from musicshop.models import Order, StockMovement
+
+
+class Command(BaseCommand):
+    help = 'Сверяет списания складского журнала с составом заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Только заказы, созданные с этой даты (ГГГГ-ММ-ДД)')
+        parser.add_argument('--all', action='store_true',
+                            help='Сверять и заказы, оформленные до начала ведения журнала')
+        parser.add_argument('--limit', type=int, default=50, help='Сколько расхождений показать')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if options['since']:
+            orders = orders.filter(created_at__gte=options['since'])
+        if not options['all']:
+            first_recorded = StockMovement.objects.filter(
+                kind=StockMovement.KIND_SALE, order__isnull=False
+            ).order_by('order_id').first()
+            if first_recorded is None:
+                raise CommandError('В журнале ещё нет продаж, для сверки старых заказов укажите --all')
+            orders = orders.filter(id__gte=first_recorded.order_id)
+        mismatches = StockMovement.objects.reconcile(orders)
+        for order_id, album_id, ordered, recorded in mismatches[:options['limit']]:
+            self.stdout.write(f'Заказ {order_id}, альбом {album_id}: заказано {ordered}, списано {recorded}')
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('Журнал сходится с заказами'))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from musicshop.jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди (уведомления, перерасчёт корзин, свёртку склада, письма менеджерам)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и выйти')
+        parser.add_argument('--interval', type=float, default=1, help='Пауза между проверками пустой очереди, с')
+        parser.add_argument('--batch-size', type=int, default=100, help='Сколько задач забирать за раз')
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = run_pending(options['batch_size'])
+            if done or failed:
+                self.stdout.write(f'Выполнено задач: {done}, с ошибкой: {failed}')
+            if options['once']:
+                return
+            # Долгоживущий процесс: соединение с базой проверяем, как в конце запроса
+            close_old_connections()
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,316 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from musicshop.models import (
+    Album, Artist, Cart, CartProduct, CatalogChange, Customer, Genre, MediaType, Member, Notification, Order,
+    StockSnapshot,
+)
+from utils import chunked
+
+User = get_user_model()
+
+MEDIA_TYPE_NAMES = ('CD', 'Виниловая пластинка', 'Кассета')
+FIRST_NAMES = ('Иван', 'Пётр', 'Анна', 'Мария', 'Алексей', 'Ольга', 'Сергей', 'Елена', 'Дмитрий', 'Наталья')
+LAST_NAMES = ('Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов', 'Морозов')
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетических данных магазина для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора случайных чисел')
+        parser.add_argument('--genres', type=int, default=20)
+        parser.add_argument('--artists', type=int, default=500)
+        parser.add_argument('--members', type=int, default=1500)
+        parser.add_argument('--albums', type=int, default=5000)
+        parser.add_argument('--customers', type=int, default=10000)
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--open-carts', type=float, default=0.3, help='Доля покупателей с открытой корзиной')
+        parser.add_argument('--wishlist', type=int, default=3, help='Средний размер списка ожидания')
+        parser.add_argument('--notifications', type=int, default=2, help='Среднее число непрочитанных уведомлений')
+        parser.add_argument('--max-cart-size', type=int, default=100, help='Максимум позиций в корзине')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Показатель распределения Ципфа для альбомов')
+        parser.add_argument('--days', type=int, default=365, help='Глубина истории заказов в днях')
+        parser.add_argument('--end-date', type=lambda value: timezone.datetime.fromisoformat(value).date(),
+                            help='Последняя дата заказов (по умолчанию сегодня)')
+        parser.add_argument('--password', default='password', help='Пароль сгенерированных покупателей')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Размер пачки для bulk_create')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.options = options
+        self.end_date = options['end_date'] or timezone.localdate()
+        self.album_ct = ContentType.objects.get_for_model(Album)
+        started = time.monotonic()
+
+        self.genre_ids = self.step('Жанры', self.create_genres)
+        self.media_type_ids = self.step('Медианосители', self.create_media_types)
+        self.member_ids = self.step('Музыканты', self.create_members)
+        self.artist_ids = self.step('Исполнители', self.create_artists)
+        self.albums = self.step('Альбомы', self.create_albums)
+        self.customer_ids = self.step('Покупатели', self.create_customers)
+        self.prepare_distributions()
+        self.step('Открытые корзины', self.create_open_carts)
+        self.step('Заказы', self.create_orders)
+        self.step('Списки ожидания', self.create_wishlists)
+        self.step('Уведомления', self.create_notifications)
+        self.step('Счётчики каталога', self.update_catalog)
+        self.reset_sequences()
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.monotonic() - started:.1f} с.'))
+
+    def step(self, title, func):
+        started = time.monotonic()
+        result = func()
+        self.stdout.write(f'{title}: {time.monotonic() - started:.1f} с.')
+        return result
+
+    @staticmethod
+    def next_id(model):
+        return (model.objects.aggregate(models.Max('pk'))['pk__max'] or 0) + 1
+
+    def bulk_create(self, model, objects):
+        for chunk in chunked(objects, self.chunk_size):
+            model.objects.bulk_create(chunk, batch_size=self.chunk_size)
+
+    def update_catalog(self):
+        """bulk_create обходит сигналы: счётчики каталога и журнал изменений для снимков ведём сами"""
+        Genre.objects.recount()
+        Artist.objects.recount()
+        CatalogChange.objects.record(Album)
+
+    @staticmethod
+    def reset_sequences():
+        """Первичные ключи выдаём сами, поэтому синхронизируем последовательности (нужно для PostgreSQL)"""
+        sql = connection.ops.sequence_reset_sql(no_style(), [
+            Genre, Member, Artist, Album, User, Customer, Cart, CartProduct, Order, Notification
+        ])
+        with connection.cursor() as cursor:
+            for statement in sql:
+                cursor.execute(statement)
+
+    @staticmethod
+    def zipf_weights(count, exponent):
+        """Накопленные веса для выбора по закону Ципфа"""
+        return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+    def heavy_tail(self, mean, limit):
+        """Размер с тяжёлым хвостом (Парето), обрезанный сверху"""
+        alpha = mean / (mean - 1) if mean > 1 else 3
+        return min(limit, int(self.rng.paretovariate(alpha)))
+
+    def create_genres(self):
+        start = self.next_id(Genre)
+        ids = range(start, start + self.options['genres'])
+        self.bulk_create(Genre, (Genre(id=pk, name=f'Жанр {pk}', slug=f'seed-genre-{pk}') for pk in ids))
+        return list(ids)
+
+    def create_media_types(self):
+        for name in MEDIA_TYPE_NAMES:
+            MediaType.objects.get_or_create(name=name)
+        return list(MediaType.objects.order_by('pk').values_list('pk', flat=True))
+
+    def create_members(self):
+        start = self.next_id(Member)
+        ids = range(start, start + self.options['members'])
+        self.bulk_create(Member, (Member(id=pk, name=f'Музыкант {pk}', slug=f'seed-member-{pk}') for pk in ids))
+        return list(ids)
+
+    def create_artists(self):
+        start = self.next_id(Artist)
+        ids = range(start, start + self.options['artists'])
+        genre_weights = self.zipf_weights(len(self.genre_ids), self.options['zipf'])
+        genres = self.rng.choices(self.genre_ids, cum_weights=genre_weights, k=len(ids))
+        self.bulk_create(Artist, (
+            Artist(id=pk, name=f'Исполнитель {pk}', slug=f'seed-artist-{pk}', genre_id=genre_id)
+            for pk, genre_id in zip(ids, genres)
+        ))
+        through = Artist.members.through
+        self.bulk_create(through, (
+            through(artist_id=artist_id, member_id=member_id)
+            for artist_id in ids
+            for member_id in self.rng.sample(self.member_ids, min(len(self.member_ids), self.rng.randint(1, 5)))
+        ))
+        return list(ids)
+
+    def create_albums(self):
+        start = self.next_id(Album)
+        ids = range(start, start + self.options['albums'])
+        images = self.placeholder_images()
+        albums = {}
+        objects = []
+        for pk in ids:
+            stock = 0 if self.rng.random() < 0.1 else self.rng.randint(1, 50)
+            price = Decimal(self.rng.randrange(500, 5000)).quantize(Decimal('1.00'))
+            artist_id = self.rng.choice(self.artist_ids)
+            albums[pk] = {'price': price, 'stock': stock, 'artist_id': artist_id}
+            objects.append(Album(
+                id=pk,
+                artist_id=artist_id,
+                name=f'Альбом {pk}',
+                media_type_id=self.rng.choice(self.media_type_ids),
+                song_list='\n'.join(f'Трек {number}' for number in range(1, self.rng.randint(8, 16))),
+                release_date=self.end_date - timedelta(days=self.rng.randint(0, 365 * 40)),
+                slug=f'seed-album-{pk}',
+                stock=stock,
+                price=price,
+                image=images[pk % len(images)],
+            ))
+        self.bulk_create(Album, objects)
+        # Исходные остатки — снимки складского журнала, заказы генерируются как история до его ведения
+        self.bulk_create(StockSnapshot, (
+            StockSnapshot(album_id=pk, stock=album['stock']) for pk, album in albums.items()
+        ))
+        return albums
+
+    @staticmethod
+    def placeholder_images():
+        media_root = Path(settings.MEDIA_ROOT)
+        images = sorted(
+            str(path.relative_to(media_root)) for path in media_root.glob('images/albumuploads/*/*') if path.is_file()
+        )
+        return images or ['images/placeholder.jpg']
+
+    def prepare_distributions(self):
+        """Популярность альбомов и активность покупателей по закону Ципфа"""
+        album_ids = list(self.albums)
+        self.rng.shuffle(album_ids)
+        self.album_ids = album_ids
+        self.album_weights = self.zipf_weights(len(album_ids), self.options['zipf'])
+        customer_ids = list(self.customer_ids)
+        self.rng.shuffle(customer_ids)
+        self.ranked_customer_ids = customer_ids
+        self.customer_weights = self.zipf_weights(len(customer_ids), 0.8)
+
+    def create_customers(self):
+        password = make_password(self.options['password'])
+        user_start = self.next_id(User)
+        customer_start = self.next_id(Customer)
+        count = self.options['customers']
+        self.bulk_create(User, (
+            User(id=user_start + offset, username=f'seed-user-{user_start + offset}', password=password,
+                 email=f'seed-user-{user_start + offset}@example.com',
+                 first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES))
+            for offset in range(count)
+        ))
+        self.bulk_create(Customer, (
+            Customer(id=customer_start + offset, user_id=user_start + offset,
+                     phone=f'+7{self.rng.randrange(10 ** 9, 10 ** 10)}', address=f'ул. Тестовая, {offset + 1}')
+            for offset in range(count)
+        ))
+        return list(range(customer_start, customer_start + count))
+
+    def cart_lines(self):
+        size = self.heavy_tail(2, self.options['max_cart_size'])
+        album_ids = set(self.rng.choices(self.album_ids, cum_weights=self.album_weights, k=size))
+        return [(album_id, self.heavy_tail(1.3, 10)) for album_id in album_ids]
+
+    def fill_carts(self, carts, cart_product_start):
+        """Создаём корзины, их позиции и связи many-to-many одним проходом"""
+        cart_objects, products, links = [], [], []
+        cart_product_id = cart_product_start
+        for cart_id, customer_id, in_order in carts:
+            total = Decimal('0')
+            lines = self.cart_lines()
+            for album_id, qty in lines:
+                final_price = self.albums[album_id]['price'] * qty
+                total += final_price
+                products.append(CartProduct(
+                    id=cart_product_id, user_id=customer_id, cart_id=cart_id, content_type_id=self.album_ct.id,
+                    object_id=album_id, qty=qty, final_price=final_price,
+                ))
+                links.append(Cart.products.through(cart_id=cart_id, cartproduct_id=cart_product_id))
+                cart_product_id += 1
+            cart_objects.append(Cart(
+                id=cart_id, owner_id=customer_id, total_products=len(lines), final_price=total, in_order=in_order
+            ))
+        Cart.objects.bulk_create(cart_objects, batch_size=self.chunk_size)
+        self.bulk_create(CartProduct, products)
+        self.bulk_create(Cart.products.through, links)
+        return cart_product_id
+
+    def create_open_carts(self):
+        customers = [
+            customer_id for customer_id in self.customer_ids if self.rng.random() < self.options['open_carts']
+        ]
+        cart_start = self.next_id(Cart)
+        carts = [(cart_start + offset, customer_id, False) for offset, customer_id in enumerate(customers)]
+        with transaction.atomic():
+            self.fill_carts(carts, self.next_id(CartProduct))
+
+    def create_orders(self):
+        cart_id = self.next_id(Cart)
+        order_id = self.next_id(Order)
+        cart_product_id = self.next_id(CartProduct)
+        for chunk in chunked(range(self.options['orders']), self.chunk_size):
+            customers = self.rng.choices(self.ranked_customer_ids, cum_weights=self.customer_weights, k=len(chunk))
+            carts, orders = [], []
+            for customer_id in customers:
+                order_date = self.end_date - timedelta(
+                    days=min(self.options['days'], int(self.rng.expovariate(3 / self.options['days'])))
+                )
+                if (self.end_date - order_date).days > 14:
+                    status = Order.STATUS_COMPLETED
+                else:
+                    status = self.rng.choice([choice for choice, _ in Order.STATUS_CHOICES])
+                carts.append((cart_id, customer_id, True))
+                orders.append(Order(
+                    id=order_id, customer_id=customer_id, cart_id=cart_id,
+                    first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+                    phone=f'+7{self.rng.randrange(10 ** 9, 10 ** 10)}', address='ул. Тестовая, 1',
+                    status=status, order_date=order_date,
+                    buying_type=self.rng.choice([choice for choice, _ in Order.BUYING_TYPE_CHOICES]),
+                ))
+                cart_id += 1
+                order_id += 1
+            with transaction.atomic():
+                cart_product_id = self.fill_carts(carts, cart_product_id)
+                Order.objects.bulk_create(orders, batch_size=self.chunk_size)
+
+    def create_wishlists(self):
+        out_of_stock = [album_id for album_id, album in self.albums.items() if not album['stock']] or self.album_ids
+        through = Customer.wishlist.through
+        self.bulk_create(through, (
+            through(customer_id=customer_id, album_id=album_id)
+            for customer_id in self.customer_ids
+            for album_id in set(self.rng.choices(
+                out_of_stock, k=self.heavy_tail(self.options['wishlist'], len(out_of_stock))
+            ))
+        ))
+
+    def create_notifications(self):
+        urls = {}
+
+        def album_url(album_id):
+            if album_id not in urls:
+                urls[album_id] = reverse('album_detail', kwargs={
+                    'artist_slug': f"seed-artist-{self.albums[album_id]['artist_id']}",
+                    'album_slug': f'seed-album-{album_id}',
+                })
+            return urls[album_id]
+
+        self.bulk_create(Notification, (
+            Notification(
+                recipient_id=customer_id,
+                text=f'Позиция <a href="{album_url(album_id)}">Альбом {album_id}</a>, которую Вы ожидаете, '
+                     f'есть в наличии.',
+            )
+            for customer_id in self.customer_ids
+            for album_id in self.rng.sample(
+                self.album_ids, min(len(self.album_ids), self.heavy_tail(self.options['notifications'], 20) - 1)
+            )
+        ))
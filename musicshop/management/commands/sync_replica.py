@@ -0,0 +1,33 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную SQLite-базу в файлы реплик (локальная замена репликации)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='Реплики из DATABASE_REPLICAS; по умолчанию все')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError('Реплики не настроены, задайте MUSICSHOP_DB_REPLICAS')
+        primary = connections[DEFAULT_DB_ALIAS]
+        for alias in aliases:
+            if alias not in settings.DATABASE_REPLICAS:
+                raise CommandError(f'{alias} нет в DATABASE_REPLICAS')
+            if connections[alias].vendor != 'sqlite' or primary.vendor != 'sqlite':
+                raise CommandError('Копирование поддерживается только для SQLite, для других СУБД настройте репликацию')
+        primary.ensure_connection()
+        for alias in aliases:
+            started = time.monotonic()
+            connections[alias].close()
+            # Онлайн-копия: запись в основную базу на время копирования не останавливается
+            with sqlite3.connect(connections[alias].settings_dict['NAME']) as replica:
+                primary.connection.backup(replica)
+            replica.close()
+            self.stdout.write(f'{alias}: скопировано за {time.monotonic() - started:.1f} с.')
@@ -0,0 +1,33 @@
+from django.contrib.contenttypes.models import ContentType
+from django.utils.functional import cached_property
+
+from .models import Album, Customer
+
+
+class ProductMembership:
+    """Какие альбомы уже в корзине и в листе ожидания: один запрос id на каждый список за запрос страницы"""
+
+    def __init__(self, cart, user):
+        self._cart = cart
+        self._user = user
+
+    @cached_property
+    def cart(self):
+        """id альбомов в корзине"""
+        if self._cart is None:
+            return set()
+        album_ct = ContentType.objects.get_for_model(Album)
+        return set(self._cart.products.filter(content_type=album_ct).values_list('object_id', flat=True))
+
+    @cached_property
+    def wishlist(self):
+        """id альбомов в листе ожидания"""
+        if not self._user.is_authenticated:
+            return set()
+        return set(
+            Customer.wishlist.through.objects.filter(customer__user=self._user).values_list('album_id', flat=True)
+        )
+
+    def load(self):
+        """Загружаем оба списка заранее (для async-представлений, где шаблон рендерится отдельно)"""
+        return self.cart, self.wishlist
@@ -0,0 +1,93 @@
+import re
+import threading
+from bisect import bisect_left
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRICS = {
+    'request_duration_seconds': ('Время обработки запроса', TIME_BUCKETS),
+    'sql_queries': ('Число SQL-запросов на запрос', QUERY_BUCKETS),
+    'sql_duration_seconds': ('Суммарное время SQL-запросов', TIME_BUCKETS),
+    'template_render_seconds': ('Время рендеринга шаблонов', TIME_BUCKETS),
+    'response_size_bytes': ('Размер ответа', SIZE_BUCKETS),
+}
+
+SQL_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+SQL_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+SQL_LIST_RE = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+SQL_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Приводим SQL к шаблону: литералы и списки параметров заменяем заглушками"""
+    sql = SQL_STRING_RE.sub('?', sql)
+    sql = SQL_NUMBER_RE.sub('?', sql)
+    sql = SQL_LIST_RE.sub('(...)', sql)
+    return SQL_SPACE_RE.sub(' ', sql).strip()
+
+
+class Histogram:
+    """Гистограмма с накопительными корзинами в формате Prometheus"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{bound:g}', cumulative
+        yield '+Inf', self.count
+
+
+class MetricsRegistry:
+    """Метрики запросов в памяти процесса, сгруппированные по имени URL"""
+
+    prefix = 'musicshop_'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, view_name, **values):
+        with self.lock:
+            for metric, value in values.items():
+                key = (metric, view_name)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(METRICS[metric][1])
+                self.histograms[key].observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def render(self):
+        """Текстовый формат экспозиции Prometheus"""
+        lines = []
+        with self.lock:
+            for metric, (description, _) in METRICS.items():
+                name = self.prefix + metric
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for (key, view_name), histogram in sorted(self.histograms.items()):
+                    if key != metric:
+                        continue
+                    label = view_name.replace('\\', '\\\\').replace('"', '\\"')
+                    for bound, value in histogram.samples():
+                        lines.append(f'{name}_bucket{{view="{label}",le="{bound}"}} {value}')
+                    lines.append(f'{name}_sum{{view="{label}"}} {histogram.sum:g}')
+                    lines.append(f'{name}_count{{view="{label}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
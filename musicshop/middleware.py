@@ -0,0 +1,254 @@
+import cProfile
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template
+from django.utils.cache import has_vary_header, patch_cache_control
+
+from .db_router import replica_reads, replicas
+from .metrics import normalize_sql, registry
+from .profiling import StackSampler, check_token, profile_path
+
+slow_query_logger = logging.getLogger('musicshop.slow_queries')
+
+_request_stats = ContextVar('request_stats', default=None)
+
+
+def _timed_render(render):
+    """Учитываем время только внешнего рендеринга, вложенные шаблоны (crispy и т.п.) уже входят в него"""
+
+    def wrapper(self, *args, **kwargs):
+        stats = _request_stats.get()
+        if stats is None or stats['render_depth']:
+            return render(self, *args, **kwargs)
+        stats['render_depth'] += 1
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            stats['template_time'] += time.perf_counter() - started
+            stats['render_depth'] -= 1
+
+    wrapper.is_timed = True
+    return wrapper
+
+
+if not getattr(Template.render, 'is_timed', False):
+    Template.render = _timed_render(Template.render)
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """Учитываем SQL в метриках текущего запроса, если он есть"""
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        stats['queries'] += 1
+        stats['sql_time'] += duration
+        if duration >= stats['slow_query_threshold']:
+            slow_query_logger.warning(
+                '%.1f ms view=%s sql=%s', duration * 1000, PerformanceMiddleware.view_name(stats['request']),
+                normalize_sql(sql),
+            )
+
+
+def install_sql_wrapper(connection, **kwargs):
+    """Обёртка на каждом соединении: db_read и sync_to_async ходят в БД из других потоков со своими соединениями.
+
+    Метрики запроса лежат в контекстной переменной, а её копию получают и эти потоки.
+    """
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+connection_created.connect(install_sql_wrapper)
+
+
+class AsyncCapableMiddleware:
+    """Middleware и для WSGI, и для ASGI: под ASGI цепочка остаётся асинхронной и не занимает поток на запрос"""
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        raise NotImplementedError
+
+    async def __acall__(self, request):
+        raise NotImplementedError
+
+
+class PerformanceMiddleware(AsyncCapableMiddleware):
+    """Метрики запросов по имени URL: время, SQL, рендеринг шаблонов и размер ответа"""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.slow_query_threshold = getattr(settings, 'PERFORMANCE_SLOW_QUERY_MS', 100) / 1000
+        # Соединения этого потока могли открыться раньше, чем загрузился модуль
+        for connection in connections.all():
+            install_sql_wrapper(connection)
+
+    def handle(self, request):
+        with self.measure(request) as stats:
+            stats['response'] = self.get_response(request)
+        return stats['response']
+
+    async def __acall__(self, request):
+        with self.measure(request) as stats:
+            stats['response'] = await self.get_response(request)
+        return stats['response']
+
+    @contextmanager
+    def measure(self, request):
+        stats = {
+            'queries': 0, 'sql_time': 0, 'template_time': 0, 'render_depth': 0, 'request': request,
+            'slow_query_threshold': self.slow_query_threshold,
+        }
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            _request_stats.reset(token)
+        response = stats['response']
+        registry.observe(
+            self.view_name(request),
+            request_duration_seconds=time.perf_counter() - started,
+            sql_queries=stats['queries'],
+            sql_duration_seconds=stats['sql_time'],
+            template_render_seconds=stats['template_time'],
+            response_size_bytes=0 if response.streaming else len(response.content),
+        )
+
+    @staticmethod
+    def view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match and match.url_name else 'unresolved'
+
+
+class ProfilingMiddleware(AsyncCapableMiddleware):
+    """Профилирование части запросов или запросов с подписанным заголовком сотрудника"""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        self.mode = getattr(settings, 'PROFILING_MODE', 'cprofile')
+        self.header = 'HTTP_' + getattr(settings, 'PROFILING_HEADER', 'X-Profile').upper().replace('-', '_')
+
+    def should_profile(self, request):
+        token = request.META.get(self.header)
+        if token:
+            return check_token(token)
+        return self.sample_rate and random.random() < self.sample_rate
+
+    def handle(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        with self.profile(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not self.should_profile(request):
+            return await self.get_response(request)
+        # Под ASGI в профиль попадают и другие задачи цикла событий, выполнявшиеся в это время
+        with self.profile(request):
+            return await self.get_response(request)
+
+    @contextmanager
+    def profile(self, request):
+        if self.mode == 'sampling':
+            sampler = StackSampler(getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.005))
+            sampler.start()
+            try:
+                yield
+            finally:
+                sampler.stop()
+            sampler.dump(profile_path(PerformanceMiddleware.view_name(request), 'collapsed'))
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(profile_path(PerformanceMiddleware.view_name(request), 'prof'))
+
+
+class ReplicaPinningMiddleware(AsyncCapableMiddleware):
+    """Каталог читаем с реплик; после записи — с основной, после правки каталога ещё REPLICA_PIN_SECONDS секунд"""
+
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.cookie_name = getattr(settings, 'REPLICA_PIN_COOKIE', 'pin_primary')
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+    def handle(self, request):
+        if not replicas():
+            return self.get_response(request)
+        with replica_reads(self.pinned(request)) as state:
+            response = self.get_response(request)
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        if not replicas():
+            return await self.get_response(request)
+        # Потоки db_read получают копию контекста, а с ней и состояние запроса
+        with replica_reads(self.pinned(request)) as state:
+            response = await self.get_response(request)
+        return self.pin(response, state)
+
+    def pinned(self, request):
+        # Реплика может отставать: сразу после своей записи (редирект после POST) покупатель читает основную базу
+        return request.method not in self.safe_methods or self.cookie_name in request.COOKIES
+
+    def pin(self, response, state):
+        if state['catalog_changed']:
+            response.set_cookie(self.cookie_name, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
+
+
+class SharedCacheMiddleware(AsyncCapableMiddleware):
+    """Общие страницы каталога (request.shared_page) разрешаем хранить обратному прокси: nginx, Varnish"""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.max_age = getattr(settings, 'SHARED_CACHE_MAX_AGE', 60)
+
+    def handle(self, request):
+        return self.mark_shared(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.mark_shared(request, await self.get_response(request))
+
+    def mark_shared(self, request, response):
+        if getattr(request, 'shared_page', False) and response.status_code in (200, 304) and not self.personal(response):
+            # Прокси отдаёт копию max_age секунд, браузер каждый раз сверяет её по ETag
+            patch_cache_control(response, public=True, max_age=0, s_maxage=self.max_age)
+        return response
+
+    @staticmethod
+    def personal(response):
+        """Страница всё же прочитала сессию или ставит cookie: делиться таким ответом нельзя"""
+        return bool(response.cookies) or has_vary_header(response, 'Cookie')
@@ -0,0 +1,59 @@
+# Generated by Django 4.0 on 2026-10-19 11:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def snapshot_existing_stock(apps, schema_editor):
+    """Текущие остатки становятся исходными снимками журнала"""
+    Album = apps.get_model('musicshop', 'Album')
+    StockSnapshot = apps.get_model('musicshop', 'StockSnapshot')
+    albums = Album.objects.values_list('id', 'stock').iterator()
+    StockSnapshot.objects.bulk_create(
+        (StockSnapshot(album_id=album_id, stock=stock, movement_id=0) for album_id, stock in albums), batch_size=5000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicshop', '0005_remove_cart_for_anonymous_user_cart_session_key_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField(verbose_name='Остаток')),
+                ('movement_id', models.BigIntegerField(default=0, verbose_name='Последнее учтённое движение')),
+                ('created_at', models.DateTimeField(auto_now=True, verbose_name='Время снимка')),
+                ('album', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshot', to='musicshop.album', verbose_name='Альбом')),
+            ],
+            options={
+                'verbose_name': 'Снимок остатка',
+                'verbose_name_plural': 'Снимки остатков',
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale', 'Продажа'), ('restock', 'Поступление'), ('adjustment', 'Корректировка'), ('return', 'Возврат')], max_length=20, verbose_name='Тип движения')),
+                ('delta', models.IntegerField(verbose_name='Изменение остатка')),
+                ('comment', models.CharField(blank=True, max_length=255, verbose_name='Комментарий')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время')),
+                ('album', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='musicshop.album', verbose_name='Альбом')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='musicshop.order', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Движение товара',
+                'verbose_name_plural': 'Движения товара',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['album', 'id'], name='musicshop_s_album_i_a2b146_idx'),
+        ),
+        migrations.RunPython(snapshot_existing_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.0 on 2026-10-19 11:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('musicshop', '0006_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCart',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('total_products', models.IntegerField(default=0, verbose_name='Общее кол-во товара')),
+                ('final_price', models.DecimalField(blank=True, decimal_places=2, max_digits=9, null=True, verbose_name='Общая цена')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='musicshop.customer', verbose_name='Покупатель')),
+            ],
+            options={
+                'verbose_name': 'Архивная корзина',
+                'verbose_name_plural': 'Архивные корзины',
+            },
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='order',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='musicshop.order', verbose_name='Заказ'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('first_name', models.CharField(max_length=255, verbose_name='Имя')),
+                ('last_name', models.CharField(max_length=255, verbose_name='Фамилия')),
+                ('phone', models.CharField(max_length=20, verbose_name='Телефон')),
+                ('address', models.CharField(blank=True, max_length=1024, null=True, verbose_name='Адрес')),
+                ('status', models.CharField(choices=[('new', 'Новый заказ'), ('in_progress', 'Заказ в обработке'), ('is_ready', 'Заказ готов'), ('completed', 'Заказ получен покупателем')], max_length=100, verbose_name='Статус заказа')),
+                ('buying_type', models.CharField(choices=[('self', 'Самовывоз'), ('delivery', 'Доставка')], max_length=100, verbose_name='Тип заказа')),
+                ('comment', models.TextField(blank=True, null=True, verbose_name='Комментарий к заказу')),
+                ('created_at', models.DateField(verbose_name='Дата создания заказа')),
+                ('order_date', models.DateField(db_index=True, verbose_name='Дата получения заказа')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Перенесён в архив')),
+                ('cart', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='musicshop.archivedcart', verbose_name='Корзина')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='musicshop.customer', verbose_name='Покупатель')),
+            ],
+            options={
+                'verbose_name': 'Архивный заказ',
+                'verbose_name_plural': 'Архивные заказы',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedCartProduct',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('object_id', models.PositiveIntegerField()),
+                ('qty', models.PositiveIntegerField(default=1)),
+                ('final_price', models.DecimalField(decimal_places=2, max_digits=9, verbose_name='Общая цена')),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='products', to='musicshop.archivedcart', verbose_name='Корзина')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'Продукт архивной корзины',
+                'verbose_name_plural': 'Продукты архивных корзин',
+            },
+        ),
+    ]
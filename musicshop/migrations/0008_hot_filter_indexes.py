@@ -0,0 +1,39 @@
+# Generated by Django 4.0 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicshop', '0007_order_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cart',
+            name='session_key',
+            field=models.CharField(blank=True, max_length=40, null=True, verbose_name='Ключ сессии'),
+        ),
+        migrations.AlterField(
+            model_name='cartproduct',
+            name='session_key',
+            field=models.CharField(blank=True, max_length=40, null=True, verbose_name='Ключ сессии'),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(condition=models.Q(('in_order', False)), fields=['owner', 'id'], name='cart_open_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cartproduct',
+            index=models.Index(fields=['cart', 'content_type', 'object_id'], name='cartproduct_cart_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('read', False)), fields=['recipient'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_date', 'cart'], name='order_date_cart_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0 on 2026-10-19 12:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicshop', '0009_catalog_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagegallery',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imagegallery',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='imagegallery',
+            index=models.Index(fields=['content_type', 'object_id'], name='gallery_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagegallery',
+            index=models.Index(condition=models.Q(('use_in_slider', True)), fields=['-id'], name='gallery_slider_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.0 on 2026-10-19 12:29
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_existing(apps, schema_editor):
+    """Заполняем счётчики по текущему каталогу"""
+    Album = apps.get_model('musicshop', 'Album')
+    Artist = apps.get_model('musicshop', 'Artist')
+    Genre = apps.get_model('musicshop', 'Genre')
+
+    def count(queryset):
+        return Coalesce(models.Subquery(queryset.annotate(count=models.Count('id')).values('count')), 0)
+
+    albums = Album.objects.filter(artist=models.OuterRef('pk')).order_by().values('artist')
+    Artist.objects.update(album_count=count(albums), in_stock_count=count(albums.filter(stock__gt=0)))
+    artists = Artist.objects.filter(genre=models.OuterRef('pk')).order_by().values('genre')
+    Genre.objects.update(artist_count=count(artists))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicshop', '0010_gallery_thumbnails_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artist',
+            name='album_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Альбомов'),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='in_stock_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Альбомов в наличии'),
+        ),
+        migrations.AddField(
+            model_name='genre',
+            name='artist_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Исполнителей'),
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
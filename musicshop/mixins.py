@@ -1,28 +1,73 @@
+import hashlib
 import uuid
 
 from django import views
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 
-from .models import Cart, Customer, Notification
+from .catalog import get_snapshot
+from .membership import ProductMembership
+from .models import Album, Artist, Cart, Customer, Notification
+from .ratelimit import throttle
 
 
-class NotificationMixin(views.generic.detail.SingleObjectMixin):
+class NotificationMixin:
 
     @staticmethod
     def notifications(user):
         if user.is_authenticated:
+            if settings.LIVE_NOTIFICATIONS:
+                # Уведомления придут через SSE-поток, запрос на каждой странице не нужен
+                return None
             return Notification.objects.all(recipient=user.customer)
         return Notification.objects.none()
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['notifications'] = self.notifications(self.request.user)
-        return context
+    @staticmethod
+    def unread(request):
+        """Непрочитанные уведомления запроса, выбранные один раз: их делят шапка и валидатор страницы"""
+        if not hasattr(request, 'unread_notifications'):
+            notifications = NotificationMixin.notifications(request.user)
+            if notifications is not None:
+                # Счётчик и список в шапке читаются из кэша queryset
+                len(notifications)
+            request.unread_notifications = notifications
+        return request.unread_notifications
+
 
+class SharedPageMixin:
+    """Страница каталога, которая в режиме SHARED_CACHE_PAGES одна для всех и хранится в общем кэше прокси"""
 
-class CartMixin(views.generic.detail.SingleObjectMixin, views.View):
+    shared = False
+
+    def share_page(self, request):
+        """Общую страницу рендерим для гостя с пустой корзиной: без корзины, сессии и пользователя запроса"""
+        request.shared_page = self.shared and settings.SHARED_CACHE_PAGES
+        if request.shared_page:
+            self.cart = None
+            self.membership = ProductMembership(None, AnonymousUser())
+        return request.shared_page
+
+
+class CartMixin(SharedPageMixin, views.generic.detail.SingleObjectMixin, views.View):
 
     def dispatch(self, request, *args, **kwargs):
-        cart = None
+        if not self.share_page(request):
+            self.cart = self.get_cart(request)
+            self.membership = ProductMembership(self.cart, request.user)
+        return super().dispatch(request, *args, **kwargs)
+
+    @staticmethod
+    def get_cart(request):
+        """Корзина запроса: ищем (или создаём) один раз, дальше её же отдаём представлению и шапке"""
+        if not hasattr(request, 'cart'):
+            request.cart = CartMixin.find_cart(request)
+        return request.cart
+
+    @staticmethod
+    def find_cart(request):
         if request.user.is_authenticated and not request.user.is_superuser:
             customer = Customer.objects.filter(user=request.user).first()
             if not customer:
@@ -32,26 +77,120 @@ class CartMixin(views.generic.detail.SingleObjectMixin, views.View):
             cart = Cart.objects.filter(owner=customer, in_order=False).first()
             if not cart:
                 cart = Cart.objects.create(owner=customer)
-            self.cart = cart
-        else:
-            if not request.session.get('cart_id'):
-                cart = Cart.objects.create(
-                    session_key=uuid.uuid4()
-                )
-                request.session['cart_id'] = cart.id
-                self.cart = cart
-            else:
-                try:
-                    cart = Cart.objects.get(id=request.session['cart_id'])
-                except Cart.DoesNotExist:
-                    cart = Cart.objects.create(
-                        session_key=uuid.uuid4()
-                    )
-                self.cart = cart
-
-        return super().dispatch(request, *args, **kwargs)
+            return cart
+        if not request.session.get('cart_id'):
+            cart = Cart.objects.create(
+                session_key=uuid.uuid4()
+            )
+            request.session['cart_id'] = cart.id
+            return cart
+        try:
+            return Cart.objects.get(id=request.session['cart_id'])
+        except Cart.DoesNotExist:
+            return Cart.objects.create(
+                session_key=uuid.uuid4()
+            )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['cart'] = self.cart
+        context['membership'] = self.membership
         return context
+
+
+class RateLimitMixin:
+    """Лимит запросов группы rate_limit_group (RATE_LIMITS): 429 раньше загрузки корзины и любых запросов к базе"""
+
+    rate_limit_group = None
+
+    def dispatch(self, request, *args, **kwargs):
+        response = throttle(request, self.rate_limit_group)
+        if response is not None:
+            return response
+        return super().dispatch(request, *args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """Отвечаем 304 на If-None-Match/If-Modified-Since до тяжёлых запросов и рендеринга страницы каталога"""
+
+    etag = last_modified = None
+
+    def get_validator(self):
+        """(время последнего изменения данных каталога на странице, личное состояние) или None, если объекта нет"""
+        raise NotImplementedError
+
+    def personal_state(self):
+        """Личное в шапке: None, если страница такая же, как у любого гостя с пустой корзиной"""
+        if self.request.shared_page:
+            return None
+        user = self.request.user
+        if not user.is_authenticated and not self.cart.total_products:
+            return None
+        state = [user.pk, self.cart.id, self.cart.total_products]
+        if user.is_authenticated and not settings.LIVE_NOTIFICATIONS:
+            state += [notification.id for notification in NotificationMixin.unread(self.request)]
+        return state
+
+    def not_modified(self):
+        """Ответ 304, если у клиента актуальная версия страницы; валидаторы запоминаем для ответа"""
+        validator = self.get_validator()
+        if validator is None:
+            return None
+        updated_at, personal = validator
+        digest = hashlib.md5(f'{updated_at.isoformat()}|{personal}'.encode(), usedforsecurity=False).hexdigest()
+        self.etag = f'W/"{digest}"'
+        # Время изменения не учитывает корзину и уведомления, поэтому оно валидно только для «общих» страниц
+        self.last_modified = int(updated_at.timestamp()) if personal is None else None
+        return get_conditional_response(self.request, etag=self.etag, last_modified=self.last_modified)
+
+    def add_validators(self, response):
+        if self.etag and response.status_code in (200, 304):
+            response.headers['ETag'] = self.etag
+            if self.last_modified:
+                response.headers['Last-Modified'] = http_date(self.last_modified)
+            if not self.request.shared_page:
+                # В странице шапка покупателя: хранить её может только браузер, и каждый раз с проверкой
+                patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get(self, request, *args, **kwargs):
+        return self.add_validators(self.not_modified() or super().get(request, *args, **kwargs))
+
+
+class ArtistValidatorMixin:
+    """Валидатор страницы исполнителя: его updated_at (правки состава, жанра, галереи) и альбомы дискографии"""
+
+    def get_validator(self):
+        snapshot = get_snapshot()
+        updated_at = snapshot.artist_updated_at(self.kwargs['artist_slug']) if snapshot else None
+        if updated_at is None:
+            # Без снимка или исполнителя в нём ещё нет
+            row = Artist.objects.filter(slug=self.kwargs['artist_slug']).annotate(
+                albums_updated_at=Max('album__updated_at'),
+            ).values_list('updated_at', 'albums_updated_at').first()
+            if row is None:
+                return None
+            updated_at = max(updated_at for updated_at in row if updated_at)
+        return updated_at, self.personal_state()
+
+
+class AlbumValidatorMixin:
+    """Валидатор страницы альбома: альбом, его исполнитель и кнопки корзины и листа ожидания"""
+
+    def get_validator(self):
+        snapshot = get_snapshot()
+        album = snapshot.album_by_slug(self.kwargs['album_slug']) if snapshot else None
+        if album is not None:
+            row = album.id, album.stock, album.updated_at, album.artist.updated_at
+        else:
+            row = Album.objects.filter(slug=self.kwargs['album_slug']).values_list(
+                'id', 'stock', 'updated_at', 'artist__updated_at'
+            ).first()
+        if row is None:
+            return None
+        album_id, stock, *updated_at = row
+        personal = self.personal_state()
+        if personal is not None:
+            # Как в шаблоне: в наличии — кнопка корзины, нет — кнопка листа ожидания
+            personal.append(album_id in (self.membership.cart if stock else self.membership.wishlist))
+        return max(updated_at), personal
@@ -1,18 +1,22 @@
 import operator
+from itertools import chain
 from calendar import monthrange
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from django.conf import settings
 
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
-from django.db import connection, models
-from django.db.models.signals import post_save, pre_save
+from django.db import connection, models, transaction
+from django.db.models import prefetch_related_objects
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.safestring import mark_safe
 
-from utils import upload_function
+from utils import chunked, make_thumbnails, thumbnail_name, upload_function
+from .notifications import publish, publish_notifications
 
 
 class MediaType(models.Model):
@@ -43,11 +47,33 @@ class Member(models.Model):
         verbose_name_plural = 'Музыканты'
 
 
+class GenreManager(models.Manager):
+    """Менеджер жанров"""
+
+    def recount(self, genre_ids=None):
+        """Пересчитываем счётчики исполнителей одним UPDATE: для genre_ids или для всех жанров"""
+        artists = Artist.objects.filter(genre=models.OuterRef('pk')).order_by().values('genre')
+        queryset = self.get_queryset() if genre_ids is None else self.get_queryset().filter(id__in=genre_ids)
+        CatalogChange.objects.record(Genre, genre_ids)
+        return queryset.update(
+            artist_count=Coalesce(models.Subquery(artists.annotate(count=models.Count('id')).values('count')), 0),
+        )
+
+    def stale(self):
+        """Жанры, у которых счётчик разошёлся с данными"""
+        return self.get_queryset().annotate(actual_artists=models.Count('artist')).exclude(
+            artist_count=models.F('actual_artists')
+        )
+
+
 class Genre(models.Model):
     """Музыкальный жанр"""
 
     name = models.CharField(max_length=50, verbose_name='Название жанра')
     slug = models.SlugField()
+    # Счётчики ведут сигналы, импорт и свёртка склада; сверка — manage.py reconcile_counters
+    artist_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Исполнителей')
+    objects = GenreManager()
 
     def __str__(self):
         return self.name
@@ -57,6 +83,36 @@ class Genre(models.Model):
         verbose_name_plural = 'Жанры'
 
 
+class ArtistManager(models.Manager):
+    """Менеджер исполнителей"""
+
+    def detail_page(self):
+        """Страница исполнителя: жанр, участники и дискография с носителями — по запросу на связь, без N+1"""
+        discography = Album.objects.select_related('media_type').order_by('-release_date', 'id')
+        return self.get_queryset().select_related('genre').prefetch_related(
+            'members', models.Prefetch('album_set', queryset=discography, to_attr='discography'),
+        )
+
+    def recount(self, artist_ids=None):
+        """Пересчитываем счётчики альбомов одним UPDATE: для artist_ids или для всех исполнителей"""
+        albums = Album.objects.filter(artist=models.OuterRef('pk')).order_by().values('artist')
+        queryset = self.get_queryset() if artist_ids is None else self.get_queryset().filter(id__in=artist_ids)
+        CatalogChange.objects.record(Artist, artist_ids)
+        return queryset.update(
+            album_count=Coalesce(models.Subquery(albums.annotate(count=models.Count('id')).values('count')), 0),
+            in_stock_count=Coalesce(models.Subquery(
+                albums.filter(stock__gt=0).annotate(count=models.Count('id')).values('count')
+            ), 0),
+        )
+
+    def stale(self):
+        """Исполнители, у которых счётчики разошлись с данными"""
+        return self.get_queryset().annotate(
+            actual_albums=models.Count('album'),
+            actual_in_stock=models.Count('album', filter=models.Q(album__stock__gt=0)),
+        ).exclude(album_count=models.F('actual_albums'), in_stock_count=models.F('actual_in_stock'))
+
+
 class Artist(models.Model):
     """Исполнитель"""
 
@@ -66,6 +122,10 @@ class Artist(models.Model):
     slug = models.SlugField()
     image = models.ImageField(upload_to=upload_function, null=True, blank=True)
     image_gallery = GenericRelation('imagegallery')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
+    album_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Альбомов')
+    in_stock_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Альбомов в наличии')
+    objects = ArtistManager()
 
     def __str__(self):
         return f'{self.name} | {self.genre.name}'
@@ -84,25 +144,46 @@ class AlbumManager(models.Manager):
     def get_queryset(self):
         return super().get_queryset()
 
-    def get_month_bestseller(self):
+    def facets(self):
+        """Число альбомов по слагам жанров и носителям и число альбомов в наличии"""
+        queryset = self.get_queryset().order_by()
+        return {
+            'genres': dict(queryset.values_list('artist__genre__slug').annotate(count=models.Count('id'))),
+            'media_types': dict(queryset.values_list('media_type__name').annotate(count=models.Count('id'))),
+            'in_stock': queryset.filter(stock__gt=0).count(),
+        }
+
+    def month_bestseller_query(self):
+        """SQL и параметры бестселлера текущего месяца; отдельно от выполнения, чтобы тесты проверяли план запроса"""
         today = datetime.today()
         year, month = today.year, today.month
         first_day = datetime(year, month, 1)
         last_day = datetime(year, month, monthrange(year, month)[1])
-        query = f"""
+        # Заказы читаем и из рабочих, и из архивных таблиц
+        query = """
             SELECT shop_product.id as product_id, SUM(distinct shop_cart_product.qty) as total_qty
-            FROM musicshop_order as shop_order
-            JOIN musicshop_cart as shop_cart on shop_order.cart_id = shop_cart.id
-            JOIN musicshop_cartproduct as shop_cart_product on shop_cart.id = shop_cart_product.cart_id
+            FROM (
+                SELECT shop_order.order_date, shop_cart_product.object_id, shop_cart_product.qty
+                FROM musicshop_order as shop_order
+                JOIN musicshop_cart as shop_cart on shop_order.cart_id = shop_cart.id
+                JOIN musicshop_cartproduct as shop_cart_product on shop_cart.id = shop_cart_product.cart_id
+                UNION ALL
+                SELECT shop_order.order_date, shop_cart_product.object_id, shop_cart_product.qty
+                FROM musicshop_archivedorder as shop_order
+                JOIN musicshop_archivedcartproduct as shop_cart_product
+                    on shop_order.cart_id = shop_cart_product.cart_id
+            ) as shop_cart_product
             JOIN musicshop_album as shop_product on shop_cart_product.object_id=shop_product.id
-            WHERE shop_order.order_date >= '{first_day}' and shop_order.order_date <= '{last_day}'
+            WHERE shop_cart_product.order_date >= %s and shop_cart_product.order_date <= %s
             GROUP BY product_id
             ORDER BY total_qty DESC
             LIMIT 1
         """
+        return query, [str(first_day), str(last_day)]
 
+    def get_month_bestseller(self):
         with connection.cursor() as cursor:
-            cursor.execute(query)
+            cursor.execute(*self.month_bestseller_query())
             row = cursor.fetchone()
         if row:
             product_id, qty = row
@@ -127,6 +208,7 @@ class Album(models.Model):
     offer_of_the_week = models.BooleanField(default=False, verbose_name="Предложение недели?")
     image = models.ImageField(upload_to=upload_function)
     image_gallery = GenericRelation('imagegallery')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
     objects = AlbumManager()
 
     def __str__(self):
@@ -144,6 +226,46 @@ class Album(models.Model):
         verbose_name_plural = 'Альбомы'
 
 
+class CatalogChangeManager(models.Manager):
+    """Журнал изменений каталога для снимков в памяти процессов (musicshop.catalog)"""
+
+    def record(self, model, ids=None):
+        """Отмечаем изменённые записи model; ids=None — изменилась вся таблица"""
+        name = model._meta.model_name
+        if ids is None:
+            return self.create(model=name)
+        self.bulk_create([CatalogChange(model=name, object_id=object_id) for object_id in set(ids)], batch_size=5000)
+
+    def version(self):
+        """Версия каталога — id последней записи журнала"""
+        return self.get_queryset().order_by('-id').values_list('id', flat=True).first() or 0
+
+    def prune(self, days):
+        """Удаляем записи старше days дней; отставшие снимки по метке «*» соберутся заново"""
+        marker = self.create(model=CatalogChange.EVERYTHING)
+        return self.get_queryset().filter(
+            created_at__lt=timezone.now() - timedelta(days=days), id__lt=marker.id
+        ).delete()[0]
+
+
+class CatalogChange(models.Model):
+    """Изменённая запись каталога: id — версия каталога, по нему снимки в процессах догружают изменения"""
+
+    EVERYTHING = '*'
+
+    model = models.CharField(max_length=20, verbose_name='Модель')
+    object_id = models.BigIntegerField(null=True, verbose_name='ID записи')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Время изменения')
+    objects = CatalogChangeManager()
+
+    def __str__(self):
+        return f"{self.model}: {self.object_id or 'все'}"
+
+    class Meta:
+        verbose_name = 'Изменение каталога'
+        verbose_name_plural = 'Изменения каталога'
+
+
 class CartProduct(models.Model):
     """Продукт корзины"""
 
@@ -158,7 +280,7 @@ class CartProduct(models.Model):
     content_object = GenericForeignKey('content_type', 'object_id')
     qty = models.PositiveIntegerField(default=1)
     final_price = models.DecimalField(max_digits=9, decimal_places=2, verbose_name="Общая цена")
-    session_key = models.CharField(max_length=1024, verbose_name='Ключ сессии', null=True, blank=True)
+    session_key = models.CharField(max_length=40, verbose_name='Ключ сессии', null=True, blank=True)
 
     def __str__(self):
         return f"Продукт: {self.content_object.name} (для корзины)"
@@ -184,6 +306,10 @@ class CartProduct(models.Model):
     class Meta:
         verbose_name = 'Продукт корзины'
         verbose_name_plural = 'Продукты корзины'
+        indexes = [
+            # get_or_create позиции в AddToCartView/DeleteFromCartView/ChangeQTYView
+            models.Index(fields=['cart', 'content_type', 'object_id'], name='cartproduct_cart_object_idx'),
+        ]
 
 
 class Cart(models.Model):
@@ -196,18 +322,23 @@ class Cart(models.Model):
     total_products = models.IntegerField(default=0, verbose_name="Общее кол-во товара")
     final_price = models.DecimalField(max_digits=9, decimal_places=2, verbose_name="Общая цена", null=True, blank=True)
     in_order = models.BooleanField(default=False)
-    session_key = models.CharField(max_length=1024, verbose_name='Ключ сессии', null=True, blank=True)
+    session_key = models.CharField(max_length=40, verbose_name='Ключ сессии', null=True, blank=True)
 
     def __str__(self):
         return str(self.id)
 
-    @property
-    def products_in_cart(self):
-        return [c.content_object for c in self.products.all()]
+    def prefetch_products(self):
+        """Подгружаем продукты корзины вместе с товарами и исполнителями за фиксированное число запросов"""
+        prefetch_related_objects([self], 'products__content_object__artist')
+        return self
 
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзины'
+        indexes = [
+            # Открытая корзина покупателя в CartMixin; оформленные корзины в индекс не попадают
+            models.Index(fields=['owner', 'id'], condition=models.Q(in_order=False), name='cart_open_owner_idx'),
+        ]
 
 
 class Order(models.Model):
@@ -252,6 +383,236 @@ class Order(models.Model):
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            # Выборка по диапазону дат в get_month_bestseller, cart_id берётся прямо из индекса
+            models.Index(fields=['order_date', 'cart'], name='order_date_cart_idx'),
+        ]
+
+
+class StockMovementManager(models.Manager):
+    """Складской журнал: остаток = снимок + движения после него"""
+
+    def get_queryset(self):
+        return super().get_queryset()
+
+    def current_stock(self, album_ids):
+        """Текущий остаток альбомов одним запросом"""
+        deltas = self.get_queryset().filter(
+            album=models.OuterRef('id'),
+            id__gt=Coalesce(models.OuterRef('stock_snapshot__movement_id'), 0),
+        ).order_by().values('album').annotate(total=models.Sum('delta')).values('total')
+        return dict(
+            Album.objects.filter(id__in=list(album_ids)).annotate(
+                current_stock=Coalesce('stock_snapshot__stock', 0) + Coalesce(models.Subquery(deltas), 0)
+            ).values_list('id', 'current_stock')
+        )
+
+    def record_sales(self, order, cart_products):
+        """Списание заказанного количества: только вставки, строки альбомов не блокируются"""
+        qty_by_album = {}
+        for item in cart_products:
+            qty_by_album[item.object_id] = qty_by_album.get(item.object_id, 0) + item.qty
+        return self.bulk_create([
+            StockMovement(album_id=album_id, kind=StockMovement.KIND_SALE, delta=-qty, order=order)
+            for album_id, qty in qty_by_album.items()
+        ])
+
+    def set_stock(self, levels, kind=None, comment=''):
+        """Доводим остатки до заданных значений; kind — вид движений прихода, уменьшение всегда корректировка"""
+        current = self.current_stock(levels)
+        deltas = {album_id: stock - current.get(album_id, 0) for album_id, stock in levels.items()}
+        return self.bulk_create([
+            StockMovement(
+                album_id=album_id, delta=delta, comment=comment,
+                kind=kind if kind and delta > 0 else StockMovement.KIND_ADJUSTMENT,
+            )
+            for album_id, delta in deltas.items()
+            if delta
+        ])
+
+    def compact(self, chunk_size=1000):
+        """Сворачиваем новые движения в снимки и обновляем Album.stock для витрины"""
+        horizon = self.get_queryset().aggregate(models.Max('id'))['id__max']
+        if horizon is None:
+            return 0
+        pending = models.Q(album__stock_snapshot__isnull=True) | models.Q(
+            id__gt=models.F('album__stock_snapshot__movement_id')
+        )
+        album_ids = list(
+            self.get_queryset().filter(pending, id__lte=horizon)
+            .order_by().values_list('album_id', flat=True).distinct()
+        )
+        for chunk in chunked(album_ids, chunk_size):
+            with transaction.atomic():
+                self._compact_albums(chunk, horizon)
+        return len(album_ids)
+
+    def _compact_albums(self, album_ids, horizon):
+        snapshots = {snapshot.album_id: snapshot for snapshot in StockSnapshot.objects.filter(album_id__in=album_ids)}
+        totals = {album_id: 0 for album_id in album_ids}
+        # Снимок помечаем последним прочитанным движением альбома, а не горизонтом: движение другого альбома
+        # с меньшим id может закоммититься позже чтения горизонта и иначе не попало бы ни в один снимок
+        # (движения одного альбома с обгоняющими друг друга id бывают только при параллельных писателях, SQLite их нет)
+        folded = {album_id: snapshots[album_id].movement_id if album_id in snapshots else 0 for album_id in album_ids}
+        last_ids = dict(folded)
+        for album_id, movement_id, delta in self.get_queryset().filter(
+                album_id__in=album_ids, id__lte=horizon).values_list('album_id', 'id', 'delta').iterator():
+            if movement_id > folded[album_id]:
+                totals[album_id] += delta
+                last_ids[album_id] = max(last_ids[album_id], movement_id)
+        levels = {
+            album_id: (snapshots[album_id].stock if album_id in snapshots else 0) + delta
+            for album_id, delta in totals.items()
+        }
+        StockSnapshot.objects.filter(album_id__in=album_ids).delete()
+        StockSnapshot.objects.bulk_create([
+            StockSnapshot(album_id=album_id, stock=stock, movement_id=last_ids[album_id])
+            for album_id, stock in levels.items()
+        ])
+        restocked = list(Album.objects.filter(id__in=album_ids, stock__lte=0).exclude(
+            id__in=[album_id for album_id, stock in levels.items() if stock <= 0]
+        ))
+        Album.objects.filter(id__in=album_ids).update(
+            stock=models.Case(*[models.When(id=album_id, then=stock) for album_id, stock in levels.items()]),
+            out_of_stock=False,
+            updated_at=timezone.now(),
+        )
+        CatalogChange.objects.record(Album, album_ids)
+        Artist.objects.recount(Album.objects.filter(id__in=album_ids).values_list('artist_id', flat=True))
+        for album in restocked:
+            album.stock = levels[album.id]
+        notify_restocked(restocked)
+
+    def reconcile(self, orders=None):
+        """Сверяем списания журнала с составом заказов: (заказ, альбом, заказано, списано)"""
+        orders = Order.objects.all() if orders is None else orders
+        ordered = {
+            (order_id, album_id): qty
+            for order_id, album_id, qty in orders.filter(cart__cartproduct__isnull=False).values_list(
+                'id', 'cart__cartproduct__object_id').annotate(qty=models.Sum('cart__cartproduct__qty'))
+        }
+        recorded = {
+            (order_id, album_id): -delta
+            for order_id, album_id, delta in self.get_queryset().filter(
+                kind=StockMovement.KIND_SALE, order__in=orders).values_list('order_id', 'album_id').annotate(
+                delta=models.Sum('delta'))
+        }
+        return sorted(
+            (order_id, album_id, ordered.get((order_id, album_id), 0), recorded.get((order_id, album_id), 0))
+            for order_id, album_id in ordered.keys() | recorded.keys()
+            if ordered.get((order_id, album_id), 0) != recorded.get((order_id, album_id), 0)
+        )
+
+
+class StockMovement(models.Model):
+    """Движение товара на складе, записи только добавляются"""
+
+    KIND_SALE = 'sale'
+    KIND_RESTOCK = 'restock'
+    KIND_ADJUSTMENT = 'adjustment'
+    KIND_RETURN = 'return'
+
+    KIND_CHOICES = (
+        (KIND_SALE, "Продажа"),
+        (KIND_RESTOCK, "Поступление"),
+        (KIND_ADJUSTMENT, "Корректировка"),
+        (KIND_RETURN, "Возврат"),
+    )
+
+    album = models.ForeignKey(Album, on_delete=models.CASCADE, related_name="stock_movements", verbose_name="Альбом")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Тип движения")
+    delta = models.IntegerField(verbose_name="Изменение остатка")
+    # Номер заказа сохраняется и после переноса заказа в архив
+    order = models.ForeignKey(Order, null=True, blank=True, on_delete=models.DO_NOTHING, db_constraint=False,
+                              verbose_name="Заказ")
+    comment = models.CharField(max_length=255, blank=True, verbose_name="Комментарий")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время")
+    objects = StockMovementManager()
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.delta:+d} | {self.album_id}"
+
+    class Meta:
+        verbose_name = 'Движение товара'
+        verbose_name_plural = 'Движения товара'
+        indexes = [models.Index(fields=['album', 'id'])]
+
+
+class StockSnapshot(models.Model):
+    """Свёрнутый остаток альбома по движениям до movement_id включительно"""
+
+    album = models.OneToOneField(Album, on_delete=models.CASCADE, related_name="stock_snapshot", verbose_name="Альбом")
+    stock = models.IntegerField(verbose_name="Остаток")
+    movement_id = models.BigIntegerField(default=0, verbose_name="Последнее учтённое движение")
+    created_at = models.DateTimeField(auto_now=True, verbose_name="Время снимка")
+
+    def __str__(self):
+        return f"{self.album_id}: {self.stock}"
+
+    class Meta:
+        verbose_name = 'Снимок остатка'
+        verbose_name_plural = 'Снимки остатков'
+
+
+class ArchivedCart(models.Model):
+    """Корзина архивного заказа (первичный ключ сохраняется)"""
+
+    id = models.BigIntegerField(primary_key=True)
+    owner = models.ForeignKey("Customer", null=True, blank=True, verbose_name="Покупатель", on_delete=models.CASCADE)
+    total_products = models.IntegerField(default=0, verbose_name="Общее кол-во товара")
+    final_price = models.DecimalField(max_digits=9, decimal_places=2, verbose_name="Общая цена", null=True, blank=True)
+
+    def __str__(self):
+        return str(self.id)
+
+    class Meta:
+        verbose_name = 'Архивная корзина'
+        verbose_name_plural = 'Архивные корзины'
+
+
+class ArchivedCartProduct(models.Model):
+    """Продукт архивной корзины"""
+
+    id = models.BigIntegerField(primary_key=True)
+    cart = models.ForeignKey(ArchivedCart, related_name="products", verbose_name="Корзина", on_delete=models.CASCADE)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    qty = models.PositiveIntegerField(default=1)
+    final_price = models.DecimalField(max_digits=9, decimal_places=2, verbose_name="Общая цена")
+
+    def __str__(self):
+        return f"Продукт: {self.content_object.name} (архив)"
+
+    class Meta:
+        verbose_name = 'Продукт архивной корзины'
+        verbose_name_plural = 'Продукты архивных корзин'
+
+
+class ArchivedOrder(models.Model):
+    """Выполненный заказ, перенесённый из рабочих таблиц"""
+
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey("Customer", verbose_name="Покупатель", related_name="archived_orders",
+                                 on_delete=models.CASCADE)
+    first_name = models.CharField(max_length=255, verbose_name="Имя")
+    last_name = models.CharField(max_length=255, verbose_name="Фамилия")
+    phone = models.CharField(max_length=20, verbose_name="Телефон")
+    cart = models.ForeignKey(ArchivedCart, verbose_name="Корзина", null=True, blank=True, on_delete=models.CASCADE)
+    address = models.CharField(max_length=1024, verbose_name="Адрес", null=True, blank=True)
+    status = models.CharField(max_length=100, verbose_name="Статус заказа", choices=Order.STATUS_CHOICES)
+    buying_type = models.CharField(max_length=100, verbose_name="Тип заказа", choices=Order.BUYING_TYPE_CHOICES)
+    comment = models.TextField(verbose_name="Комментарий к заказу", null=True, blank=True)
+    created_at = models.DateField(verbose_name="Дата создания заказа")
+    order_date = models.DateField(verbose_name="Дата получения заказа", db_index=True)
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="Перенесён в архив")
+
+    def __str__(self):
+        return str(self.id)
+
+    class Meta:
+        verbose_name = 'Архивный заказ'
+        verbose_name_plural = 'Архивные заказы'
 
 
 class Customer(models.Model):
@@ -268,6 +629,14 @@ class Customer(models.Model):
     def __str__(self):
         return f"{self.user.username}"
 
+    def order_history(self):
+        """Заказы покупателя из рабочих и архивных таблиц"""
+        orders = [
+            queryset.select_related('cart').prefetch_related('cart__products__content_object__artist')
+            for queryset in (self.archived_orders.all(), self.orders.all())
+        ]
+        return sorted(chain(*orders), key=lambda order: order.id)
+
     class Meta:
         verbose_name = 'Покупатель'
         verbose_name_plural = 'Покупатели'
@@ -288,6 +657,7 @@ class NotificationManager(models.Manager):
     def make_all_read(self, recipient):
         qs = self.get_queryset().filter(recipient=recipient, read=False)
         qs.update(read=True)
+        transaction.on_commit(lambda: publish(recipient.id, 'read', None))
 
 
 class Notification(models.Model):
@@ -304,6 +674,42 @@ class Notification(models.Model):
     class Meta:
         verbose_name = 'Уведомление'
         verbose_name_plural = 'Уведомления'
+        indexes = [
+            # Непрочитанные уведомления в NotificationManager, прочитанные в индекс не попадают
+            models.Index(fields=['recipient'], condition=models.Q(read=False), name='notification_unread_idx'),
+        ]
+
+
+class ImageGalleryManager(models.Manager):
+    """Менеджер галерей"""
+
+    def attach(self, objects, to_attr='gallery'):
+        """Галереи многих исполнителей и альбомов одним запросом: список изображений кладём в obj.<to_attr>"""
+        objects = list(objects)
+        if not objects:
+            return objects
+        content_types = ContentType.objects.get_for_models(*{type(obj) for obj in objects})
+        by_key = {}
+        for obj in objects:
+            setattr(obj, to_attr, [])
+            by_key[(content_types[type(obj)].id, obj.pk)] = obj
+        condition = models.Q()
+        for content_type in content_types.values():
+            object_ids = [object_id for content_type_id, object_id in by_key if content_type_id == content_type.id]
+            condition |= models.Q(content_type=content_type, object_id__in=object_ids)
+        for image in self.get_queryset().filter(condition).order_by('id'):
+            getattr(by_key[(image.content_type_id, image.object_id)], to_attr).append(image)
+        return objects
+
+    def slider(self, limit=None):
+        """Изображения слайдера главной, новые первыми, вместе с исполнителями и альбомами, на которые они ведут"""
+        slides = list(
+            self.get_queryset().filter(use_in_slider=True).order_by('-id').prefetch_related('content_object')[:limit]
+        )
+        # Ссылка на альбом строится по slug исполнителя
+        prefetch_related_objects([slide.content_object for slide in slides if isinstance(slide.content_object, Album)],
+                                 'artist')
+        return slides
 
 
 class ImageGallery(models.Model):
@@ -314,16 +720,128 @@ class ImageGallery(models.Model):
     content_object = GenericForeignKey("content_type", "object_id")
     image = models.ImageField(upload_to=upload_function)
     use_in_slider = models.BooleanField(default=False)
+    # Размер оригинала; заполняется вместе с уменьшенными копиями, до этого страницы показывают оригинал
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    objects = ImageGalleryManager()
 
     def __str__(self):
         return f"Изображение для {self.content_object}"
 
     def image_url(self):
-        return mark_safe(f'<img src="{self.image.url}" width="auto" height="200px">')
+        return mark_safe(f'<img src="{self.thumbnail_url()}" width="auto" height="200px">')
+
+    def thumbnail_widths(self):
+        if not self.width:
+            return []
+        return [width for width in settings.THUMBNAIL_WIDTHS if width < self.width]
+
+    def thumbnail_url(self):
+        """Самая крупная копия — для браузеров без srcset; копий нет — оригинал"""
+        widths = self.thumbnail_widths()
+        if not widths:
+            return self.image.url
+        return self.image.storage.url(thumbnail_name(self.image.name, widths[-1]))
+
+    def srcset(self):
+        if not self.width:
+            return ''
+        candidates = [
+            f'{self.image.storage.url(thumbnail_name(self.image.name, width))} {width}w'
+            for width in self.thumbnail_widths()
+        ]
+        return ', '.join(candidates + [f'{self.image.url} {self.width}w'])
+
+    def make_thumbnails(self, force=False):
+        """Строим копии и запоминаем размер оригинала; False, если файла нет или это не изображение"""
+        if not force and self.width and all(
+            self.image.storage.exists(thumbnail_name(self.image.name, width)) for width in self.thumbnail_widths()
+        ):
+            return True
+        try:
+            self.width, self.height = make_thumbnails(self.image)
+        except OSError:
+            return False
+        ImageGallery.objects.filter(id=self.id).update(width=self.width, height=self.height)
+        return True
 
     class Meta:
         verbose_name = 'Галерея изображений'
         verbose_name_plural = verbose_name
+        indexes = [
+            # Галерея страницы исполнителя или альбома и загрузка галерей пачкой (ImageGalleryManager.attach)
+            models.Index(fields=['content_type', 'object_id'], name='gallery_object_idx'),
+            # Слайдер главной: только отмеченные изображения, новые первыми
+            models.Index(fields=['-id'], condition=models.Q(use_in_slider=True), name='gallery_slider_idx'),
+        ]
+
+
+class JobManager(models.Manager):
+    """Очередь фоновых задач в таблице; выполняет их manage.py run_jobs (musicshop.jobs)"""
+
+    def enqueue(self, name, unique=False, **payload):
+        """Ставим задачу после фиксации транзакции: откат не оставит задачи, а запрос не ждёт её выполнения"""
+        def create():
+            if unique and self.get_queryset().filter(name=name, status=Job.STATUS_QUEUED, payload=payload).exists():
+                return
+            self.create(name=name, payload=payload)
+
+        transaction.on_commit(create)
+
+    def claim(self, limit):
+        """Забираем до limit задач, срок которых наступил; UPDATE с условием на статус не отдаст задачу двоим"""
+        now = timezone.now()
+        # Задачи обработчика, который упал посреди работы, возвращаем в очередь, исчерпавшие попытки — в упавшие
+        abandoned = self.get_queryset().filter(
+            status=Job.STATUS_RUNNING, locked_at__lt=now - timedelta(seconds=settings.JOB_LOCK_SECONDS)
+        )
+        abandoned.filter(attempts__gte=settings.JOB_MAX_ATTEMPTS).update(
+            status=Job.STATUS_FAILED, locked_at=None, last_error='Обработчик не завершил задачу за отведённые попытки'
+        )
+        abandoned.update(status=Job.STATUS_QUEUED, locked_at=None)
+        claimed = []
+        due = self.get_queryset().filter(status=Job.STATUS_QUEUED, run_at__lte=now).order_by('run_at', 'id')
+        for job in due[:limit]:
+            if self.get_queryset().filter(id=job.id, status=Job.STATUS_QUEUED).update(
+                    status=Job.STATUS_RUNNING, locked_at=now, attempts=models.F('attempts') + 1):
+                job.status, job.locked_at, job.attempts = Job.STATUS_RUNNING, now, job.attempts + 1
+                claimed.append(job)
+        return claimed
+
+
+class Job(models.Model):
+    """Фоновая задача: уведомления, перерасчёт корзин, свёртка склада и письма менеджерам вне запроса"""
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_FAILED, 'Не выполнена'),
+    )
+
+    name = models.CharField(max_length=100, verbose_name='Задача')
+    payload = models.JSONField(default=dict, blank=True, verbose_name='Параметры')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    run_at = models.DateTimeField(default=timezone.now, verbose_name='Выполнить после')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Взята в работу')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Поставлена')
+    objects = JobManager()
+
+    def __str__(self):
+        return f"{self.name} #{self.id}: {self.get_status_display()}"
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            # Выборка готовых задач обработчиком; выполненные удаляются, упавшие в индекс не попадают
+            models.Index(fields=['run_at', 'id'], condition=models.Q(status='queued'), name='job_due_idx'),
+        ]
 
 
 def check_previous_qty(instance, **kwargs):
@@ -331,23 +849,146 @@ def check_previous_qty(instance, **kwargs):
         album = Album.objects.get(id=instance.id)
     except Album.DoesNotExist:
         return None
-    instance.out_of_stock = True if not album.stock else False
+    previous_stock = StockMovement.objects.current_stock([album.id]).get(album.id, 0)
+    instance.out_of_stock = True if not previous_stock else False
+    instance.previous_artist_id = album.artist_id
+    instance.price_changed = album.price != instance.price
+    # Album.stock — витрина журнала: если его изменили вручную, доводим журнал до нового значения
+    instance.stock_delta = instance.stock - previous_stock if instance.stock != album.stock else 0
+
+
+def notify_restocked(albums):
+    """Уведомляем ожидающих покупателей о поступлении альбомов и чистим их списки ожидания"""
+    albums = {album.id: album for album in albums}
+    if not albums:
+        return 0
+    wishlist_items = list(
+        Customer.wishlist.through.objects.filter(album_id__in=albums).values_list('id', 'customer_id', 'album_id')
+    )
+    if not wishlist_items:
+        return 0
+    notifications = Notification.objects.bulk_create([
+        Notification(
+            recipient_id=customer_id,
+            text=mark_safe(f'Позиция <a href="{albums[album_id].get_absolute_url()}">{albums[album_id].name}</a>, '
+                           f'которую Вы ожидаете, есть в наличии.')
+        )
+        for _, customer_id, album_id in wishlist_items
+    ])
+    Customer.wishlist.through.objects.filter(id__in=[item_id for item_id, _, _ in wishlist_items]).delete()
+    # Подключённые по SSE покупатели получат уведомления только после фиксации транзакции
+    transaction.on_commit(lambda: publish_notifications(notifications))
+    return len(wishlist_items)
 
 
 def send_notification(instance, **kwargs):
     if instance.stock and instance.out_of_stock:
-        customers = Customer.objects.filter(
-            wishlist__in=[instance]
+        Job.objects.enqueue('notify_restocked', album_ids=[instance.id])
+
+
+def reprice_carts(instance, **kwargs):
+    if getattr(instance, 'price_changed', False):
+        instance.price_changed = False
+        Job.objects.enqueue('reprice_carts', album_ids=[instance.id])
+
+
+def record_stock_change(instance, created, **kwargs):
+    delta = instance.stock if created else getattr(instance, 'stock_delta', 0)
+    if delta:
+        StockMovement.objects.create(
+            album=instance, kind=StockMovement.KIND_RESTOCK if created else StockMovement.KIND_ADJUSTMENT, delta=delta
         )
-        if customers.count():
-            for customer in customers:
-                Notification.objects.create(
-                    recipient=customer,
-                    text=mark_safe(f'Позиция <a href="{instance.get_absolute_url()}">{instance.name}</a>, '
-                                   f'которую Вы ожидаете, есть в наличии.')
-                )
-                customer.wishlist.remove(instance)
+    instance.stock_delta = 0
+
+
+# Сколько id изменённых записей touch() пишет в журнал каталога поштучно
+TOUCH_RECORD_LIMIT = 1000
+
+
+def touch(queryset):
+    """Сдвигаем updated_at у страниц каталога, которые показывают изменённые данные"""
+    ids = list(queryset.values_list('id', flat=True)[:TOUCH_RECORD_LIMIT + 1])
+    queryset.update(updated_at=timezone.now())
+    # Большую выборку (альбомы жанра) снимки перечитают целиком
+    CatalogChange.objects.record(queryset.model, ids if len(ids) <= TOUCH_RECORD_LIMIT else None)
+
+
+def record_catalog_change(sender, instance, **kwargs):
+    CatalogChange.objects.record(sender, [instance.id])
+
+
+def touch_genre(instance, **kwargs):
+    touch(Artist.objects.filter(genre=instance))
+    touch(Album.objects.filter(artist__genre=instance))
+
+
+def touch_media_type(instance, **kwargs):
+    touch(Album.objects.filter(media_type=instance))
+
+
+def touch_member(instance, **kwargs):
+    touch(Artist.objects.filter(members=instance))
+
+
+def touch_members_changed(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        touch(Artist.objects.filter(id=instance.id))
+    elif action == 'pre_clear':
+        touch(Artist.objects.filter(members=instance))
+    else:
+        touch(Artist.objects.filter(id__in=pk_set))
+
+
+def count_albums(instance, **kwargs):
+    previous_artist_id = getattr(instance, 'previous_artist_id', instance.artist_id)
+    Artist.objects.recount({instance.artist_id, previous_artist_id})
+    if previous_artist_id != instance.artist_id:
+        # Альбом ушёл из дискографии прежнего исполнителя
+        touch(Artist.objects.filter(id=previous_artist_id))
+
+
+def album_deleted(instance, **kwargs):
+    count_albums(instance)
+    # Альбом пропал из дискографии, а updated_at оставшихся альбомов не изменился
+    touch(Artist.objects.filter(id=instance.artist_id))
+
+
+def count_artists(instance, **kwargs):
+    # Жанров немного: пересчитываем все, а не ищем прежний жанр исполнителя
+    Genre.objects.recount()
+
+
+def make_gallery_thumbnails(instance, raw=False, **kwargs):
+    # Копии строим при загрузке, страницы отдают их без обращения к файлам
+    if not raw:
+        instance.make_thumbnails()
+
+
+def touch_gallery(instance, **kwargs):
+    model = instance.content_type.model_class()
+    if model in (Artist, Album):
+        touch(model.objects.filter(id=instance.object_id))
 
 
+post_save.connect(touch_genre, sender=Genre)
+post_save.connect(touch_media_type, sender=MediaType)
+post_save.connect(touch_member, sender=Member)
+# После удаления музыканта его связи с исполнителями уже удалены
+pre_delete.connect(touch_member, sender=Member)
+m2m_changed.connect(touch_members_changed, sender=Artist.members.through)
+post_save.connect(make_gallery_thumbnails, sender=ImageGallery)
+post_save.connect(touch_gallery, sender=ImageGallery)
+post_delete.connect(touch_gallery, sender=ImageGallery)
+post_save.connect(record_stock_change, sender=Album)
 post_save.connect(send_notification, sender=Album)
+post_save.connect(reprice_carts, sender=Album)
 pre_save.connect(check_previous_qty, sender=Album)
+post_save.connect(count_albums, sender=Album)
+post_delete.connect(album_deleted, sender=Album)
+post_save.connect(count_artists, sender=Artist)
+post_delete.connect(count_artists, sender=Artist)
+for catalog_model in (Genre, MediaType, Artist, Album):
+    post_save.connect(record_catalog_change, sender=catalog_model)
+    post_delete.connect(record_catalog_change, sender=catalog_model)
@@ -0,0 +1,212 @@
+import asyncio
+import io
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DatabaseError, close_old_connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('musicshop.notifications')
+
+_broker = None
+
+
+class LocalBroker:
+    """Pub/sub в памяти процесса.
+
+    Бэкенд брокера должен уметь publish(channel, message) из любого потока и subscribe(channel) —
+    асинхронный контекстный менеджер, который отдаёт объект с корутиной get().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+            except RuntimeError:
+                # Цикл событий подписчика уже закрыт
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self.lock:
+            self.subscribers[channel].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self.lock:
+                self.subscribers[channel].discard(subscriber)
+                if not self.subscribers[channel]:
+                    del self.subscribers[channel]
+
+
+class DatabaseBroker(LocalBroker):
+    """Брокер для нескольких процессов: новые уведомления берём из таблицы Notification.
+
+    Уведомления создают run_jobs, админка и импорт, а подписчики живут в ASGI-процессе. Пока есть подписчики,
+    поток процесса раз в NOTIFICATION_POLL_SECONDS читает уведомления с id больше последнего увиденного и
+    рассылает их; события этого процесса publish() доставляет сразу, повторы клиент отбрасывает по id.
+    Остальные события (read) между процессами не передаются.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.interval = getattr(settings, 'NOTIFICATION_POLL_SECONDS', 1)
+        self.last_id = None
+        self.poller = None
+        self.ready = threading.Event()
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        async with super().subscribe(channel) as queue:
+            with self.lock:
+                if self.poller is None:
+                    self.poller = threading.Thread(target=self.poll_forever, daemon=True)
+                    self.poller.start()
+            # Отсчёт id задан до того, как подписчик прочитает непрочитанные: между ними ничего не теряется
+            await sync_to_async(self.ready.wait, thread_sensitive=False)()
+            yield queue
+
+    def poll_forever(self):
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.poller = None
+                    self.ready.clear()
+                    return
+            try:
+                self.poll()
+            except DatabaseError:
+                logger.exception('Не удалось прочитать новые уведомления')
+            finally:
+                close_old_connections()
+            self.ready.set()
+            time.sleep(self.interval)
+
+    def poll(self):
+        """Рассылаем уведомления новее last_id; в первый раз только запоминаем последний id"""
+        from .models import Notification
+
+        # id назначается при INSERT: порядок id совпадает с порядком коммитов, пока пишет один процесс (SQLite)
+        if self.last_id is None:
+            self.last_id = Notification.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            return
+        notifications = list(Notification.objects.filter(id__gt=self.last_id, read=False).order_by('id'))
+        if notifications:
+            self.last_id = notifications[-1].id
+            publish_notifications(notifications, self)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'NOTIFICATION_BROKER', 'musicshop.notifications.DatabaseBroker'))()
+    return _broker
+
+
+def channel(customer_id):
+    return f'notifications:{customer_id}'
+
+
+def publish(customer_id, event, data):
+    get_broker().publish(channel(customer_id), {'event': event, 'data': data})
+
+
+def publish_notifications(notifications, broker=None):
+    """Рассылаем новые уведомления подключённым покупателям"""
+    broker = broker or get_broker()
+    by_customer = defaultdict(list)
+    for notification in notifications:
+        by_customer[notification.recipient_id].append({'id': notification.id, 'text': notification.text})
+    for customer_id, items in by_customer.items():
+        broker.publish(channel(customer_id), {'event': 'notification', 'data': items})
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode()
+
+
+class NotificationStream:
+    """ASGI-приложение SSE: при подключении отдаёт непрочитанные уведомления, дальше — новые по мере появления"""
+
+    def __init__(self, keepalive=None):
+        self.keepalive = keepalive or getattr(settings, 'NOTIFICATION_STREAM_KEEPALIVE', 15)
+
+    @staticmethod
+    def customer_id(scope):
+        from .models import Customer
+
+        request = ASGIRequest(scope, io.BytesIO())
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore(
+            request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        )
+        try:
+            user = get_user(request)
+            if not user.is_authenticated:
+                return None
+            return Customer.objects.filter(user_id=user.id).values_list('id', flat=True).first()
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def unread(customer_id):
+        from .models import Notification
+
+        try:
+            return list(Notification.objects.all(recipient=customer_id).order_by('id').values('id', 'text'))
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    async def wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def __call__(self, scope, receive, send):
+        customer_id = await sync_to_async(self.customer_id, thread_sensitive=False)(scope)
+        if customer_id is None:
+            await send({'type': 'http.response.start', 'status': 403, 'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        # Подписываемся до чтения непрочитанных, чтобы не потерять уведомления между ними (дубли клиент отбросит по id)
+        async with get_broker().subscribe(channel(customer_id)) as subscription:
+            unread = await sync_to_async(self.unread, thread_sensitive=False)(customer_id)
+            await send({'type': 'http.response.body', 'body': format_event('snapshot', unread), 'more_body': True})
+            disconnect = asyncio.ensure_future(self.wait_disconnect(receive))
+            message = asyncio.ensure_future(subscription.get())
+            try:
+                while True:
+                    done, _ = await asyncio.wait(
+                        {disconnect, message}, timeout=self.keepalive, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if disconnect in done:
+                        break
+                    if message in done:
+                        body = format_event(message.result()['event'], message.result()['data'])
+                        message = asyncio.ensure_future(subscription.get())
+                    else:
+                        body = b': keepalive\n\n'
+                    await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+            finally:
+                disconnect.cancel()
+                message.cancel()
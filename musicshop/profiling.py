@@ -0,0 +1,116 @@
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+
+TOKEN_SALT = 'musicshop.profiling'
+
+# Номер профиля в процессе: за одну секунду поток может снять несколько профилей одного представления
+_sequence = itertools.count(1)
+
+
+def make_token(user):
+    """Подписанный токен для заголовка профилирования, выдаётся только сотрудникам"""
+    if not user.is_staff:
+        raise ValueError(f'Пользователь {user.username} не является сотрудником')
+    return signing.dumps({'user': user.pk}, salt=TOKEN_SALT)
+
+
+def check_token(token):
+    max_age = getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 24 * 60 * 60)
+    try:
+        signing.loads(token, salt=TOKEN_SALT, max_age=max_age)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def profile_dir(view_name=None):
+    path = Path(getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+    if view_name:
+        path = path / view_name.replace(':', '.')
+    return path
+
+
+def profile_path(view_name, extension):
+    path = profile_dir(view_name)
+    os.makedirs(path, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return path / f'{stamp}-{os.getpid()}-{threading.get_ident()}-{next(_sequence)}.{extension}'
+
+
+def frame_label(code):
+    return f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """Сэмплирующий профайлер: периодически снимает стек потока, обрабатывающего запрос"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as output:
+            for stack, count in self.stacks.items():
+                output.write(f'{stack} {count}\n')
+
+
+def pstats_label(func):
+    filename, line, name = func
+    return f'{name} ({filename}:{line})'
+
+
+def pstats_to_collapsed(stats, max_depth=64):
+    """Восстанавливаем стеки для flamegraph из графа вызовов cProfile (время в микросекундах)"""
+    children = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, timings in callers.items():
+            children.setdefault(caller, []).append((func, timings[3]))
+    collapsed = Counter()
+
+    def walk(func, stack, share):
+        own_time = stats.stats[func][2]
+        collapsed[';'.join(stack)] += own_time * share
+        if len(stack) >= max_depth:
+            return
+        for child, edge_time in children.get(func, ()):
+            child_cumulative = stats.stats[child][3]
+            # Ветви короче микросекунды отбрасываем, иначе обход графа разрастается комбинаторно
+            if share * edge_time < 1e-6 or pstats_label(child) in stack:
+                continue
+            if child_cumulative:
+                walk(child, stack + [pstats_label(child)], share * edge_time / child_cumulative)
+
+    roots = {func for func, (_, _, _, _, callers) in stats.stats.items() if not callers}
+    # Цепочка middleware рекурсивна, поэтому у внешнего вызова тоже есть «вызывающие»
+    roots.add(max(stats.stats, key=lambda func: stats.stats[func][3]))
+    for func in roots:
+        walk(func, [pstats_label(func)], 1)
+    return Counter({stack: int(value * 1_000_000) for stack, value in collapsed.items() if value >= 1e-6})
@@ -0,0 +1,79 @@
+import hashlib
+import math
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+# Сколько запросов пропущено и отклонено по группам маршрутов в этом процессе
+_lock = threading.Lock()
+_counters = Counter()
+
+
+def take_token(key, rate, burst, now=None):
+    """Корзина токенов в кэше: пополняется со скоростью rate в секунду до burst.
+
+    Пополнение непрерывное, то есть окно скользящее: после паузы доступно ровно столько запросов, сколько
+    накопилось, а не «сколько осталось до конца минуты». Возвращаем 0, если токен взят, иначе — сколько
+    секунд ждать следующего. Чтение и запись в кэше не атомарны: в гонке лишний запрос может пройти.
+    """
+    cache = caches[settings.RATE_LIMIT_CACHE]
+    now = time.time() if now is None else now
+    tokens, updated = cache.get(key) or (burst, now)
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    # Полная корзина и отсутствие записи неразличимы: запись живёт, пока корзина не наполнится снова
+    cache.set(key, (tokens - 1, now), timeout=math.ceil(burst / rate) + 1)
+    return 0
+
+
+def client_keys(request):
+    """Ключи ограничения: сессия по cookie (или IP без неё) и IP, общий для всех сессий клиента"""
+    ip = request.META.get('REMOTE_ADDR', '')
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    # Пользователя и сессию из базы не читаем: отказ должен обходиться без запросов
+    identity = f's:{hashlib.sha1(session_key.encode()).hexdigest()}' if session_key else f'ip:{ip}'
+    return identity, f'ip:{ip}'
+
+
+def throttle(request, group):
+    """Ответ 429, если клиент исчерпал лимит группы маршрутов из RATE_LIMITS, иначе None"""
+    limit = settings.RATE_LIMITS.get(group)
+    if limit is None:
+        return None
+    identity, ip = client_keys(request)
+    wait = take_token(f'ratelimit:{group}:{identity}', limit['rate'], limit['burst'])
+    if not wait and identity != ip:
+        # Бот может каждый раз присылать новую cookie; общий лимит IP шире, чтобы не мешать клиентам за NAT
+        factor = settings.RATE_LIMIT_IP_FACTOR
+        wait = take_token(f'ratelimit:{group}:{ip}', limit['rate'] * factor, limit['burst'] * factor)
+    with _lock:
+        _counters[group, 'throttled' if wait else 'allowed'] += 1
+    if not wait:
+        return None
+    response = HttpResponse('Слишком много запросов, попробуйте позже', status=429,
+                            content_type='text/plain; charset=utf-8')
+    response.headers['Retry-After'] = math.ceil(wait)
+    return response
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+
+
+def render_metrics():
+    """Счётчики пропущенных и отклонённых запросов в формате Prometheus"""
+    with _lock:
+        counters = sorted(_counters.items())
+    lines = [
+        '# HELP musicshop_rate_limit_requests_total Запросы к ограниченным маршрутам',
+        '# TYPE musicshop_rate_limit_requests_total counter',
+        *(f'musicshop_rate_limit_requests_total{{group="{group}",result="{result}"}} {count}'
+          for (group, result), count in counters),
+    ]
+    return '\n'.join(lines) + '\n'
@@ -1,3 +1,1503 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import tempfile
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.contrib.sessions.backends.db import SessionStore
+from django.template import engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from utils import archive_orders, import_catalog, thumbnail_name
+
+from . import catalog, jobs, ratelimit
+from .async_views import AsyncAlbumDetailView, AsyncArtistDetailView, AsyncBaseView, AsyncCartView, db_read
+from .context_processors import shop
+from .db_router import replica_reads
+from .files import hashed_static_names
+from .hashers import PBKDF2PasswordHasher
+from .loadtest import LoadStats, compare_with_baseline
+from .membership import ProductMembership
+from .metrics import normalize_sql, registry
+from .middleware import PerformanceMiddleware, ReplicaPinningMiddleware
+from .notifications import DatabaseBroker, NotificationStream, publish
+from .profiling import make_token
+from .models import (
+    Album, ArchivedOrder, Artist, Cart, CartProduct, CatalogChange, Customer, Genre, ImageGallery, Job, MediaType,
+    Member, Notification, Order, StockMovement, StockSnapshot, notify_restocked,
+)
+
+User = get_user_model()
+
+CART_SIZES = (1, 10, 100)
+ORDER_COUNTS = (1, 50)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ShopTestCase(TestCase):
+    """Общие фикстуры каталога, покупателей и корзин"""
+
+    password = 'secret-password'
+
+    @classmethod
+    def setUpTestData(cls):
+        genre = Genre.objects.create(name='Rock', slug='rock')
+        cls.media_type = MediaType.objects.create(name='CD')
+        cls.artist = Artist.objects.create(
+            name='Metallica', slug='metallica', genre=genre, image='images/metallica.jpg'
+        )
+        cls.artist.members.add(*Member.objects.bulk_create([
+            Member(name=f'Member {number}', slug=f'member-{number}') for number in range(4)
+        ]))
+        cls.albums = Album.objects.bulk_create([
+            Album(
+                artist=cls.artist, name=f'Album {number}', slug=f'album-{number}', media_type=cls.media_type,
+                song_list='', release_date=date(2000, 1, 1), price=Decimal('100.00'), stock=1000,
+                image=f'images/album-{number}.jpg',
+            )
+            for number in range(max(CART_SIZES))
+        ])
+        StockSnapshot.objects.bulk_create([StockSnapshot(album=album, stock=album.stock) for album in cls.albums])
+        cls.album_ct = ContentType.objects.get_for_model(Album)
+
+    def setUp(self):
+        # Типы содержимого кэшируются после первого обращения, прогреваем кэш, чтобы он не искажал замеры
+        ContentType.objects.get_for_models(Album, Artist)
+        # Лимиты запросов живут в кэше процесса и не должны переходить из теста в тест
+        caches[settings.RATE_LIMIT_CACHE].clear()
+
+    def create_customer(self, username):
+        user = User.objects.create_user(username=username, password=self.password, email=f'{username}@example.ru')
+        return Customer.objects.create(user=user, phone='+70000000000')
+
+    def fill_cart(self, cart, size, customer=None):
+        products = CartProduct.objects.bulk_create([
+            CartProduct(
+                user=customer, cart=cart, content_type=self.album_ct, object_id=album.id, qty=1,
+                final_price=album.price,
+            )
+            for album in self.albums[:size]
+        ])
+        cart.products.add(*products)
+        cart.total_products = size
+        cart.final_price = sum(product.final_price for product in products)
+        cart.save()
+        return cart
+
+    def login_with_cart(self, size, username=None):
+        customer = self.create_customer(username or f'customer-{size}')
+        cart = self.fill_cart(Cart.objects.create(owner=customer), size, customer)
+        Customer.wishlist.through.objects.bulk_create([
+            Customer.wishlist.through(customer=customer, album=album) for album in self.albums[:size]
+        ])
+        Notification.objects.bulk_create([Notification(recipient=customer, text='Уведомление') for _ in range(size)])
+        self.client.force_login(customer.user)
+        return customer, cart
+
+    def anonymous_cart(self, size):
+        self.client.logout()
+        self.client.get(reverse('base'))
+        cart = Cart.objects.get(id=self.client.session['cart_id'])
+        return self.fill_cart(cart, size)
+
+    def create_orders(self, customer, count, lines=3):
+        for _ in range(count):
+            cart = self.fill_cart(Cart.objects.create(owner=customer, in_order=True), lines, customer)
+            Order.objects.create(
+                customer=customer, cart=cart, first_name='Иван', last_name='Иванов', phone='+70000000000',
+                buying_type=Order.BUYING_TYPE_SELF, status=Order.STATUS_COMPLETED,
+            )
+
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data or {}, HTTP_REFERER='/')
+        self.assertLess(response.status_code, 400)
+        return len(context.captured_queries)
+
+    def assertStableQueries(self, counts, max_queries):
+        """Число запросов не зависит от объёма данных и не превышает порога"""
+        self.assertEqual(len(set(counts.values())), 1, f'Число запросов растёт с объёмом данных: {counts}')
+        self.assertLessEqual(max(counts.values()), max_queries, f'Слишком много запросов: {counts}')
+
+
+class CatalogQueryCountTest(ShopTestCase):
+
+    def test_base_anonymous(self):
+        counts = {}
+        for size in CART_SIZES:
+            self.anonymous_cart(size)
+            counts[size] = self.count_queries('get', reverse('base'))
+        # Включая запрос слайдера
+        self.assertStableQueries(counts, 6)
+
+    def test_base(self):
+        counts = {}
+        for size in CART_SIZES:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries('get', reverse('base'))
+        self.assertStableQueries(counts, 10)
+
+    def test_artist_detail(self):
+        counts = {}
+        for size in CART_SIZES:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries('get', self.artist.get_absolute_url())
+        self.assertStableQueries(counts, 11)
+
+    def test_album_detail(self):
+        counts = {}
+        for size in CART_SIZES:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries('get', self.albums[0].get_absolute_url())
+        self.assertStableQueries(counts, 12)
+
+    def test_membership(self):
+        customer, cart = self.login_with_cart(10)
+        membership = ProductMembership(cart, customer.user)
+        with self.assertNumQueries(2):
+            in_cart = [album.id in membership.cart for album in self.albums[:50]]
+            in_wishlist = [album.id in membership.wishlist for album in self.albums[:50]]
+        self.assertEqual(in_cart, [True] * 10 + [False] * 40)
+        self.assertEqual(in_wishlist, in_cart)
+        self.assertContains(self.client.get(self.albums[0].get_absolute_url()), 'Добавлен в корзину')
+
+
+class CartQueryCountTest(ShopTestCase):
+
+    def test_cart(self):
+        counts = {}
+        for size in CART_SIZES:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries('get', reverse('cart'))
+        self.assertStableQueries(counts, 9)
+
+    def test_cart_anonymous(self):
+        counts = {}
+        for size in CART_SIZES:
+            self.anonymous_cart(size)
+            counts[size] = self.count_queries('get', reverse('cart'))
+        self.assertStableQueries(counts, 5)
+
+    def test_checkout(self):
+        counts = {}
+        for size in CART_SIZES:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries('get', reverse('checkout'))
+        self.assertStableQueries(counts, 9)
+
+    def test_add_to_cart(self):
+        counts = {}
+        album = self.albums[-1]
+        for size in CART_SIZES[:-1]:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries(
+                'get', reverse('add_to_cart', kwargs={'ct_model': album.ct_model, 'slug': album.slug})
+            )
+        self.assertStableQueries(counts, 15)
+
+    def test_delete_from_cart(self):
+        counts = {}
+        album = self.albums[0]
+        for size in CART_SIZES:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries(
+                'get', reverse('delete_from_cart', kwargs={'ct_model': album.ct_model, 'slug': album.slug})
+            )
+        self.assertStableQueries(counts, 13)
+
+    def test_change_qty(self):
+        counts = {}
+        album = self.albums[0]
+        for size in CART_SIZES:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries(
+                'post', reverse('change_qty', kwargs={'ct_model': album.ct_model, 'slug': album.slug}), {'qty': 3}
+            )
+        self.assertStableQueries(counts, 12)
+
+    def test_make_order(self):
+        counts = {}
+        data = {
+            'first_name': 'Иван', 'last_name': 'Иванов', 'phone': '+70000000000', 'address': 'ул. Тестовая',
+            'buying_type': Order.BUYING_TYPE_SELF, 'order_date': '2030-01-01', 'comment': '',
+        }
+        for size in CART_SIZES:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries('post', reverse('make-order'), data)
+        self.assertStableQueries(counts, 14)
+        self.assertEqual(Order.objects.count(), len(CART_SIZES))
+        self.assertEqual(
+            StockMovement.objects.current_stock([self.albums[0].id, self.albums[-1].id]),
+            {self.albums[0].id: 1000 - len(CART_SIZES), self.albums[-1].id: 999},
+        )
+
+
+class AccountQueryCountTest(ShopTestCase):
+
+    def test_account(self):
+        counts = {}
+        for count in ORDER_COUNTS:
+            customer, _ = self.login_with_cart(1, username=f'orders-{count}')
+            self.create_orders(customer, count)
+            counts[count] = self.count_queries('get', reverse('account'))
+        self.assertStableQueries(counts, 13)
+
+    def test_account_wishlist(self):
+        counts = {}
+        for size in CART_SIZES:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries('get', reverse('account'))
+        self.assertStableQueries(counts, 10)
+
+    def test_add_to_wishlist(self):
+        counts = {}
+        for size in CART_SIZES[:-1]:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries(
+                'get', reverse('add_to_wishlist', kwargs={'album_id': self.albums[-1].id})
+            )
+        self.assertStableQueries(counts, 5)
+
+    def test_remove_from_wishlist(self):
+        counts = {}
+        for size in CART_SIZES:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries(
+                'get', reverse('remove_from_wishlist', kwargs={'album_id': self.albums[0].id})
+            )
+        self.assertStableQueries(counts, 5)
+
+    def test_clear_notifications(self):
+        counts = {}
+        for size in CART_SIZES:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries('get', reverse('clear_notifications'))
+        self.assertStableQueries(counts, 4)
+
+
+class AuthQueryCountTest(ShopTestCase):
+
+    def test_login(self):
+        counts = {}
+        for size in CART_SIZES:
+            customer = self.create_customer(f'login-{size}')
+            self.fill_cart(Cart.objects.create(owner=customer), size, customer)
+            self.anonymous_cart(size)
+            counts[size] = self.count_queries(
+                'post', reverse('login'), {'username': customer.user.username, 'password': self.password}
+            )
+            self.assertEqual(int(self.client.session['_auth_user_id']), customer.user.id)
+        self.assertStableQueries(counts, 28)
+
+    def test_registration(self):
+        counts = {}
+        for size in CART_SIZES:
+            self.anonymous_cart(size)
+            counts[size] = self.count_queries('post', reverse('registration'), {
+                'username': f'new-{size}', 'password': self.password, 'confirm_password': self.password,
+                'first_name': 'Иван', 'last_name': 'Иванов', 'email': f'new-{size}@example.ru',
+            })
+        self.assertStableQueries(counts, 22)
+
+    def test_login_merges_carts(self):
+        customer = self.create_customer('merge')
+        customer_cart = self.fill_cart(Cart.objects.create(owner=customer), 3, customer)
+        anonymous_cart = self.anonymous_cart(5)
+        self.client.post(reverse('login'), {'username': 'merge', 'password': self.password})
+        self.assertFalse(Cart.objects.filter(id=anonymous_cart.id).exists())
+        customer_cart.refresh_from_db()
+        self.assertEqual(customer_cart.total_products, 5)
+        self.assertEqual(customer_cart.final_price, Decimal('800.00'))
+        self.assertEqual(
+            sorted(customer_cart.products.values_list('object_id', 'qty', 'cart', 'user')),
+            [(album.id, 2 if number < 3 else 1, customer_cart.id, customer.id)
+             for number, album in enumerate(self.albums[:5])],
+        )
+
+    def test_single_password_hash(self):
+        customer = self.create_customer('hash-once')
+        hasher = 'django.contrib.auth.hashers.MD5PasswordHasher'
+        with mock.patch(f'{hasher}.verify', autospec=True, return_value=True) as verify:
+            self.client.post(reverse('login'), {'username': 'hash-once', 'password': self.password})
+        self.assertEqual(verify.call_count, 1)
+        self.assertEqual(int(self.client.session['_auth_user_id']), customer.user.id)
+        self.client.logout()
+        with mock.patch(f'{hasher}.encode', autospec=True, return_value='md5$salt$hash') as encode, \
+                mock.patch(f'{hasher}.verify', autospec=True) as verify:
+            self.client.post(reverse('registration'), {
+                'username': 'hash-new', 'password': self.password, 'confirm_password': self.password,
+                'first_name': 'Иван', 'last_name': 'Иванов', 'email': 'hash-new@example.ru',
+            })
+        self.assertEqual((encode.call_count, verify.call_count), (1, 0))
+        self.assertEqual(self.client.session['_auth_user_id'], str(User.objects.get(username='hash-new').id))
+
+    def test_login_errors(self):
+        customer = self.create_customer('inactive')
+        response = self.client.post(reverse('login'), {'username': 'inactive', 'password': 'wrong-password'})
+        self.assertContains(response, 'Неверный пароль')
+        customer.user.is_active = False
+        customer.user.save()
+        response = self.client.post(reverse('login'), {'username': 'inactive', 'password': self.password})
+        self.assertContains(response, 'Учётная запись отключена')
+        self.assertNotIn('_auth_user_id', self.client.session)
+        response = self.client.post(reverse('login'), {'username': 'inactive', 'password': 'wrong-password'})
+        self.assertContains(response, 'Неверный пароль')
+        response = self.client.post(reverse('login'), {'username': 'nobody', 'password': self.password})
+        self.assertContains(response, 'Пользователь с логином nobody не найден в системе')
+
+    def test_hasher_params(self):
+        with override_settings(PASSWORD_HASHER_PARAMS={'pbkdf2_sha256': {'iterations': 1000}}):
+            self.assertEqual(PBKDF2PasswordHasher().iterations, 1000)
+            self.assertTrue(PBKDF2PasswordHasher().encode('secret', 'salt').startswith('pbkdf2_sha256$1000$'))
+
+    def test_login_page(self):
+        self.assertEqual(self.count_queries('get', reverse('login')), 0)
+        self.assertEqual(self.count_queries('get', reverse('registration')), 0)
+
+    def test_logout(self):
+        counts = {}
+        for size in CART_SIZES:
+            self.login_with_cart(size)
+            counts[size] = self.count_queries('get', reverse('logout'))
+        self.assertStableQueries(counts, 4)
+
+
+class StockLedgerTest(ShopTestCase):
+
+    def order(self, customer, size):
+        cart = self.fill_cart(Cart.objects.create(owner=customer, in_order=True), size, customer)
+        order = Order.objects.create(
+            customer=customer, cart=cart, first_name='Иван', last_name='Иванов', phone='+70000000000',
+            buying_type=Order.BUYING_TYPE_SELF,
+        )
+        StockMovement.objects.record_sales(order, cart.products.all())
+        return order
+
+    def test_sales_are_compacted_into_snapshots(self):
+        customer = self.create_customer('ledger')
+        self.order(customer, 2)
+        self.order(customer, 1)
+        album = self.albums[0]
+        self.assertEqual(Album.objects.get(id=album.id).stock, 1000)
+        self.assertEqual(StockMovement.objects.current_stock([album.id]), {album.id: 998})
+        self.assertEqual(StockMovement.objects.compact(), 2)
+        self.assertEqual(Album.objects.get(id=album.id).stock, 998)
+        self.assertEqual(StockSnapshot.objects.get(album=album).stock, 998)
+        self.assertEqual(StockMovement.objects.current_stock([album.id]), {album.id: 998})
+        self.assertEqual(StockMovement.objects.compact(), 0)
+        self.assertEqual(StockMovement.objects.count(), 3)
+
+    def test_late_commit_with_lower_id(self):
+        first, second = self.albums[0], self.albums[1]
+        StockMovement.objects.create(album=second, kind=StockMovement.KIND_ADJUSTMENT, delta=-1)
+        late_id = StockMovement.objects.create(album=second, kind=StockMovement.KIND_SALE, delta=-2).id
+        # Транзакция со вторым движением ещё не закоммичена, а движение первого альбома с большим id уже видно
+        StockMovement.objects.filter(id=late_id).delete()
+        StockMovement.objects.create(album=first, kind=StockMovement.KIND_SALE, delta=-3)
+        self.assertEqual(StockMovement.objects.compact(), 2)
+        self.assertEqual(StockMovement.objects.current_stock([first.id, second.id]), {first.id: 997, second.id: 999})
+        StockMovement.objects.create(id=late_id, album=second, kind=StockMovement.KIND_SALE, delta=-2)
+        self.assertEqual(StockMovement.objects.current_stock([second.id]), {second.id: 997})
+        self.assertEqual(StockMovement.objects.compact(), 1)
+        self.assertEqual(Album.objects.get(id=second.id).stock, 997)
+
+    def test_manual_stock_edit_is_recorded(self):
+        customer = self.create_customer('manual')
+        self.order(customer, 1)
+        album = Album.objects.get(id=self.albums[0].id)
+        album.name = 'Переименован'
+        album.save()
+        self.assertEqual(StockMovement.objects.current_stock([album.id]), {album.id: 999})
+        album.stock = 10
+        album.save()
+        adjustment = StockMovement.objects.latest('id')
+        self.assertEqual((adjustment.kind, adjustment.delta), (StockMovement.KIND_ADJUSTMENT, -989))
+        self.assertEqual(StockMovement.objects.current_stock([album.id]), {album.id: 10})
+
+    def test_restock_notifies_on_compaction(self):
+        customer = self.create_customer('waiting')
+        album = self.albums[0]
+        customer.wishlist.add(album)
+        StockMovement.objects.set_stock({album.id: 0})
+        StockMovement.objects.compact()
+        StockMovement.objects.create(album=album, kind=StockMovement.KIND_RESTOCK, delta=5)
+        StockMovement.objects.compact()
+        self.assertEqual(Album.objects.get(id=album.id).stock, 5)
+        self.assertEqual(Notification.objects.filter(recipient=customer).count(), 1)
+
+    def test_reconcile(self):
+        customer = self.create_customer('reconcile')
+        self.order(customer, 2)
+        unrecorded = self.order(customer, 1)
+        StockMovement.objects.filter(order=unrecorded).delete()
+        self.assertEqual(StockMovement.objects.reconcile(), [(unrecorded.id, self.albums[0].id, 1, 0)])
+
+
+class CatalogImportTest(ShopTestCase):
+
+    header = 'artist,genre,name,media_type,release_date,price,stock\n'
+
+    def test_create_and_update_by_slug(self):
+        customer, cart = self.login_with_cart(1, 'importer')
+        stats = import_catalog(StringIO(
+            self.header
+            + 'Metallica,Rock,Album 0,CD,2000-01-01,150,\n'
+            + 'Metallica,Rock,Ride the Lightning,CD,1984-07-27,120,3\n'
+        ))
+        self.assertEqual((stats['created'], stats['updated'], stats['artists'], stats['genres']), (1, 1, 0, 0))
+        updated = Album.objects.get(id=self.albums[0].id)
+        self.assertEqual(updated.price, Decimal('150.00'))
+        # Без остатка в файле остаток альбома не меняется
+        self.assertEqual(StockMovement.objects.current_stock([updated.id]), {updated.id: 1000})
+        created = Album.objects.get(artist=self.artist, slug='ride-the-lightning')
+        self.assertEqual((created.price, created.stock), (Decimal('120.00'), 3))
+        # Открытые корзины пересчитываются по новой цене
+        self.assertEqual(stats['repriced_lines'], 1)
+        cart.refresh_from_db()
+        self.assertEqual(cart.final_price, Decimal('150.00'))
+        stats = import_catalog(StringIO(self.header + 'Metallica,Rock,Album 0,CD,2000-01-01,150,\n'))
+        self.assertEqual((stats['created'], stats['updated'], stats['repriced_lines']), (0, 1, 0))
+
+    def test_stock_movement_kinds(self):
+        stats = import_catalog(StringIO(
+            self.header
+            + 'Metallica,Rock,Album 0,CD,2000-01-01,100,1200\n'
+            + 'Metallica,Rock,Album 1,CD,2000-01-01,100,900\n'
+            + 'Metallica,Rock,Album 2,CD,2000-01-01,100,1000\n'
+        ))
+        self.assertEqual(stats['stock_movements'], 2)
+        self.assertEqual(
+            sorted(StockMovement.objects.values_list('album_id', 'kind', 'delta')),
+            [(self.albums[0].id, StockMovement.KIND_RESTOCK, 200),
+             (self.albums[1].id, StockMovement.KIND_ADJUSTMENT, -100)],
+        )
+
+    def test_unknown_artist_genre_and_media_type(self):
+        stats = import_catalog(StringIO(
+            self.header
+            + 'Slayer,Thrash,Reign in Blood,LP,1986-10-07,100,5\n'
+            + 'Slayer,Thrash,South of Heaven,LP,1988-07-05,100,5\n'
+        ))
+        self.assertEqual((stats['artists'], stats['genres'], stats['media_types'], stats['created']), (1, 1, 1, 2))
+        artist = Artist.objects.get(slug='slayer')
+        self.assertEqual((artist.genre.slug, artist.album_count), ('thrash', 2))
+        self.assertEqual(set(artist.album_set.values_list('media_type__name', flat=True)), {'LP'})
+
+    def test_restock_notifies_waiting(self):
+        customer = self.create_customer('waiting')
+        customer.wishlist.add(self.albums[1], self.albums[2])
+        StockMovement.objects.set_stock({self.albums[1].id: 0, self.albums[2].id: 0})
+        StockMovement.objects.compact()
+        stats = import_catalog(StringIO(
+            self.header
+            + 'Metallica,Rock,Album 1,CD,2000-01-01,100,4\n'
+            + 'Metallica,Rock,Album 2,CD,2000-01-01,100,0\n'
+        ))
+        self.assertEqual(stats['notifications'], 1)
+        self.assertIn('Album 1', Notification.objects.get(recipient=customer).text)
+        self.assertEqual(list(customer.wishlist.all()), [self.albums[2]])
+
+    def test_jsonl(self):
+        stats = import_catalog(StringIO(
+            '{"artist": "Metallica", "genre": "Rock", "name": "Kill \'Em All", "media_type": "CD", '
+            '"release_date": "1983-07-25", "price": 90, "stock": 2}\n\n'
+        ), fmt='jsonl')
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(Album.objects.get(slug='kill-em-all').stock, 2)
+
+    def test_bad_rows(self):
+        with self.assertRaisesMessage(ValueError, 'Запись 2: не заполнены поля price'):
+            import_catalog(StringIO(
+                self.header
+                + 'Metallica,Rock,New album,CD,2020-01-01,100,1\n'
+                + 'Metallica,Rock,Broken,CD,2020-01-01,,1\n'
+            ))
+        # Пачка импортируется целиком или не импортируется вовсе
+        self.assertFalse(Album.objects.filter(slug='new-album').exists())
+        with self.assertRaises(ValueError):
+            import_catalog(StringIO(self.header + 'Metallica,Rock,Broken,CD,01.01.2020,100,1\n'))
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, 'catalog.csv')
+            path.write_text(self.header + 'Metallica,Rock,New album,CD,2020-01-01,100,1\n', encoding='utf-8')
+            stdout = StringIO()
+            call_command('import_catalog', str(path), stdout=stdout)
+            self.assertIn('Создано альбомов: 1', stdout.getvalue())
+            path.write_bytes((self.header + 'Ария,Рок,Герой асфальта,CD,1987-01-01,100,1\n').encode('cp1251'))
+            with self.assertRaises(CommandError):
+                call_command('import_catalog', str(path), stdout=StringIO())
+            with self.assertRaisesMessage(CommandError, 'No such file'):
+                call_command('import_catalog', str(Path(directory, 'missing.csv')))
+        self.assertFalse(Artist.objects.filter(name='Ария').exists())
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_admin_upload(self):
+        User.objects.create_superuser(username='admin', password=self.password, email='admin@example.ru')
+        self.client.login(username='admin', password=self.password)
+        url = reverse('admin:musicshop_album_import')
+        self.assertContains(self.client.get(url), 'Импорт каталога')
+        upload = SimpleUploadedFile('catalog.csv', f'{self.header}Metallica,Rock,New,CD,2020-01-01,100,1\n'.encode())
+        response = self.client.post(url, {'file': upload, 'format': ''})
+        self.assertEqual((response.status_code, response['Location']), (302, '../'))
+        response = self.client.get(reverse('admin:musicshop_album_changelist'))
+        self.assertContains(response, 'Создано альбомов: 1, обновлено: 0')
+        upload = SimpleUploadedFile('catalog.csv', f'{self.header}Metallica,Rock,Broken,CD,2020-01-01,,1\n'.encode())
+        response = self.client.post(url, {'file': upload, 'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Ошибка импорта: Запись 1: не заполнены поля price')
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+
+class OrderArchiveTest(ShopTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer, _ = self.login_with_cart(1, 'archive')
+        self.create_orders(self.customer, 3, lines=2)
+        Order.objects.filter(id__in=Order.objects.order_by('id').values('id')[:2]).update(order_date=date(2000, 1, 1))
+
+    def test_archive_completed_orders(self):
+        old_orders = list(Order.objects.order_by('id')[:2])
+        self.assertEqual(archive_orders(batch_size=1), 2)
+        self.assertEqual(archive_orders(batch_size=1), 0)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertFalse(Cart.objects.filter(id__in=[order.cart_id for order in old_orders]).exists())
+        self.assertEqual(CartProduct.objects.filter(cart__in_order=True).count(), 2)
+        archived = ArchivedOrder.objects.get(id=old_orders[0].id)
+        self.assertEqual((archived.cart_id, archived.cart.final_price), (old_orders[0].cart_id, Decimal('200.00')))
+        self.assertEqual(sorted(archived.cart.products.values_list('object_id', 'qty')),
+                         [(self.albums[0].id, 1), (self.albums[1].id, 1)])
+
+    def test_history_reads_both(self):
+        archive_orders()
+        history = self.customer.order_history()
+        self.assertEqual([order.id for order in history], sorted(order.id for order in history))
+        self.assertEqual([type(order) for order in history], [ArchivedOrder, ArchivedOrder, Order])
+        response = self.client.get(reverse('account'))
+        for order in history:
+            self.assertContains(response, f'Информация о заказе №{order.id}')
+
+    def test_bestseller_reads_archive(self):
+        Order.objects.update(order_date=timezone.localdate())
+        Order.objects.filter(id__in=Order.objects.order_by('id').values('id')[:2]).update(order_date=date(2000, 1, 1))
+        archive_orders()
+        ArchivedOrder.objects.update(order_date=timezone.localdate())
+        album, _ = Album.objects.get_month_bestseller()
+        self.assertIn(album, self.albums[:2])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть только в SQLite')
+class HotFilterIndexTest(ShopTestCase):
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f'INDEX {index_name}', plan)
+        self.assertNotRegex(plan, r'(?m)SCAN musicshop_\w+$')
+
+    def test_hot_filters_use_indexes(self):
+        customer, cart = self.login_with_cart(1, 'indexes')
+        self.assertUsesIndex(Cart.objects.filter(owner=customer, in_order=False).order_by('id')[:1],
+                             'cart_open_owner_idx')
+        self.assertUsesIndex(
+            CartProduct.objects.filter(
+                cart=cart, content_type=self.album_ct, object_id=self.albums[0].id, user=customer
+            ),
+            'cartproduct_cart_object_idx',
+        )
+        self.assertUsesIndex(Notification.objects.all(recipient=customer), 'notification_unread_idx')
+        self.assertUsesIndex(self.artist.image_gallery.all(), 'gallery_object_idx')
+        self.assertUsesIndex(ImageGallery.objects.filter(use_in_slider=True).order_by('-id')[:5], 'gallery_slider_idx')
+
+    def test_month_bestseller_uses_indexes(self):
+        query, params = Album.objects.month_bestseller_query()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {query}', params)
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+        # Обе части UNION ALL выбирают заказы по диапазону дат, позиции — по корзине; целиком читается
+        # только материализованный результат подзапроса
+        self.assertIn('SEARCH shop_order USING COVERING INDEX order_date_cart_idx', plan)
+        self.assertIn('SEARCH shop_cart_product USING INDEX cartproduct_cart_object_idx', plan)
+        self.assertRegex(plan, r'SEARCH shop_order USING INDEX musicshop_archivedorder_order_date_\w+ \(order_date>')
+        self.assertRegex(plan, r'SEARCH shop_cart_product USING INDEX musicshop_archivedcartproduct_cart_id_\w+')
+        self.assertNotIn('SCAN shop_order', plan)
+
+
+class GalleryTest(ShopTestCase):
+
+    def test_attach_loads_many_objects_at_once(self):
+        images = {
+            obj: [ImageGallery.objects.create(content_object=obj, image=f'images/{obj.slug}-{number}.jpg')
+                  for number in range(2)]
+            for obj in (self.artist, self.albums[0], self.albums[1])
+        }
+        albums = Album.objects.filter(id__in=[album.id for album in self.albums[:3]]).order_by('id')
+        objects = [Artist.objects.get(id=self.artist.id), *albums]
+        with self.assertNumQueries(1):
+            ImageGallery.objects.attach(objects)
+        for obj in objects:
+            self.assertEqual(obj.gallery, images.get(obj, []))
+
+    def test_slider(self):
+        ImageGallery.objects.create(content_object=self.artist, image='images/artist-slide.jpg', use_in_slider=True)
+        ImageGallery.objects.create(content_object=self.albums[0], image='images/album-slide.jpg', use_in_slider=True)
+        ImageGallery.objects.create(content_object=self.albums[1], image='images/hidden.jpg')
+        # Слайды, исполнители, альбомы и исполнители альбомов для ссылок
+        with self.assertNumQueries(4):
+            slides = ImageGallery.objects.slider(5)
+            urls = [slide.content_object.get_absolute_url() for slide in slides]
+        self.assertEqual(urls, [self.albums[0].get_absolute_url(), self.artist.get_absolute_url()])
+        self.assertContains(self.client.get(reverse('base')), 'id="slider"')
+
+    def test_thumbnails(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory):
+            buffer = BytesIO()
+            PILImage.new('RGB', (1000, 500), 'red').save(buffer, format='JPEG')
+            image = ImageGallery(content_object=self.artist)
+            image.image.save('gallery.jpg', ContentFile(buffer.getvalue()), save=False)
+            image.save()
+            image.refresh_from_db()
+            self.assertEqual((image.width, image.height), (1000, 500))
+            self.assertEqual(image.thumbnail_widths(), [320, 640])
+            for width in (320, 640):
+                with PILImage.open(Path(directory) / thumbnail_name(image.image.name, width)) as thumbnail:
+                    self.assertEqual(thumbnail.size, (width, width // 2))
+            self.assertEqual(image.thumbnail_url(), f'/media/thumbnails/640/{image.image.name}')
+            response = self.client.get(self.artist.get_absolute_url())
+        self.assertContains(response, f'srcset="{image.srcset()}"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_missing_file_falls_back_to_original(self):
+        image = ImageGallery.objects.create(content_object=self.artist, image='images/missing.jpg')
+        self.assertIsNone(image.width)
+        self.assertEqual(image.thumbnail_url(), image.image.url)
+        self.assertEqual(image.srcset(), '')
+
+
+class CatalogCounterTest(ShopTestCase):
+
+    def counters(self, artist):
+        artist.refresh_from_db()
+        return artist.album_count, artist.in_stock_count
+
+    def test_album_signals(self):
+        Artist.objects.recount()
+        self.assertEqual(self.counters(self.artist), (100, 100))
+        album = Album.objects.get(id=self.albums[0].id)
+        album.stock = 0
+        album.save()
+        self.assertEqual(self.counters(self.artist), (100, 99))
+        other = Artist.objects.create(name='Slayer', slug='slayer', genre=self.artist.genre)
+        album.artist = other
+        album.save()
+        self.assertEqual(self.counters(self.artist), (99, 99))
+        self.assertEqual(self.counters(other), (1, 0))
+        album.delete()
+        self.assertEqual(self.counters(other), (0, 0))
+
+    def test_compaction_and_import(self):
+        Artist.objects.recount()
+        StockMovement.objects.set_stock({self.albums[0].id: 0, self.albums[1].id: 0})
+        StockMovement.objects.compact()
+        self.assertEqual(self.counters(self.artist), (100, 98))
+        import_catalog(StringIO(
+            'artist,genre,name,media_type,release_date,price,stock\n'
+            'Metallica,Rock,New album,CD,2020-01-01,100,0\n'
+            'Slayer,Thrash,Reign in Blood,CD,1986-10-07,100,5\n'
+        ))
+        self.assertEqual(self.counters(self.artist), (101, 98))
+        self.assertEqual(self.counters(Artist.objects.get(slug='slayer')), (1, 1))
+        self.assertEqual(Genre.objects.get(slug='thrash').artist_count, 1)
+
+    def test_seed_shop(self):
+        version = CatalogChange.objects.version()
+        call_command(
+            'seed_shop', genres=2, artists=5, members=5, albums=30, customers=3, orders=5, end_date=date(2024, 1, 1),
+            stdout=StringIO(),
+        )
+        self.assertFalse(Genre.objects.stale().exists())
+        self.assertFalse(Artist.objects.stale().exists())
+        seeded = Artist.objects.filter(slug__startswith='seed-artist-')
+        self.assertEqual(sum(seeded.values_list('album_count', flat=True)), 30)
+        seeded_genres = Genre.objects.filter(slug__startswith='seed-genre-')
+        self.assertEqual(sum(seeded_genres.values_list('artist_count', flat=True)), 5)
+        self.assertTrue(CatalogChange.objects.filter(id__gt=version, model='album', object_id=None).exists())
+
+    def test_genre_signals(self):
+        genre = self.artist.genre
+        other = Genre.objects.create(name='Metal', slug='metal')
+        genre.refresh_from_db()
+        self.assertEqual(genre.artist_count, 1)
+        self.artist.genre = other
+        self.artist.save()
+        self.assertEqual(list(Genre.objects.order_by('-artist_count').values_list('slug', 'artist_count')),
+                         [('metal', 1), ('rock', 0)])
+        Artist.objects.get(id=self.artist.id).delete()
+        other.refresh_from_db()
+        self.assertEqual(other.artist_count, 0)
+
+    def test_reconcile_command(self):
+        # Фикстура создаёт альбомы через bulk_create, в обход сигналов
+        self.assertEqual(self.counters(self.artist), (0, 0))
+        stdout = StringIO()
+        call_command('reconcile_counters', '--dry-run', stdout=stdout)
+        self.assertIn('альбомов 0 вместо 100', stdout.getvalue())
+        self.assertEqual(self.counters(self.artist), (0, 0))
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(self.counters(self.artist), (100, 100))
+        self.assertFalse(Artist.objects.stale().exists())
+        stdout = StringIO()
+        call_command('reconcile_counters', stdout=stdout)
+        self.assertIn('Счётчики сходятся', stdout.getvalue())
+
+    def test_artist_page_discography(self):
+        Artist.objects.recount()
+        with self.assertNumQueries(3):
+            artist = Artist.objects.detail_page().get(id=self.artist.id)
+            rows = [(album.media_type.name, album.get_absolute_url()) for album in artist.discography]
+            members = [member.name for member in artist.members.all()]
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(len(members), 4)
+        response = self.client.get(self.artist.get_absolute_url())
+        self.assertContains(response, 'Альбомов: 100, в наличии: 100')
+        self.assertContains(response, self.albums[99].get_absolute_url())
+
+
+@override_settings(CATALOG_SNAPSHOT=True, CATALOG_SNAPSHOT_REFRESH_SECONDS=0)
+class CatalogSnapshotTest(ShopTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.snapshot = catalog.load()
+
+    def catalog_pages(self):
+        urls = [
+            reverse('catalog'), reverse('catalog') + '?page=5', reverse('catalog') + '?genre=metal',
+            reverse('catalog') + '?media_type=LP&in_stock=1', reverse('catalog') + '?genre=rock&in_stock=1&page=2',
+        ]
+        return [self.client.get(url).json() for url in urls]
+
+    def test_same_as_database(self):
+        metal = Genre.objects.create(name='Metal', slug='metal')
+        other = Artist.objects.create(name='Slayer', slug='slayer', genre=metal)
+        album = Album.objects.get(id=self.albums[0].id)
+        album.artist = other
+        album.media_type = MediaType.objects.create(name='LP')
+        album.save()
+        Album.objects.filter(id__in=[album.id for album in self.albums[50:]]).update(stock=0)
+        CatalogChange.objects.record(Album)
+        with override_settings(CATALOG_SNAPSHOT=False):
+            expected = self.catalog_pages()
+        self.assertEqual(self.catalog_pages(), expected)
+        self.assertEqual(expected[0]['facets'], {
+            'genres': {'rock': 99, 'metal': 1}, 'media_types': {'CD': 99, 'LP': 1}, 'in_stock': 50,
+        })
+        self.assertEqual(expected[3]['albums'][0]['url'], '/slayer/album-0/')
+
+    def test_refresh_applies_changes(self):
+        album = Album.objects.get(id=self.albums[0].id)
+        album.name = 'Переименован'
+        album.stock = 0
+        album.save()
+        new = Album.objects.create(
+            artist=self.artist, name='New', slug='new', media_type=self.media_type, release_date=date(2020, 1, 1),
+            price=Decimal('10.00'), stock=1,
+        )
+        Album.objects.get(id=self.albums[1].id).delete()
+        genre = self.artist.genre
+        genre.name = 'Рок'
+        genre.save()
+        snapshot = catalog.get_snapshot()
+        self.assertIs(snapshot, self.snapshot)
+        self.assertEqual(snapshot.albums[album.id].name, 'Переименован')
+        self.assertEqual(snapshot.latest_albums(1)[0].id, new.id)
+        self.assertNotIn(self.albums[1].id, snapshot.albums)
+        self.assertIsNone(snapshot.album_by_slug('album-1'))
+        self.assertEqual(snapshot.artists[self.artist.id].album_count, 100)
+        self.assertEqual(snapshot.artists[self.artist.id].genre.name, 'Рок')
+        self.assertEqual(snapshot.facets()['in_stock'], 99)
+        self.assertEqual(snapshot.artist_updated_at('metallica'), Album.objects.latest('updated_at').updated_at)
+        # Без изменений процесс читает только журнал
+        with self.assertNumQueries(1):
+            catalog.get_snapshot()
+        CatalogChange.objects.prune(0)
+        self.assertIsNot(catalog.get_snapshot(), snapshot)
+
+    @override_settings(DATABASE_REPLICAS=['replica0'])
+    def test_refresh_reads_primary(self):
+        album = Album.objects.get(id=self.albums[0].id)
+        album.price = Decimal('2007.00')
+        album.save()
+        # Внутри запроса каталог читается с реплик; в тестах реплики replica0 нет, и обращение к ней упало бы
+        with replica_reads():
+            snapshot = self.snapshot.refresh()
+            self.assertEqual(snapshot.albums[album.id].price, Decimal('2007.00'))
+            self.assertEqual(catalog.CatalogSnapshot().version, snapshot.version)
+
+    def test_pages_without_catalog_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertContains(self.client.get(reverse('base')), self.albums[99].get_absolute_url())
+        url = self.albums[0].get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        with override_settings(CATALOG_SNAPSHOT=False):
+            self.assertEqual(self.client.get(url)['ETag'], etag)
+        with CaptureQueriesContext(connection) as not_modified:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        for query in context.captured_queries + not_modified.captured_queries:
+            self.assertNotIn('FROM "musicshop_album" ORDER BY', query['sql'])
+        self.assertFalse(any('musicshop_album' in query['sql'] for query in not_modified.captured_queries))
+
+    def test_stats(self):
+        stats = self.snapshot.stats()
+        self.assertEqual(stats['records'], {'genre': 1, 'mediatype': 1, 'artist': 1, 'album': 100})
+        self.assertGreater(stats['bytes'], 100 * 100)
+        metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('musicshop_catalog_snapshot_records{model="album"} 100', metrics)
+        stdout = StringIO()
+        call_command('catalog_snapshot', stdout=stdout)
+        self.assertIn('Память снимка', stdout.getvalue())
+
+
+class ConditionalGetTest(ShopTestCase):
+
+    def get(self, url, etag=None):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag) if etag else self.client.get(url)
+
+    def test_not_modified_before_heavy_queries(self):
+        self.login_with_cart(10)
+        url = self.albums[0].get_absolute_url()
+        response = self.get(url)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertNotIn('Last-Modified', response)
+        with CaptureQueriesContext(connection) as context:
+            response = self.get(url, response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any('"musicshop_album"."song_list"' in query['sql'] for query in context.captured_queries))
+
+    def test_personal_state_changes_etag(self):
+        customer, _ = self.login_with_cart(1)
+        album = self.albums[5]
+        etag = self.get(album.get_absolute_url())['ETag']
+        self.client.get(reverse('add_to_cart', kwargs={'ct_model': album.ct_model, 'slug': album.slug}),
+                        HTTP_REFERER='/')
+        self.assertEqual(self.get(album.get_absolute_url(), etag).status_code, 200)
+        etag = self.get(album.get_absolute_url())['ETag']
+        Notification.objects.create(recipient=customer, text='Новое уведомление')
+        self.assertEqual(self.get(album.get_absolute_url(), etag).status_code, 200)
+
+    def test_catalog_changes_bump_updated_at(self):
+        url = self.artist.get_absolute_url()
+        etag = self.get(url)['ETag']
+        self.assertEqual(self.get(url, etag).status_code, 304)
+        for change in (
+            lambda: self.artist.members.add(Member.objects.create(name='New member', slug='new-member')),
+            lambda: Member.objects.filter(slug='new-member').get().save(),
+            lambda: self.artist.genre.save(),
+            lambda: ImageGallery.objects.create(content_object=self.artist, image='images/gallery.jpg'),
+            # Альбомы видны в дискографии на странице исполнителя
+            lambda: Album.objects.get(id=self.albums[0].id).save(),
+            lambda: Album.objects.get(id=self.albums[1].id).delete(),
+        ):
+            change()
+            self.assertEqual(self.get(url, etag).status_code, 200)
+            etag = self.get(url)['ETag']
+
+    def test_guest_if_modified_since(self):
+        url = self.albums[0].get_absolute_url()
+        response = self.get(url)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        # Last-Modified с точностью до секунды: правку в ту же секунду ловит только ETag
+        Album.objects.filter(id=self.albums[0].id).update(updated_at=timezone.now() + timedelta(seconds=2))
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 200)
+
+
+@override_settings(SHARED_CACHE_PAGES=True)
+class SharedCacheTest(ShopTestCase):
+
+    def urls(self):
+        return reverse('base'), self.artist.get_absolute_url(), self.albums[0].get_absolute_url()
+
+    def test_guest_pages_are_public(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response['Cache-Control'], 'public, max-age=0, s-maxage=60')
+                self.assertNotIn('Vary', response)
+                self.assertFalse(response.cookies)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_page_is_same_for_customer(self):
+        url = self.albums[0].get_absolute_url()
+        guest = self.client.get(url)
+        self.login_with_cart(10)
+        # Только каталог: ни сессии, ни покупателя, ни корзины
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(response.content, guest.content)
+        self.assertEqual(response['ETag'], guest['ETag'])
+        self.assertEqual(response['Cache-Control'], 'public, max-age=0, s-maxage=60')
+        self.assertContains(response, 'data-album-buttons')
+
+    def test_personal(self):
+        self.login_with_cart(10)
+        response = self.client.get(reverse('personal'), {'albums': [self.albums[0].id, self.albums[50].id]})
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+        personal = response.json()
+        self.assertEqual(personal['cart'], 10)
+        self.assertIn('Личный кабинет', personal['nav'])
+        self.assertIn('Добавлен в корзину', personal['albums'][str(self.albums[0].id)])
+        self.assertIn('Добавить в корзину', personal['albums'][str(self.albums[50].id)])
+
+    def test_personal_guest_creates_no_cart(self):
+        personal = self.client.get(reverse('personal'), {'albums': self.albums[0].id, 'detail': 1}).json()
+        self.assertEqual(personal['cart'], 0)
+        self.assertIn('Авторизация', personal['nav'])
+        self.assertIn('Зарегистрируйтесь', personal['albums'][str(self.albums[0].id)])
+        self.assertFalse(Cart.objects.exists())
+
+
+class JobQueueTest(ShopTestCase):
+
+    def test_enqueued_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Job.objects.enqueue('compact_stock', unique=True)
+        self.assertFalse(Job.objects.exists())
+        for callback in callbacks * 2:
+            callback()
+        self.assertEqual(list(Job.objects.values_list('name', 'payload')), [('compact_stock', {})])
+
+    @override_settings(MANAGERS=[('Менеджер', 'manager@example.ru')])
+    def test_order_side_effects(self):
+        customer, cart = self.login_with_cart(3)
+        customer.wishlist.clear()
+        data = {
+            'first_name': 'Иван', 'last_name': 'Иванов', 'phone': '+70000000000', 'address': 'ул. Тестовая',
+            'buying_type': Order.BUYING_TYPE_SELF, 'order_date': '2030-01-01', 'comment': '',
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('make-order'), data)
+        order = Order.objects.get(customer=customer)
+        self.assertEqual(order.cart, cart)
+        self.assertEqual(sorted(Job.objects.values_list('name', flat=True)), ['alert_managers', 'compact_stock'])
+        self.assertEqual(Album.objects.get(id=self.albums[0].id).stock, 1000)
+        self.assertEqual(jobs.run_pending(), (2, 0))
+        self.assertEqual(Album.objects.get(id=self.albums[0].id).stock, 999)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(f'Новый заказ №{order.id}', mail.outbox[0].subject)
+        self.assertFalse(Job.objects.exists())
+
+    def test_restock_notification(self):
+        customer = self.create_customer('waiting')
+        album = self.albums[0]
+        customer.wishlist.add(album)
+        StockMovement.objects.set_stock({album.id: 0})
+        StockMovement.objects.compact()
+        album = Album.objects.get(id=album.id)
+        album.stock = 5
+        with self.captureOnCommitCallbacks(execute=True):
+            album.save()
+        self.assertFalse(Notification.objects.filter(recipient=customer).exists())
+        jobs.run_pending()
+        self.assertEqual(Notification.objects.filter(recipient=customer).count(), 1)
+
+    def test_retries_with_backoff(self):
+        failing = mock.Mock(side_effect=RuntimeError('Почта недоступна'))
+        job = Job.objects.create(name='failing')
+        with mock.patch.dict(jobs.tasks, failing=failing), self.assertLogs('musicshop.jobs', 'ERROR'):
+            delays = []
+            for _ in range(settings.JOB_MAX_ATTEMPTS):
+                self.assertEqual(jobs.run_pending(), (0, 1))
+                job.refresh_from_db()
+                delays.append(round((job.run_at - timezone.now()).total_seconds()))
+                Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        self.assertEqual(failing.call_count, settings.JOB_MAX_ATTEMPTS)
+        self.assertEqual(delays[:3], [30, 60, 120])
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_FAILED, settings.JOB_MAX_ATTEMPTS))
+        self.assertIn('Почта недоступна', job.last_error)
+        self.assertEqual(jobs.run_pending(), (0, 0))
+
+    def test_abandoned_job_is_requeued(self):
+        Job.objects.create(name='compact_stock', status=Job.STATUS_RUNNING,
+                           locked_at=timezone.now() - timedelta(seconds=settings.JOB_LOCK_SECONDS + 1))
+        Job.objects.create(name='compact_stock', status=Job.STATUS_RUNNING, locked_at=timezone.now())
+        stdout = StringIO()
+        call_command('run_jobs', '--once', stdout=stdout)
+        self.assertIn('Выполнено задач: 1', stdout.getvalue())
+        # Задачу, которую обработчик держит недавно, не трогаем
+        self.assertEqual(Job.objects.get().status, Job.STATUS_RUNNING)
+
+    def test_abandoned_job_without_attempts_fails(self):
+        job = Job.objects.create(name='compact_stock', status=Job.STATUS_RUNNING, attempts=settings.JOB_MAX_ATTEMPTS,
+                                 locked_at=timezone.now() - timedelta(seconds=settings.JOB_LOCK_SECONDS + 1))
+        self.assertEqual(jobs.run_pending(), (0, 0))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_at), (Job.STATUS_FAILED, None))
+        self.assertTrue(job.last_error)
+
+
+@override_settings(RATE_LIMITS={'cart': {'rate': 1, 'burst': 2}}, RATE_LIMIT_IP_FACTOR=2)
+class RateLimitTest(ShopTestCase):
+
+    def setUp(self):
+        super().setUp()
+        ratelimit.reset()
+        album = self.albums[0]
+        self.url = reverse('add_to_cart', kwargs={'ct_model': album.ct_model, 'slug': album.slug})
+
+    def test_token_bucket(self):
+        self.assertEqual([ratelimit.take_token('bucket', 1, 2, now=0) for _ in range(3)], [0, 0, 1])
+        self.assertEqual(ratelimit.take_token('bucket', 1, 2, now=0.5), 0.5)
+        self.assertEqual(ratelimit.take_token('bucket', 1, 2, now=1), 0)
+        # Накопить больше burst нельзя
+        self.assertEqual([ratelimit.take_token('bucket', 1, 2, now=100) for _ in range(3)], [0, 0, 1])
+
+    def test_throttled_before_database(self):
+        self.anonymous_cart(1)
+        for _ in range(2):
+            self.assertEqual(self.client.get(self.url, HTTP_REFERER='/').status_code, 302)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_REFERER='/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        # Другая сессия со своим лимитом
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url, HTTP_REFERER='/').status_code, 302)
+        # Лимит только у групп из RATE_LIMITS
+        self.assertEqual(self.client.get(reverse('cart')).status_code, 200)
+        metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('musicshop_rate_limit_requests_total{group="cart",result="allowed"} 3', metrics)
+        self.assertIn('musicshop_rate_limit_requests_total{group="cart",result="throttled"} 1', metrics)
+
+    def test_ip_limit_for_new_cookies(self):
+        statuses = []
+        for number in range(5):
+            self.client.cookies[settings.SESSION_COOKIE_NAME] = f'bot-{number}'
+            statuses.append(self.client.get(self.url, HTTP_REFERER='/').status_code)
+        self.assertEqual(statuses, [302, 302, 302, 302, 429])
+
+
+class RepriceTest(ShopTestCase):
+
+    def test_price_change_reprices_open_carts(self):
+        customer = self.create_customer('reprice')
+        open_cart = self.fill_cart(Cart.objects.create(owner=customer), 3, customer)
+        open_cart.products.filter(object_id=self.albums[0].id).update(qty=2, final_price=Decimal('200.00'))
+        ordered_cart = self.fill_cart(Cart.objects.create(owner=customer, in_order=True), 3, customer)
+        album = Album.objects.get(id=self.albums[0].id)
+        album.price = Decimal('150.00')
+        with override_settings(CART_REPRICE_CHUNK_SIZE=1):
+            with self.captureOnCommitCallbacks(execute=True):
+                album.save()
+            # Перерасчёт — фоновая задача
+            self.assertEqual(open_cart.products.get(object_id=album.id).final_price, Decimal('200.00'))
+            self.assertEqual(jobs.run_pending(), (1, 0))
+        open_cart.refresh_from_db()
+        ordered_cart.refresh_from_db()
+        self.assertEqual(open_cart.products.get(object_id=album.id).final_price, Decimal('300.00'))
+        self.assertEqual(open_cart.final_price, Decimal('500.00'))
+        self.assertEqual(ordered_cart.products.get(object_id=album.id).final_price, Decimal('100.00'))
+        self.assertEqual(ordered_cart.final_price, Decimal('300.00'))
+
+    def test_same_price_skips_repricing(self):
+        album = Album.objects.get(id=self.albums[0].id)
+        with self.captureOnCommitCallbacks() as callbacks:
+            album.save()
+        self.assertEqual(callbacks, [])
+
+
+class MetricsTest(ShopTestCase):
+
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    def test_metrics_per_view(self):
+        self.login_with_cart(10)
+        self.client.get(reverse('cart'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('musicshop_request_duration_seconds_count{view="cart"} 1', body)
+        self.assertIn('musicshop_sql_queries_sum{view="cart"} 9', body)
+        self.assertIn('musicshop_template_render_seconds_count{view="cart"} 1', body)
+        self.assertIn('musicshop_response_size_bytes_bucket{view="cart",le="+Inf"} 1', body)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_metrics_forbidden(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE a = 'x' AND b IN (%s, %s, %s) AND c >= 10"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) AND c >= ?',
+        )
+
+
+class LoadTestReportTest(SimpleTestCase):
+
+    def summary(self, throughput, p95):
+        return {'throughput': throughput, 'urls': {'base': {'p95': p95}}}
+
+    def test_percentile(self):
+        values = list(range(100, 0, -1))
+        percentiles = [LoadStats.percentile(values, percent) for percent in (0, 50, 95, 99, 100)]
+        self.assertEqual(percentiles, [1, 50, 95, 99, 100])
+        self.assertEqual(LoadStats.percentile([0.3], 95), 0.3)
+        self.assertEqual(LoadStats.percentile([0.1, 0.2, 0.3, 0.4], 50), 0.2)
+
+    def test_baseline_regression_boundary(self):
+        baseline = self.summary(100, 0.5)
+        # Ровно на границе max_regression прогон ещё проходит
+        lines, regressions = compare_with_baseline(self.summary(75, 0.625), baseline, 0.25)
+        self.assertEqual(regressions, [])
+        self.assertIn('(-25%)', lines[0])
+        self.assertIn('(+25%)', lines[1])
+        self.assertEqual(compare_with_baseline(self.summary(74, 0.5), baseline, 0.25)[1], ['throughput'])
+        self.assertEqual(compare_with_baseline(self.summary(100, 0.63), baseline, 0.25)[1], ['base'])
+        # URL, которого не было в прошлом прогоне, не сравниваем
+        current = {'throughput': 100, 'urls': {'cart': {'p95': 10}}}
+        lines, regressions = compare_with_baseline(current, baseline, 0.25)
+        self.assertEqual((len(lines), regressions), (1, []))
+
+
+class ProfilingTest(ShopTestCase):
+
+    def test_signed_header(self):
+        staff = User.objects.create_user(username='staff', password=self.password, is_staff=True)
+        with tempfile.TemporaryDirectory() as directory, override_settings(PROFILING_DIR=directory):
+            self.client.get(reverse('login'), HTTP_X_PROFILE='forged')
+            self.assertEqual(list(Path(directory).rglob('*.prof')), [])
+            self.client.get(reverse('login'), HTTP_X_PROFILE=make_token(staff))
+            self.assertEqual(len(list(Path(directory, 'login').glob('*.prof'))), 1)
+            # Профили одного представления в одну секунду не перезаписывают друг друга
+            with mock.patch('musicshop.profiling.time.strftime', return_value='20240101-000000'):
+                for _ in range(2):
+                    self.client.get(reverse('login'), HTTP_X_PROFILE=make_token(staff))
+            self.assertEqual(len(list(Path(directory, 'login').glob('*.prof'))), 3)
+
+    def test_token_for_staff_only(self):
+        customer = self.create_customer('not-staff')
+        with self.assertRaises(ValueError):
+            make_token(customer.user)
+
+
+@override_settings(DATABASE_REPLICAS=['replica0'])
+class ReplicaRoutingTest(ShopTestCase):
+
+    def routed(self, action=None, method='get', **cookies):
+        """Куда маршрутизируются чтения после action внутри запроса (запросы к реплике не выполняются)"""
+
+        def view(request):
+            if action:
+                action()
+            return HttpResponse(' '.join(model.objects.all().db for model in (Album, Customer.wishlist.through, Cart)))
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies)
+        response = ReplicaPinningMiddleware(view)(request)
+        return response.content.decode(), response.cookies.get('pin_primary')
+
+    def test_catalog_reads_use_replica(self):
+        self.assertEqual(self.routed(), ('replica0 replica0 default', None))
+        self.assertEqual(Album.objects.all().db, 'default')
+
+    def test_write_pins_request(self):
+        customer = self.create_customer('replica')
+        routing, pin = self.routed(lambda: Notification.objects.create(recipient=customer, text='Уведомление'))
+        self.assertEqual((routing, pin), ('default default default', None))
+        self.assertEqual(self.routed(method='post')[0], 'default default default')
+
+    def test_catalog_write_pins_next_requests(self):
+        customer = self.create_customer('replica')
+        routing, pin = self.routed(lambda: customer.wishlist.add(self.albums[0]))
+        self.assertEqual(routing, 'default default default')
+        self.assertEqual(pin['max-age'], 5)
+        self.assertEqual(self.routed(pin_primary='1')[0], 'default default default')
+
+
+class AsyncViewsTest(TransactionTestCase):
+    """Async-представления читают БД из других потоков, поэтому данные должны быть закоммичены"""
+
+    def setUp(self):
+        genre = Genre.objects.create(name='Rock', slug='rock')
+        media_type = MediaType.objects.create(name='CD')
+        artist = Artist.objects.create(name='Metallica', slug='metallica', genre=genre, image='images/metallica.jpg')
+        Album.objects.create(
+            artist=artist, name='Master of Puppets', slug='master-of-puppets', media_type=media_type, song_list='',
+            release_date=date(1986, 3, 3), price=Decimal('100.00'), stock=10, image='images/master.jpg',
+        )
+
+    def get(self, view, headers=None, **kwargs):
+        request = RequestFactory().get('/', **(headers or {}))
+        request.session = SessionStore()
+        request.user = AnonymousUser()
+        return asyncio.run(view.as_view()(request, **kwargs))
+
+    def test_views(self):
+        for view, kwargs, text in (
+            (AsyncBaseView, {}, 'Master of Puppets'),
+            (AsyncArtistDetailView, {'artist_slug': 'metallica'}, 'Metallica'),
+            (AsyncAlbumDetailView, {'artist_slug': 'metallica', 'album_slug': 'master-of-puppets'},
+             'Master of Puppets'),
+            (AsyncCartView, {}, 'Ваша корзина'),
+        ):
+            with self.subTest(view=view.__name__):
+                self.assertContains(self.get(view, **kwargs), text)
+
+    def test_detail_not_modified(self):
+        kwargs = {'artist_slug': 'metallica', 'album_slug': 'master-of-puppets'}
+        etag = self.get(AsyncAlbumDetailView, **kwargs)['ETag']
+        response = self.get(AsyncAlbumDetailView, {'HTTP_IF_NONE_MATCH': etag}, **kwargs)
+        self.assertEqual(response.status_code, 304)
+
+    def test_middleware_chain_stays_async(self):
+        # convert_exception_to_response оборачивает каждое звено цепочки через functools.wraps
+        link = ASGIHandler()._middleware_chain.__wrapped__
+        middleware = []
+        while hasattr(link, 'get_response'):
+            middleware.append(link)
+            link = getattr(link.get_response, '__wrapped__', link.get_response)
+        # Ни одно звено не понадобилось переводить в sync-режим и обратно
+        self.assertEqual(len(middleware), len(settings.MIDDLEWARE))
+        self.assertTrue(all(iscoroutinefunction(instance) for instance in middleware))
+        self.assertEqual(link.__name__, '_get_response_async')
+
+    def test_queries_from_threads_counted(self):
+        registry.reset()
+
+        async def view(request):
+            await asyncio.gather(db_read(Genre.objects.count), db_read(Album.objects.count))
+            return HttpResponse()
+
+        asyncio.run(PerformanceMiddleware(view)(RequestFactory().get('/')))
+        self.assertIn('musicshop_sql_queries_sum{view="unresolved"} 2', registry.render())
+
+    @override_settings(SHARED_CACHE_PAGES=True)
+    def test_shared_page(self):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        view = AsyncAlbumDetailView.as_view()
+        response = asyncio.run(view(request, artist_slug='metallica', album_slug='master-of-puppets'))
+        self.assertContains(response, 'Зарегистрируйтесь')
+        self.assertFalse(request.session.accessed)
+        self.assertFalse(Cart.objects.exists())
+
+
+class TemplateProfileTest(ShopTestCase):
+
+    def test_header_context_is_lazy(self):
+        customer, cart = self.login_with_cart(10)
+        request = RequestFactory().get('/')
+        request.user = customer.user
+        request.session = SessionStore()
+        with self.assertNumQueries(0):
+            context = shop(request)
+        # Уведомления одним запросом, корзина — покупатель и корзина
+        with self.assertNumQueries(3):
+            self.assertEqual(context['notifications'].count(), 10)
+            self.assertEqual(len(context['notifications']), 10)
+            self.assertEqual(context['cart'].id, cart.id)
+
+    def test_guest_header_creates_no_cart(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        with self.assertNumQueries(0):
+            self.assertEqual(str(shop(request)['cart']), 'None')
+
+    def test_production_profile(self):
+        with override_settings(TEMPLATES=[settings.TEMPLATE_PROFILES['production']]):
+            self.assertIsInstance(engines['django'].engine.template_loaders[0], CachedLoader)
+            self.login_with_cart(10)
+            response = self.client.get(reverse('cart'))
+        self.assertContains(response, '<span class="badge bg-danger">10</span>', html=False)
+
+
+class LiveNotificationsTest(ShopTestCase):
+
+    def test_no_unread_query_when_live(self):
+        self.login_with_cart(1)
+        polled = self.count_queries('get', reverse('base'))
+        with override_settings(LIVE_NOTIFICATIONS=True):
+            live = self.count_queries('get', reverse('base'))
+            response = self.client.get(reverse('base'))
+        self.assertLess(live, polled)
+        self.assertContains(response, reverse('notification_stream'))
+
+    def test_restock_published_after_commit(self):
+        customer = self.create_customer('waiting')
+        customer.wishlist.add(self.albums[0])
+        with mock.patch('musicshop.models.publish_notifications') as publish_notifications:
+            with self.captureOnCommitCallbacks(execute=True):
+                notify_restocked([self.albums[0]])
+                publish_notifications.assert_not_called()
+        published, = publish_notifications.call_args.args[0]
+        self.assertEqual(published, Notification.objects.get(recipient=customer))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], NOTIFICATION_POLL_SECONDS=0.05)
+class NotificationStreamTest(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='listener', password='secret-password')
+        self.customer = Customer.objects.create(user=self.user)
+        # Свой брокер на тест: подписчики и отсчёт id не переходят из теста в тест
+        self.broker = DatabaseBroker()
+        patcher = mock.patch('musicshop.notifications._broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def listen(self, on_snapshot):
+        """Тела ответа потока: снимок и первое событие после вызова on_snapshot в отдельном потоке"""
+        self.client.force_login(self.user)
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': reverse('notification_stream'), 'query_string': b'',
+            'headers': [(b'cookie', f'sessionid={self.client.cookies["sessionid"].value}'.encode())],
+        }
+        bodies = []
+
+        async def stream():
+            disconnected = asyncio.Event()
+            requests = iter([{'type': 'http.request', 'body': b''}])
+
+            async def receive():
+                message = next(requests, None)
+                if message:
+                    return message
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] != 'http.response.body' or message['body'].startswith(b':'):
+                    return
+                bodies.append(message['body'].decode())
+                if len(bodies) == 1:
+                    await sync_to_async(on_snapshot, thread_sensitive=False)()
+                else:
+                    disconnected.set()
+
+            await asyncio.wait_for(NotificationStream(keepalive=1)(scope, receive, send), 5)
+
+        asyncio.run(stream())
+        return bodies
+
+    def test_stream(self):
+        Notification.objects.create(recipient=self.customer, text='Старое уведомление')
+        new = [{'id': 0, 'text': 'Новое уведомление'}]
+        bodies = self.listen(lambda: publish(self.customer.id, 'notification', new))
+        self.assertTrue(bodies[0].startswith('event: snapshot\n'))
+        self.assertIn('Старое уведомление', bodies[0])
+        self.assertTrue(bodies[1].startswith('event: notification\n'))
+        self.assertIn('Новое уведомление', bodies[1])
+
+    def test_notification_from_worker(self):
+        genre = Genre.objects.create(name='Rock', slug='rock')
+        artist = Artist.objects.create(name='Metallica', slug='metallica', genre=genre, image='images/metallica.jpg')
+        media_type = MediaType.objects.create(name='CD')
+        album = Album.objects.create(
+            artist=artist, name='Master of Puppets', slug='master-of-puppets', media_type=media_type, song_list='',
+            release_date=date(1986, 3, 3), price=Decimal('100.00'), stock=0, image='images/master.jpg',
+        )
+        self.customer.wishlist.add(album)
+
+        def restock():
+            album.stock = 5
+            album.save()
+            # Задачу выполняет процесс run_jobs: его брокер о подписчиках ASGI-процесса не знает
+            with mock.patch('musicshop.models.publish_notifications'):
+                self.assertEqual(jobs.run_pending(), (1, 0))
+
+        bodies = self.listen(restock)
+        self.assertTrue(bodies[1].startswith('event: notification\n'))
+        self.assertIn('Master of Puppets', bodies[1])
+        self.assertEqual(self.broker.last_id, Notification.objects.get().id)
+
+
+class FilesTest(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        (self.root / 'static_dev').mkdir()
+        (self.root / 'media').mkdir()
+        self.css = b'body { color: black; }\n' * 200
+        (self.root / 'static_dev' / 'app.css').write_bytes(self.css)
+        (self.root / 'static_dev' / 'tiny.js').write_bytes(b'x=1')
+        self.cover = bytes(range(256)) * 4
+        (self.root / 'media' / 'cover.jpg').write_bytes(self.cover)
+        overrides = override_settings(
+            STATIC_ROOT=self.root / 'static', STATICFILES_DIRS=[self.root / 'static_dev'],
+            MEDIA_ROOT=self.root / 'media',
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        hashed_static_names.cache_clear()
+        self.addCleanup(hashed_static_names.cache_clear)
+        self.hashed_css = next(name for name in hashed_static_names() if name.startswith('app.'))
+
+    def get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.addCleanup(response.close)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_collectstatic_compresses_hashed_files(self):
+        static_root = self.root / 'static'
+        self.assertTrue((static_root / f'{self.hashed_css}.gz').exists())
+        self.assertEqual(gzip.decompress((static_root / f'{self.hashed_css}.gz').read_bytes()), self.css)
+        # Сжатие почти не уменьшает крошечный файл, копию не пишем
+        self.assertFalse(any(static_root.glob('tiny.*.js.gz')))
+
+    def test_static_precompressed_immutable(self):
+        response, body = self.get(f'/static/{self.hashed_css}', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(body), self.css)
+        response, body = self.get(f'/static/{self.hashed_css}', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(body, self.css)
+        response, _ = self.get('/static/app.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+
+    def test_media_range(self):
+        response, body = self.get('/media/cover.jpg', HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.cover)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(body, self.cover[100:200])
+        response, body = self.get('/media/cover.jpg', HTTP_RANGE='bytes=-24')
+        self.assertEqual(body, self.cover[-24:])
+        response, _ = self.get('/media/cover.jpg', HTTP_RANGE=f'bytes={len(self.cover)}-')
+        self.assertEqual(response.status_code, 416)
+        # Файл изменился с тех пор, как клиент получил первую часть: отдаём целиком
+        response, body = self.get('/media/cover.jpg', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.cover)
+        self.assertEqual(self.get('/media/cover.jpg', HTTP_IF_NONE_MATCH=response['ETag'])[0].status_code, 304)
+        self.assertEqual(self.get('/media/../static_dev/app.css')[0].status_code, 400)
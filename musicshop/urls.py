@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.auth.views import LogoutView
 from django.urls import path
 
@@ -10,15 +11,27 @@ from .views import (
     LoginView,
     AccountView,
     CartView,
+    CatalogView,
     AddToCartView,
     DeleteFromCartView,
     ChangeQTYView,
     ClearNotificationsView,
+    NotificationStreamView,
+    PersonalView,
     RemoveFromWishListView,
     CheckoutView,
     MakeOrderView,
+    MetricsView,
 )
 
+if settings.ASYNC_CATALOG_VIEWS:
+    from .async_views import (
+        AsyncBaseView as BaseView,
+        AsyncArtistDetailView as ArtistDetailView,
+        AsyncAlbumDetailView as AlbumDetailView,
+        AsyncCartView as CartView,
+    )
+
 urlpatterns = [
     # endpoint for cart
     path('cart/', CartView.as_view(), name='cart'),
@@ -33,9 +46,13 @@ urlpatterns = [
     path('account/', AccountView.as_view(), name='account'),
     path('checkout/', CheckoutView.as_view(), name='checkout'),
     path('clear-notifications/', ClearNotificationsView.as_view(), name='clear_notifications'),
+    path('notifications/stream/', NotificationStreamView.as_view(), name='notification_stream'),
     path('make-order/', MakeOrderView.as_view(), name='make-order'),
     path('add-to-wishlist/<int:album_id>/', AddToWishList.as_view(), name='add_to_wishlist'),
     path('remove-from-wishlist/<int:album_id>/', RemoveFromWishListView.as_view(), name='remove_from_wishlist'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('personal/', PersonalView.as_view(), name='personal'),
+    path('catalog/', CatalogView.as_view(), name='catalog'),
     path('<str:artist_slug>/', ArtistDetailView.as_view(), name='artist_detail'),
     path('<str:artist_slug>/<str:album_slug>/', AlbumDetailView.as_view(), name='album_detail'),
 ]
@@ -1,52 +1,135 @@
+from itertools import islice
+
 from django import views
 from django.db import transaction
 from django.contrib import messages
-from django.contrib.auth import authenticate, login
+from django.contrib.auth import login
 from django.contrib.contenttypes.models import ContentType
-from django.http import HttpResponseRedirect
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
 
+from .catalog import album_data, albums_by_id, get_snapshot, latest_albums, render_metrics as catalog_metrics
+from .context_processors import header_cart
 from .forms import LoginForm, RegistrationForm, OrderForm
-from .mixins import CartMixin, NotificationMixin
-from .models import Artist, Album, Customer, CartProduct, Notification
-from utils import recalc_cart, create_cart
+from .membership import ProductMembership
+from .metrics import registry
+from .mixins import (
+    AlbumValidatorMixin, ArtistValidatorMixin, CartMixin, ConditionalGetMixin, NotificationMixin, RateLimitMixin,
+)
+from .models import Artist, Album, Customer, CartProduct, ImageGallery, Job, Notification, StockMovement
+from .ratelimit import render_metrics as rate_limit_metrics
+from utils import recalc_cart, merge_cart
 
 
-class BaseView(CartMixin, NotificationMixin, views.View):
+class BaseView(CartMixin, views.View):
     """Базовое представление"""
 
+    shared = True
+
     def get(self, request, *args, **kwargs):
-        albums = Album.objects.all().order_by('-id')[:5]
+        albums = latest_albums(5)
         month_bestseller, month_bestseller_qty = Album.objects.get_month_bestseller()
         context = {
             'albums': albums,
             'cart': self.cart,
-
-            'notifications': self.notifications(request.user)
+            'membership': self.membership,
+            'slider': ImageGallery.objects.slider(settings.SLIDER_SIZE),
         }
         if month_bestseller:
             context.update({'month_bestseller': month_bestseller, 'month_bestseller_qty': month_bestseller_qty})
         return render(request, "base.html", context)
 
 
-class ArtistDetailView(CartMixin, NotificationMixin, views.generic.DetailView):
+class ArtistDetailView(CartMixin, ArtistValidatorMixin, ConditionalGetMixin, views.generic.DetailView):
     """Детализированное представление исполнителя"""
 
-    model = Artist
+    shared = True
+    queryset = Artist.objects.detail_page()
     template_name = 'artist/artist_detail.html'
     slug_url_kwarg = 'artist_slug'
     context_object_name = 'artist'
 
+    def get_object(self, queryset=None):
+        artist = super().get_object(queryset)
+        ImageGallery.objects.attach([artist])
+        return artist
 
-class AlbumDetailView(CartMixin, NotificationMixin, views.generic.DetailView):
+
+class AlbumDetailView(CartMixin, AlbumValidatorMixin, ConditionalGetMixin, views.generic.DetailView):
     """Детализированное представление исполнителя"""
 
+    shared = True
     model = Album
     template_name = 'album/album_detail.html'
     slug_url_kwarg = 'album_slug'
     context_object_name = 'album'
 
 
+class PersonalView(views.View):
+    """Личное для общих страниц каталога: меню, счётчик корзины и кнопки альбомов (?albums=1&albums=2&detail=1)"""
+
+    max_albums = 50
+
+    def get(self, request, *args, **kwargs):
+        # Гостю без корзины её не заводим, как и шапка
+        cart = header_cart(request)
+        membership = ProductMembership(cart, request.user)
+        notifications = NotificationMixin.unread(request)
+        if notifications is None:
+            # SSE-поток к общей странице не подключается, отдаём непрочитанные на момент запроса
+            notifications = Notification.objects.all(recipient=request.user.customer)
+        album_ids = [album_id for album_id in request.GET.getlist('albums') if album_id.isdigit()]
+        albums = albums_by_id([int(album_id) for album_id in album_ids[:self.max_albums]])
+        detail = bool(request.GET.get('detail'))
+        response = JsonResponse({
+            'nav': render_to_string('personal/nav.html', {'notifications': notifications}, request),
+            'cart': cart.total_products if cart else 0,
+            'albums': {
+                album.id: render_to_string(
+                    'album/buttons.html', {'album': album, 'membership': membership, 'detail': detail}, request
+                )
+                for album in albums
+            },
+        })
+        patch_cache_control(response, private=True, no_store=True)
+        return response
+
+
+class CatalogView(views.View):
+    """Список альбомов (?genre=rock&media_type=CD&in_stock=1&page=2) и число альбомов по фасетам, JSON"""
+
+    def get(self, request, *args, **kwargs):
+        page = request.GET.get('page', '1')
+        page = max(int(page), 1) if page.isdigit() else 1
+        size = settings.CATALOG_PAGE_SIZE
+        offset = (page - 1) * size
+        genre, media_type = request.GET.get('genre'), request.GET.get('media_type')
+        in_stock = request.GET.get('in_stock') == '1'
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            listing = snapshot.listing(genre=genre, media_type=media_type, in_stock=in_stock)
+            albums = list(islice(listing, offset, offset + size + 1))
+            facets = snapshot.facets()
+        else:
+            albums = Album.objects.select_related('artist', 'media_type').order_by('-id')
+            if genre:
+                albums = albums.filter(artist__genre__slug=genre)
+            if media_type:
+                albums = albums.filter(media_type__name=media_type)
+            if in_stock:
+                albums = albums.filter(stock__gt=0)
+            albums = list(albums[offset:offset + size + 1])
+            facets = Album.objects.facets()
+        return JsonResponse({
+            'albums': [album_data(album) for album in albums[:size]],
+            'next_page': page + 1 if len(albums) > size else None,
+            'facets': facets,
+        })
+
+
 class LoginView(views.View):
     """Представление формы для авторизации"""
 
@@ -60,14 +143,10 @@ class LoginView(views.View):
     def post(self, request, *args, **kwargs):
         form = LoginForm(request.POST or None)
         if form.is_valid():
-            username = form.cleaned_data['username']
-            password = form.cleaned_data['password']
-            user = authenticate(username=username, password=password)
-            if user:
-                login(request, user)
-                if request.session.get('cart_id'):
-                    create_cart(request)
-                return HttpResponseRedirect('/')
+            login(request, form.user)
+            if request.session.get('cart_id'):
+                merge_cart(request)
+            return HttpResponseRedirect('/')
         context = {
             'form': form
         }
@@ -92,7 +171,6 @@ class RegistrationView(views.View):
             new_user.email = form.cleaned_data['email']
             new_user.first_name = form.cleaned_data['first_name']
             new_user.last_name = form.cleaned_data['last_name']
-            new_user.save()
             new_user.set_password(form.cleaned_data['password'])
             new_user.save()
             Customer.objects.create(
@@ -100,10 +178,9 @@ class RegistrationView(views.View):
                 phone=form.cleaned_data['phone'],
                 address=form.cleaned_data['address'],
             )
-            user = authenticate(username=form.cleaned_data['username'], password=form.cleaned_data['password'])
-            login(request, user)
+            login(request, new_user, backend=settings.AUTHENTICATION_BACKENDS[0])
             if request.session.get('cart_id'):
-                create_cart(request)
+                merge_cart(request)
             return HttpResponseRedirect('/')
         context = {
             'form': form
@@ -111,28 +188,33 @@ class RegistrationView(views.View):
         return render(request, 'registration.html', context)
 
 
-class AccountView(CartMixin, NotificationMixin, views.View):
+class AccountView(CartMixin, views.View):
     """Представление аккаунта покупателя"""
 
     def get(self, request, *args, **kwargs):
         customer = Customer.objects.get(user=request.user)
         context = {
             'customer': customer,
-            'cart': self.cart,
-            'notifications': self.notifications(request.user)
+            'orders': customer.order_history(),
+            'wishlist': customer.wishlist.select_related('artist__genre', 'media_type'),
+            'cart': self.cart
         }
         return render(request, 'account.html', context)
 
 
-class CartView(CartMixin, NotificationMixin, views.View):
+class CartView(CartMixin, views.View):
     """Представление корзины"""
     def get(self, request, *args, **kwargs):
-        return render(request, 'cart.html', {"cart": self.cart, 'notifications': self.notifications(request.user)})
+        return render(request, 'cart.html', {
+            "cart": self.cart.prefetch_products()
+        })
 
 
-class AddToCartView(CartMixin, views.View):
+class AddToCartView(RateLimitMixin, CartMixin, views.View):
     """Представление добавления в карзину"""
 
+    rate_limit_group = 'cart'
+
     def get(self, request, *args, **kwargs):
         ct_model, product_slug = kwargs.get('ct_model'), kwargs.get('slug')
         content_type = ContentType.objects.get(model=ct_model)
@@ -157,8 +239,11 @@ class AddToCartView(CartMixin, views.View):
         return HttpResponseRedirect(request.META['HTTP_REFERER'])
 
 
-class DeleteFromCartView(CartMixin, views.View):
+class DeleteFromCartView(RateLimitMixin, CartMixin, views.View):
     """Представление удаления продукта из корзины"""
+
+    rate_limit_group = 'cart'
+
     def get(self, request, *args, **kwargs):
         ct_model, product_slug = kwargs.get('ct_model'), kwargs.get('slug')
         content_type = ContentType.objects.get(model=ct_model)
@@ -185,8 +270,11 @@ class DeleteFromCartView(CartMixin, views.View):
         return HttpResponseRedirect(request.META['HTTP_REFERER'])
 
 
-class ChangeQTYView(CartMixin, views.View):
+class ChangeQTYView(RateLimitMixin, CartMixin, views.View):
     """Изменение колличества продукта в корзине"""
+
+    rate_limit_group = 'cart'
+
     def post(self, request, *args, **kwargs):
         ct_model, product_slug = kwargs.get('ct_model'), kwargs.get('slug')
         content_type = ContentType.objects.get(model=ct_model)
@@ -212,7 +300,9 @@ class ChangeQTYView(CartMixin, views.View):
         return HttpResponseRedirect(request.META['HTTP_REFERER'])
 
 
-class AddToWishList(views.View):
+class AddToWishList(RateLimitMixin, views.View):
+
+    rate_limit_group = 'wishlist'
 
     @staticmethod
     def get(request, *args, **kwargs):
@@ -229,8 +319,24 @@ class ClearNotificationsView(views.View):
         Notification.objects.make_all_read(request.user.customer)
         return HttpResponseRedirect(request.META['HTTP_REFERER'])
 
+    @staticmethod
+    def post(request, *args, **kwargs):
+        Notification.objects.make_all_read(request.user.customer)
+        return HttpResponse(status=204)
+
+
+class NotificationStreamView(views.View):
+    """SSE-поток уведомлений обслуживает ASGI-приложение (application/asgi.py), под WSGI его нет"""
+
+    @staticmethod
+    def get(request, *args, **kwargs):
+        # 204 останавливает переподключения EventSource
+        return HttpResponse(status=204)
+
 
-class RemoveFromWishListView(views.View):
+class RemoveFromWishListView(RateLimitMixin, views.View):
+
+    rate_limit_group = 'wishlist'
 
     @staticmethod
     def get(request, *args, **kwargs):
@@ -240,14 +346,13 @@ class RemoveFromWishListView(views.View):
         return HttpResponseRedirect(request.META['HTTP_REFERER'])
 
 
-class CheckoutView(CartMixin, NotificationMixin, views.View):
+class CheckoutView(CartMixin, views.View):
 
     def get(self, request, *args, **kwargs):
         form = OrderForm(request.POST or None)
         context = {
-            'cart': self.cart,
-            'form': form,
-            'notifications': self.notifications(request.user)
+            'cart': self.cart.prefetch_products(),
+            'form': form
         }
         return render(request, 'checkout.html', context)
 
@@ -263,15 +368,18 @@ class MakeOrderView(CartMixin, views.View):
             more_than_on_stock = []
             out_of_stock_message = ""
             more_than_on_stock_messages = ""
+            self.cart.prefetch_products()
+            # Album.stock обновляется при свёртке журнала, для проверки берём точный остаток
+            stock = StockMovement.objects.current_stock(item.object_id for item in self.cart.products.all())
             for item in self.cart.products.all():
-                if not item.content_object.stock:
+                if not stock[item.object_id]:
                     out_of_stock.append(' - '.join([
                         item.content_object.artist.name, item.content_object.name
                     ]))
-                if item.content_object.stock and item.content_object.stock < item.qty:
+                if stock[item.object_id] and stock[item.object_id] < item.qty:
                     more_than_on_stock.append(
                         {'product': ' - '.join([item.content_object.artist.name, item.content_object.name]),
-                         'stock': item.content_object.stock, 'qty': item.qty}
+                         'stock': stock[item.object_id], 'qty': item.qty}
                     )
             if out_of_stock:
                 out_of_stock_products = ', '.join(out_of_stock)
@@ -299,18 +407,30 @@ class MakeOrderView(CartMixin, views.View):
             new_order.buying_type = form.cleaned_data['buying_type']
             new_order.order_date = form.cleaned_data['order_date']
             new_order.comment = form.cleaned_data['comment']
-            new_order.save() # I think this wrong
-
             self.cart.in_order = True
             self.cart.save()
             new_order.cart = self.cart
             new_order.save()
-            customer.orders.add(new_order)
 
-            for item in self.cart.products.all():
-                item.content_object.stock -= item.qty
-                item.content_object.save()
+            StockMovement.objects.record_sales(new_order, self.cart.products.all())
+            # Остальное не нужно для ответа покупателю: выполнит run_jobs после фиксации заказа
+            Job.objects.enqueue('compact_stock', unique=True)
+            Job.objects.enqueue('alert_managers', order_id=new_order.id)
 
             messages.add_message(request, messages.INFO, 'Спасибо за заказ! Менеджер с Вами свежется в ближайшее время!')
             return HttpResponseRedirect('/')
         return HttpResponseRedirect('/checkout/')
+
+
+class MetricsView(views.View):
+    """Метрики производительности в текстовом формате Prometheus"""
+
+    @staticmethod
+    def get(request, *args, **kwargs):
+        allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', None)
+        if allowed_ips is not None and request.META.get('REMOTE_ADDR') not in allowed_ips:
+            return HttpResponseForbidden()
+        return HttpResponse(
+            registry.render() + catalog_metrics() + rate_limit_metrics(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
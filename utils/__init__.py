@@ -1,3 +1,8 @@
 from .uploading import upload_function
 from .recalc_cart import recalc_cart
-from .create_cart import create_cart
\ No newline at end of file
+from .reprice_carts import reprice_open_carts
+from .merge_cart import merge_cart
+from .chunks import chunked
+from .catalog_import import import_catalog, detect_format, IMPORT_FORMATS
+from .archive_orders import archive_orders
+from .thumbnails import make_thumbnails, thumbnail_name
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+
+def archive_orders(older_than_days=None, batch_size=1000):
+    """Переносим выполненные заказы старше заданного срока вместе с корзинами в архивные таблицы.
+
+    Каждая пачка переносится в своей транзакции, поэтому прерванный перенос можно просто запустить снова.
+    """
+    from musicshop.models import ArchivedCart, ArchivedCartProduct, ArchivedOrder, Cart, Order
+    days = older_than_days if older_than_days is not None else getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 365)
+    eligible = Order.objects.filter(
+        status=Order.STATUS_COMPLETED, order_date__lt=timezone.localdate() - timedelta(days=days)
+    ).order_by('id')
+    archived, last_id = 0, 0
+    while True:
+        with transaction.atomic():
+            orders = list(eligible.filter(id__gt=last_id).select_related('cart')[:batch_size])
+            if not orders:
+                return archived
+            last_id = orders[-1].id
+            carts = [order.cart for order in orders if order.cart]
+            links = Cart.products.through.objects.filter(cart__in=carts).select_related('cartproduct')
+            ArchivedCart.objects.bulk_create([
+                ArchivedCart(id=cart.id, owner_id=cart.owner_id, total_products=cart.total_products,
+                             final_price=cart.final_price)
+                for cart in carts
+            ])
+            ArchivedCartProduct.objects.bulk_create([
+                ArchivedCartProduct(
+                    id=link.cartproduct.id, cart_id=link.cart_id, content_type_id=link.cartproduct.content_type_id,
+                    object_id=link.cartproduct.object_id, qty=link.cartproduct.qty,
+                    final_price=link.cartproduct.final_price,
+                )
+                for link in links
+            ])
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(
+                    id=order.id, customer_id=order.customer_id, first_name=order.first_name,
+                    last_name=order.last_name, phone=order.phone, cart_id=order.cart_id, address=order.address,
+                    status=order.status, buying_type=order.buying_type, comment=order.comment,
+                    created_at=order.created_at, order_date=order.order_date,
+                )
+                for order in orders
+            ])
+            # Корзина удаляет за собой позиции и заказ, заказы без корзины удаляем отдельно
+            Cart.objects.filter(id__in=[cart.id for cart in carts]).delete()
+            Order.objects.filter(id__in=[order.id for order in orders]).delete()
+            archived += len(orders)
@@ -0,0 +1,214 @@
+import csv
+import json
+import os
+from collections import Counter
+from datetime import date
+from decimal import Decimal
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils.text import slugify
+
+from .chunks import chunked
+from .reprice_carts import reprice_open_carts
+from .uploading import upload_function
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+REQUIRED_COLUMNS = ('artist', 'genre', 'media_type', 'name', 'release_date', 'price')
+ALBUM_UPDATE_FIELDS = (
+    'name', 'media_type', 'song_list', 'release_date', 'description', 'stock', 'out_of_stock', 'price', 'image',
+    'updated_at',
+)
+
+
+def detect_format(filename):
+    """Определяем формат файла импорта по расширению"""
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    if extension in ('jsonl', 'ndjson', 'json'):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_rows(stream, fmt):
+    """Построчно читаем записи каталога из CSV или JSON-lines"""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        raise ValueError(f'Неизвестный формат импорта: {fmt}')
+
+
+class CatalogImporter:
+    """Пакетный импорт альбомов вместе с жанрами, медианосителями и исполнителями"""
+
+    def __init__(self, images_dir=None, batch_size=2000):
+        from musicshop.models import Artist, Genre, MediaType
+        self.batch_size = batch_size
+        self.images = self._index_images(images_dir)
+        self.genres = {genre.slug: genre for genre in Genre.objects.all()}
+        self.media_types = {media_type.name: media_type for media_type in MediaType.objects.all()}
+        self.artists = {artist.slug: artist for artist in Artist.objects.all()}
+        self.stats = Counter()
+        self.repriced = set()
+
+    @staticmethod
+    def _index_images(images_dir):
+        if not images_dir:
+            return {}
+        images = {}
+        with os.scandir(images_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    images[entry.name] = entry.path
+                    images.setdefault(os.path.splitext(entry.name)[0], entry.path)
+        return images
+
+    def run(self, rows):
+        for batch_number, batch in enumerate(chunked(rows, self.batch_size)):
+            with transaction.atomic():
+                self._import_batch(batch, batch_number * self.batch_size)
+        # Импорт обходит сигналы модели, поэтому открытые корзины пересчитываем сами
+        self.stats['repriced_lines'] += reprice_open_carts(self.repriced)
+        return self.stats
+
+    def _import_batch(self, rows, offset):
+        from musicshop.models import Album, Artist, CatalogChange, StockMovement, notify_restocked
+        parsed = {}
+        for index, row in enumerate(rows, start=offset + 1):
+            missing = [column for column in REQUIRED_COLUMNS if not row.get(column)]
+            if missing:
+                raise ValueError(f'Запись {index}: не заполнены поля {", ".join(missing)}')
+            parsed[(row.get('artist_slug') or slugify(row['artist']), row.get('slug') or slugify(row['name']))] = row
+        self._resolve_genres(parsed.values())
+        self._resolve_media_types(parsed.values())
+        self._resolve_artists(parsed.values())
+
+        artist_ids = {self.artists[artist_slug].id for artist_slug, _ in parsed}
+        slugs = {slug for _, slug in parsed}
+        existing = {
+            (album.artist_id, album.slug): album
+            for album in Album.objects.filter(artist_id__in=artist_ids, slug__in=slugs)
+        }
+        current_stock = StockMovement.objects.current_stock(album.id for album in existing.values())
+        to_create, to_update, restocked = [], [], []
+        for (artist_slug, slug), row in parsed.items():
+            artist = self.artists[artist_slug]
+            album = existing.get((artist.id, slug))
+            if album is None:
+                album = Album(artist=artist, slug=slug)
+                to_create.append(album)
+            else:
+                album.artist = artist
+                album.stock = current_stock[album.id]
+                album.out_of_stock = not album.stock
+                to_update.append(album)
+            previous_price = album.price
+            self._fill_album(album, row)
+            if album.id and album.price != previous_price:
+                self.repriced.add(album.id)
+            if album.stock and album.out_of_stock:
+                restocked.append(album)
+
+        Album.objects.bulk_create(to_create, batch_size=self.batch_size)
+        self._update_albums(to_update)
+        # Остатки из файла — абсолютные значения, в журнал пишем разницу: рост — поставка, снижение — корректировка
+        self.stats['stock_movements'] += len(StockMovement.objects.set_stock(
+            {album.id: album.stock for album in to_create + to_update}, StockMovement.KIND_RESTOCK, 'Импорт каталога'
+        ))
+        # Счётчики альбомов исполнителя и журнал каталога сигналы здесь не ведут
+        Artist.objects.recount(artist_ids)
+        CatalogChange.objects.record(Album, [album.id for album in to_create + to_update])
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+        self.stats['notifications'] += notify_restocked(restocked)
+
+    @staticmethod
+    def _update_albums(albums):
+        """Обновляем альбомы одним подготовленным UPDATE вместо CASE WHEN из bulk_update"""
+        if not albums:
+            return
+        meta = albums[0]._meta
+        fields = [meta.get_field(name) for name in ALBUM_UPDATE_FIELDS]
+        assignments = ', '.join(f'{connection.ops.quote_name(field.column)} = %s' for field in fields)
+        query = 'UPDATE {table} SET {assignments} WHERE {pk} = %s'.format(
+            table=connection.ops.quote_name(meta.db_table),
+            assignments=assignments,
+            pk=connection.ops.quote_name(meta.pk.column),
+        )
+        params = [
+            # pre_save, как и save(): auto_now проставит updated_at
+            [field.get_db_prep_save(field.pre_save(album, False), connection) for field in fields] + [album.id]
+            for album in albums
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(query, params)
+
+    def _fill_album(self, album, row):
+        album.name = row['name']
+        album.media_type = self.media_types[row['media_type']]
+        album.release_date = date.fromisoformat(str(row['release_date']))
+        album.price = Decimal(str(row['price']))
+        if row.get('stock') not in (None, ''):
+            album.stock = int(row['stock'])
+        if row.get('description'):
+            album.description = row['description']
+        if row.get('song_list') is not None:
+            album.song_list = row['song_list']
+        image_path = self.images.get(row.get('image') or album.slug)
+        if image_path:
+            album.image = self._store_image(album, image_path)
+
+    def _store_image(self, album, image_path):
+        name = upload_function(album, os.path.basename(image_path))
+        if not default_storage.exists(name):
+            with open(image_path, 'rb') as image:
+                name = default_storage.save(name, File(image))
+            self.stats['images'] += 1
+        return name
+
+    def _resolve_genres(self, rows):
+        from musicshop.models import Genre
+        new_genres = {}
+        for row in rows:
+            slug = row.get('genre_slug') or slugify(row['genre'])
+            row['genre_slug'] = slug
+            if slug not in self.genres and slug not in new_genres:
+                new_genres[slug] = Genre(name=row['genre'], slug=slug)
+        Genre.objects.bulk_create(new_genres.values())
+        self.genres.update(new_genres)
+        self.stats['genres'] += len(new_genres)
+
+    def _resolve_media_types(self, rows):
+        from musicshop.models import CatalogChange, MediaType
+        new_media_types = {}
+        for row in rows:
+            name = row['media_type']
+            if name not in self.media_types and name not in new_media_types:
+                new_media_types[name] = MediaType(name=name)
+        MediaType.objects.bulk_create(new_media_types.values())
+        CatalogChange.objects.record(MediaType, [media_type.id for media_type in new_media_types.values()])
+        self.media_types.update(new_media_types)
+        self.stats['media_types'] += len(new_media_types)
+
+    def _resolve_artists(self, rows):
+        from musicshop.models import Artist, Genre
+        new_artists = {}
+        for row in rows:
+            slug = row.get('artist_slug') or slugify(row['artist'])
+            if slug not in self.artists and slug not in new_artists:
+                new_artists[slug] = Artist(name=row['artist'], slug=slug, genre=self.genres[row['genre_slug']])
+        Artist.objects.bulk_create(new_artists.values())
+        if new_artists:
+            Genre.objects.recount({artist.genre_id for artist in new_artists.values()})
+        self.artists.update(new_artists)
+        self.stats['artists'] += len(new_artists)
+
+
+def import_catalog(stream, fmt='csv', images_dir=None, batch_size=2000):
+    """Импортируем каталог из потока, возвращаем счётчики созданных и обновлённых записей"""
+    return CatalogImporter(images_dir=images_dir, batch_size=batch_size).run(read_rows(stream, fmt))
@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Subquery, Sum
+
+from .recalc_cart import recalc_cart
+
+
+def merge_cart(request):
+    """Объединяем анонимную корзину с открытой корзиной авторизовавшегося покупателя.
+
+    Число запросов не зависит от числа позиций: совпадающие товары складываются одним UPDATE,
+    остальные позиции переносятся одним UPDATE, анонимная корзина удаляется.
+    """
+    from musicshop.models import Cart, CartProduct, Customer
+    anonymous_cart_id = request.session.pop('cart_id')
+    customer = Customer.objects.filter(user=request.user).first()
+    if customer is None:
+        return None
+    with transaction.atomic():
+        anonymous_cart = Cart.objects.filter(id=anonymous_cart_id, owner__isnull=True, in_order=False).first()
+        customer_cart = Cart.objects.filter(owner=customer, in_order=False).first()
+        if anonymous_cart is None:
+            return customer_cart
+        incoming = CartProduct.objects.filter(related_cart=anonymous_cart)
+        if customer_cart is None:
+            incoming.update(user=customer, session_key=None)
+            anonymous_cart.owner = customer
+            anonymous_cart.session_key = None
+            anonymous_cart.save(update_fields=['owner', 'session_key'])
+            return anonymous_cart
+        existing = CartProduct.objects.filter(related_cart=customer_cart)
+        same_product = {'content_type': OuterRef('content_type'), 'object_id': OuterRef('object_id')}
+        duplicates = incoming.filter(**same_product).order_by().values('content_type', 'object_id')
+        existing.filter(Exists(duplicates)).update(
+            qty=F('qty') + Subquery(duplicates.annotate(total=Sum('qty')).values('total')),
+            final_price=F('final_price') + Subquery(duplicates.annotate(total=Sum('final_price')).values('total')),
+        )
+        moved = incoming.exclude(Exists(existing.filter(**same_product)))
+        Cart.products.through.objects.filter(cart=anonymous_cart, cartproduct__in=moved).update(cart=customer_cart)
+        CartProduct.objects.filter(cart=anonymous_cart, related_cart=customer_cart).update(
+            cart=customer_cart, user=customer, session_key=None
+        )
+        # Оставшиеся позиции анонимной корзины — дубли, уже учтённые в корзине покупателя
+        anonymous_cart.delete()
+        recalc_cart(customer_cart)
+        return customer_cart
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+
+
+def reprice_open_carts(album_ids, chunk_size=None):
+    """Пересчитываем по новой цене позиции открытых корзин и их итоги.
+
+    Позиции обходим порциями по первичному ключу, каждая порция — два UPDATE в своей транзакции,
+    чтобы изменение цены бестселлера не держало блокировку на всех корзинах сразу.
+    """
+    from musicshop.models import Album, Cart, CartProduct
+    chunk_size = chunk_size or getattr(settings, 'CART_REPRICE_CHUNK_SIZE', 500)
+    lines = CartProduct.objects.filter(
+        content_type__app_label=Album._meta.app_label,
+        content_type__model=Album._meta.model_name,
+        object_id__in=list(album_ids),
+        cart__in_order=False,
+    ).order_by('id')
+    price = models.Subquery(Album.objects.filter(id=models.OuterRef('object_id')).values('price')[:1])
+    cart_total = models.Subquery(
+        CartProduct.objects.filter(related_cart=models.OuterRef('id'))
+        .order_by().values('related_cart').annotate(total=models.Sum('final_price')).values('total')
+    )
+    repriced, last_id = 0, 0
+    while True:
+        chunk = list(lines.filter(id__gt=last_id).values_list('id', 'cart_id')[:chunk_size])
+        if not chunk:
+            return repriced
+        last_id = chunk[-1][0]
+        with transaction.atomic():
+            repriced += CartProduct.objects.filter(id__in=[line_id for line_id, _ in chunk]).update(
+                final_price=models.ExpressionWrapper(models.F('qty') * price, output_field=models.DecimalField())
+            )
+            Cart.objects.filter(id__in={cart_id for _, cart_id in chunk}).update(
+                final_price=Coalesce(cart_total, models.Value(0), output_field=models.DecimalField())
+            )
@@ -0,0 +1,32 @@
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image
+
+
+def thumbnail_name(name, width):
+    """Путь уменьшенной копии рядом с оригиналом в том же хранилище"""
+    return f'thumbnails/{width}/{name}'
+
+
+def make_thumbnails(image, widths=None):
+    """Копии изображения по ширинам THUMBNAIL_WIDTHS, меньшим оригинала; возвращаем размер оригинала"""
+    with image.open('rb'):
+        original = Image.open(image)
+        original.load()
+    image_format = original.format
+    if image_format == 'JPEG' and original.mode not in ('RGB', 'L'):
+        original = original.convert('RGB')
+    for width in widths or settings.THUMBNAIL_WIDTHS:
+        if width >= original.width:
+            continue
+        thumbnail = original.resize((width, round(original.height * width / original.width)), Image.LANCZOS)
+        buffer = BytesIO()
+        options = {'quality': 85, 'optimize': True} if image_format == 'JPEG' else {}
+        thumbnail.save(buffer, format=image_format, **options)
+        name = thumbnail_name(image.name, width)
+        # Хранилище не перезаписывает файлы, а добавляет суффикс — старую копию удаляем сами
+        image.storage.delete(name)
+        image.storage.save(name, ContentFile(buffer.getvalue()))
+    return original.size